@@ -1,10 +1,13 @@
 import click
+import numpy as np
 
 import python.utils.functional as f
+from python.embeddings import index_benchmark
 from python.importer import Importer
 from python.query_runner.snowflake import get_query_results, get_snowflake_cursor
 from python.questions import question_with_data_source_to_sql
 from python.utils.db import application_database_connection
+from python.utils.progress import Progress, report_periodically
 from python.utils.sql import normalize_fqn_quoting
 
 
@@ -136,8 +139,42 @@ def analysis(data_source_id: int, warehouse_name: str, database_name: str, schem
 @click.option("--table-limit", type=int)
 @click.option("--column-limit", type=int)
 @click.option("--column-value-limit", type=int)
-def import_datasource(**kwargs):
-    Importer(**kwargs)
+@click.option("--incremental", is_flag=True, default=False, help="Update the existing indexes instead of rebuilding")
+@click.option("--table", "table_names", multiple=True, help="Only import these tables, can be repeated")
+@click.option("--approximate-counts", is_flag=True, default=False, help="Use APPROX_COUNT_DISTINCT for column stats")
+@click.option("--progress-interval", type=float, default=30, help="Seconds between progress reports")
+@click.option("--resume", is_flag=True, default=False, help="Pick up from the checkpoint of an import that died")
+def import_datasource(table_names, progress_interval, **kwargs):
+    # a full import rebuilds every index from the imported tables, which would drop all of the other tables
+    if table_names and not kwargs["incremental"]:
+        raise click.UsageError("--table can only be used with --incremental")
+
+    import_progress = Progress()
+
+    # tables/columns/values processed, queries, cache hits, tokens, plus an ETA, written to stderr
+    with report_periodically(
+        import_progress, lambda p: click.echo(p.summary_line("tables"), err=True), progress_interval
+    ):
+        Importer(table_names=list(table_names) or None, import_progress=import_progress, **kwargs)
+
+
+@cli.command(help="compare recall, latency and size of faiss index types, offline")
+@click.option("--embeddings", type=click.Path(exists=True), help="saved .npy embedding matrix, synthetic if omitted")
+@click.option("--rows", type=int, default=100_000, help="number of synthetic embeddings")
+@click.option("--dimensions", type=int, default=1536, help="dimensions of the synthetic embeddings")
+@click.option("--queries", type=int, default=1000)
+@click.option("--k", type=int, default=10)
+@click.option("--output", type=click.Path(), default="tmp/index_benchmark.json")
+def benchmark_indexes(embeddings, rows, dimensions, queries, k, output):
+    if embeddings:
+        data = np.load(embeddings, mmap_mode="r")
+    else:
+        data = index_benchmark.synthetic_embeddings(rows, dimensions)
+
+    report = index_benchmark.benchmark_indexes(data, index_benchmark.query_set(data, queries), k=k)
+    index_benchmark.write_report(report, output)
+
+    click.echo(markdown_table_output(report["results"]))
 
 
 @cli.command(help="convert a natural language question to sql")
@@ -0,0 +1,2 @@
+-- CreateIndex
+CREATE INDEX "EmbeddingCache_contentHash_idx" ON "EmbeddingCache"("contentHash");
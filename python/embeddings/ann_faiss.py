@@ -1,82 +1,223 @@
 # Wrapper around Faiss library for building and querying ANN indexes
+import json
+import os
 import time
 from typing import Tuple
 
 import faiss
 import numpy as np
 
+from python.embeddings.index_policy import (
+    QUESTION_FAMILY,
+    index_policy,
+    supports_removal,
+)
+from python.utils.files import atomic_write
 from python.utils.logging import log
 
+# vectors are normalized and added to the index this many rows at a time, so building from a memory mapped matrix
+# never copies the whole matrix onto the heap
+ADD_CHUNK_SIZE = 16384
+# rows sampled to train index types that need training (e.g. IVF), see MAX_IVF_LISTS
+TRAINING_SAMPLE_SIZE = 100_000
+
 
 class AnnFaiss:
     index: faiss.Index
 
-    def build_and_save(self, data, output_path, dimensions=1536):
+    def build_and_save(self, data, output_path, family=QUESTION_FAMILY, ids: np.ndarray | None = None):
+        """
+        Build the index from `data`, which can be a memory mapped matrix: it is read in chunks and never modified
+        """
+
         t1 = time.time()
 
-        log.debug(f"Build Faiss: {data.shape} - {data.dtype}")
-        # index_type = 'OPQ64_256,Residual2x14,PQ64'
-        # index_type = "IVF10,PQ256x8"
-        # index_type = 'PQ256x8'
-        # index_type = 'PQ256x10'
-        index_type = "IVF50,PQ256x8"  # 28Mb, good
-        # index_type = "OPQ16,PQ256x8" # 28Mb, good
-        # index_type = 'PCAR640,SQ8' # pretty good, 75mb
-        # index_type = 'SQ8'
-        # index_type = 'Flat' # brute force (exaustive nearest neighbor search)
-
-        # self.index = faiss.index_factory(
-        #     1280, index_type, faiss.METRIC_INNER_PRODUCT)
-        # self.index = faiss.index_factory(
-        #     dimensions, "IVF10,PQ16x8", faiss.METRIC_INNER_PRODUCT)
-
-        rows = data.shape[0]
-        if dimensions < 10000:
-            # self.index = faiss.index_factory(min(1000, rows), "HNSW", faiss.METRIC_INNER_PRODUCT)
-            # self.index = faiss.IndexHNSWFlat(dimensions, faiss.METRIC_INNER_PRODUCT)
-            # self.index = faiss.IndexFlatIP(dimensions)
-            self.index = faiss.IndexFlatL2(dimensions)
-            self.index.metric_type = faiss.METRIC_INNER_PRODUCT
-        elif True:
-            self.index = faiss.index_factory(dimensions, "HNSW", faiss.METRIC_INNER_PRODUCT)
-        else:
-            quantizer = faiss.IndexFlatL2(dimensions)
-            self.index = faiss.IndexIVFFlat(quantizer, dimensions, min(1000, rows), faiss.METRIC_INNER_PRODUCT)
-            self.index.nprobe = 10
-
-        # nlist = 20
-        # m = 8
-        # quantizer = faiss.IndexFlatL2(1280)  # this remains the same
-        # self.index = faiss.IndexIVFPQ(quantizer, 1280, nlist, m, 8)
-        faiss.normalize_L2(data)
+        rows, dimensions = data.shape
+        policy = index_policy(family, rows)
+
+        log.debug(f"Build Faiss: {data.shape} - {data.dtype}", index_type=policy.factory, family=family)
+
+        # Each vector is stored under an explicit id (its offset in the link index) so vectors can be removed or
+        # appended later on without rebuilding the whole index, see `update_and_save`
+        self.index = with_ids(faiss.index_factory(dimensions, policy.factory, faiss.METRIC_INNER_PRODUCT))
+
+        if ids is None:
+            ids = np.arange(rows, dtype=np.int64)
 
         log.debug("Training...")
 
         # Some index types don't require training
         if not self.index.is_trained:
-            self.index.train(data)  # type: ignore - the type signature doesn't match how you actually use this
+            self.index.train(training_sample(data))  # type: ignore - the type signature doesn't match how you use this
         log.debug("Building index...")
-        self.index.add(data)  # type: ignore - same as above
-
-        faiss.write_index(self.index, output_path + ".faiss")
+        self.add_in_chunks(data, ids)
+
+        self.write(output_path)
+        self.write_metadata(
+            output_path,
+            {
+                "family": family,
+                "index_type": policy.factory,
+                "rows": rows,
+                "search_parameters": policy.search_parameters,
+            },
+        )
 
         t2 = time.time()
         log.debug("Built Faiss", sec=(t2 - t1))
 
-    def load(self, faiss_path, nprobe=15):
+    def update_and_save(
+        self, path, data, ids: np.ndarray, remove_ids: np.ndarray, renumbered_ids: np.ndarray | None = None
+    ):
+        """
+        Update an index already saved to disk: remove the vectors for `remove_ids`, move the remaining vectors to the
+        ids in `renumbered_ids` (the new id of every id already in the index) and append `data` under `ids`
+        """
+
+        t1 = time.time()
+
+        self.index = faiss.read_index(path + ".faiss")
+
+        wrapped = isinstance(self.index, faiss.IndexIDMap)
+        if not wrapped and not is_ivf(self.index):
+            raise RuntimeError(f"{path} was built without ids and can't be updated incrementally, run a full import")
+
+        metadata = self.load_metadata(path)
+        index_type = metadata.get("index_type", "Flat")
+        if len(remove_ids) > 0 and not supports_removal(index_type):
+            raise RuntimeError(f"{path} is a {index_type} index which can't remove vectors, run a full import")
+
+        # IVF indexes built before they stored their own ids, removing vectors would corrupt them (see `with_ids`)
+        if len(remove_ids) > 0 and wrapped and is_ivf(self.index):
+            raise RuntimeError(f"{path} is an IVF index in an id map which can't remove vectors, run a full import")
+
+        if len(remove_ids) > 0:
+            removed = self.index.remove_ids(np.asarray(remove_ids, dtype=np.int64))
+            log.debug("Removed vectors", removed=removed, requested=len(remove_ids))
+
+        if renumbered_ids is not None:
+            renumber_ids(self.index, np.asarray(renumbered_ids, dtype=np.int64))
+
+        self.add_in_chunks(data, np.asarray(ids, dtype=np.int64))
+
+        self.write(path)
+        # the index type stays the same until the next full import, even if the index grows past its tier
+        if metadata:
+            self.write_metadata(path, {**metadata, "rows": self.index.ntotal})
+
+        t2 = time.time()
+        log.debug("Updated Faiss", sec=(t2 - t1), added=len(data), removed=len(remove_ids))
+
+    def add_in_chunks(self, data, ids: np.ndarray):
+        for start in range(0, len(data), ADD_CHUNK_SIZE):
+            chunk = normalized_copy(data[start : start + ADD_CHUNK_SIZE])
+            self.index.add_with_ids(chunk, ids[start : start + ADD_CHUNK_SIZE])  # type: ignore
+
+    def write(self, path):
+        # write to a temporary file and swap it in so a process loading the index never reads a partial file
+        with atomic_write(path + ".faiss") as faiss_path:
+            faiss.write_index(self.index, faiss_path)
+
+    def write_metadata(self, path, metadata: dict):
+        # the index type and search parameters live next to the index, so `load` can restore them
+        with atomic_write(path + ".faiss.json") as metadata_path, open(metadata_path, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+
+    def load_metadata(self, path) -> dict:
+        # indexes built before the metadata was written are all Flat
+        if not os.path.exists(path + ".faiss.json"):
+            return {}
+
+        with open(path + ".faiss.json", encoding="utf-8") as file:
+            return json.load(file)
+
+    def load(self, faiss_path):
         self.index = faiss.read_index(faiss_path + ".faiss")
 
-        # Set how many lists to look for NN in
-        self.index.nprobe = nprobe
-        # index_ivf = faiss.extract_index_ivf(self.index)
-        # index_ivf.nprobe = 6
+        # e.g. how many lists an IVF index looks for neighbours in (nprobe), or the HNSW search depth (efSearch)
+        parameter_space = faiss.ParameterSpace()
+        for name, value in self.load_metadata(faiss_path).get("search_parameters", {}).items():
+            parameter_space.set_index_parameter(self.index, name, value)
 
-        # ParameterSpace().set_index_parameter(self.index, "nprobe", 6)
+    def query(self, query, number_of_matches, normalized=False) -> Tuple[np.ndarray, np.ndarray]:
+        # when searching multiple indexes with the same query, the caller can normalize once up front
+        if not normalized:
+            query = normalize_query(query)
 
-    def query(self, query, number_of_matches) -> Tuple[np.ndarray, np.ndarray]:
-        query = np.expand_dims(query, axis=0)
-        # if query.shape[0] > 1:
-        faiss.normalize_L2(query)
         scores, indexes = self.index.search(query, number_of_matches)  # type: ignore
 
         return scores, indexes[0]
+
+
+def with_ids(index: faiss.Index) -> faiss.Index:
+    """
+    An index which vectors are added to and removed from by id
+    """
+
+    # IVF indexes keep the ids in their inverted lists. They can't go in an IndexIDMap: its `remove_ids` compacts the
+    # id map, assuming the wrapped index shifts the remaining vectors down, but IVF removes them in place, so every
+    # vector after the first removed one ends up with the wrong id (or none at all).
+    if is_ivf(index):
+        return index
+
+    return faiss.IndexIDMap(index)
+
+
+def is_ivf(index: faiss.Index) -> bool:
+    try:
+        faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+
+    return True
+
+
+def renumber_ids(index: faiss.Index, new_ids: np.ndarray):
+    """
+    Replace every id in the index by `new_ids[id]`, in place
+    """
+
+    if isinstance(index, faiss.IndexIDMap):
+        faiss.copy_array_to_vector(new_ids[faiss.vector_to_array(index.id_map)], index.id_map)
+        return
+
+    ivf = faiss.extract_index_ivf(index)
+    if ivf.direct_map.type != faiss.DirectMap.NoMap:
+        raise RuntimeError("can't renumber the ids of an IVF index with a direct map")
+
+    # the ids of each inverted list are stored in memory, and are updated through a view on them
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        list_size = invlists.list_size(list_no)
+        if not list_size:
+            continue
+
+        ids_pointer = invlists.get_ids(list_no)
+        list_ids = faiss.rev_swig_ptr(ids_pointer, list_size)
+        list_ids[:] = new_ids[list_ids]
+        invlists.release_ids(list_no, ids_pointer)
+
+
+def normalize_query(query) -> np.ndarray:
+    # faiss normalizes in place, copy so we don't mutate the (possibly cached) embedding passed in
+    query = np.array(query, dtype=np.float32).reshape(1, -1)
+    faiss.normalize_L2(query)
+
+    return query
+
+
+def normalized_copy(data) -> np.ndarray:
+    data = np.array(data, dtype=np.float32)
+    faiss.normalize_L2(data)
+
+    return data
+
+
+def training_sample(data) -> np.ndarray:
+    rows = len(data)
+    if rows <= TRAINING_SAMPLE_SIZE:
+        return normalized_copy(data)
+
+    # sorted so reading a memory mapped matrix stays (mostly) sequential
+    sample = np.sort(np.random.default_rng(0).choice(rows, TRAINING_SAMPLE_SIZE, replace=False))
+    return normalized_copy(data[sample])
@@ -1,30 +1,115 @@
+import itertools
+import json
 import os
-from threading import Lock
-from typing import Union
+from contextlib import contextmanager
+from threading import Condition, Lock
+from typing import NamedTuple, Union
 
 import numpy as np
 
 from python.embeddings.ann_faiss import AnnFaiss
-from python.embeddings.embedding import generate_embedding
+from python.embeddings.embedding import generate_embeddings
 from python.embeddings.embedding_link_index import EmbeddingLinkIndex
+from python.embeddings.embedding_matrix import EmbeddingMatrix
+from python.embeddings.index_policy import QUESTION_FAMILY
 from python.embeddings.openai_embedder import OpenAIEmbedder
 from python.utils.db import application_database_connection
+from python.utils.files import atomic_write
 from python.utils.logging import log
 
 from prisma import Prisma
 
 db: Prisma = application_database_connection()
 
+# an index is flushed on its own once this many embeddings are waiting, to keep memory bounded on huge tables
+MAX_PENDING_EMBEDDINGS = 2048
+
+# checkpointed embeddings are copied over to a new matrix in chunks of this many rows when an import is resumed
+RESTORE_CHUNK_SIZE = 16384
+
+
+class FlushBarrier:
+    """
+    Keeps track of the flushes in flight. `quiesced` waits for all of them to complete and holds off new ones, so a
+    checkpoint never sees embeddings which were taken off the pending list but not added to their index yet.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.in_flight = 0
+        # set while waiting for the flushes in flight, so a steady stream of new ones can't starve the checkpoint
+        self.draining = False
+
+    @contextmanager
+    def flushing(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.draining)
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def quiesced(self):
+        with self.condition:
+            self.draining = True
+
+            try:
+                self.condition.wait_for(lambda: self.in_flight == 0)
+                yield
+            finally:
+                self.draining = False
+                self.condition.notify_all()
+
+
+FLUSH_BARRIER = FlushBarrier()
+
+
+class PendingEmbedding(NamedTuple):
+    content: str
+    table_id: int | None
+    column_id: int | None
+    value: str | None
+
+
 # ann = approximate nearest neighbor
 class AnnIndex:
-    def __init__(self, path: str):
+    def __init__(self, path: str, family=QUESTION_FAMILY, incremental=False):
         self.index_offset = 0
-        self.embeddings = []
+        self.pending: list[PendingEmbedding] = []
         self.lock = Lock()
 
         self.path = path
+        # decides which faiss index type is built, see python/embeddings/index_policy.py
+        self.family = family
         self.embedding_link_index = EmbeddingLinkIndex(path)
 
+        # The embeddings and links added so far are checkpointed to disk during an import, so it can be resumed if it
+        # dies part way through. Resuming copies what is kept over to the next generation of files, the files of the
+        # current generation are only ever appended to.
+        self.checkpoint_path = path + ".checkpoint.json"
+        self.checkpoint_generation = 0
+        self.checkpointed_rows = 0
+
+        # embeddings are spilled to disk as they come in rather than kept in memory until the index is saved
+        self.embeddings = EmbeddingMatrix(self._embeddings_path(self.checkpoint_generation))
+
+        # In incremental mode the index already on disk is updated in place: vectors and links for removed tables are
+        # dropped and new vectors are appended after the existing ones, instead of rebuilding the index from scratch.
+        self.incremental = incremental and os.path.exists(path + ".faiss")
+        self.removed_indexes: list[int] = []
+
+        if self.incremental:
+            self.embedding_link_index.load_rows()
+            self.index_offset = len(self.embedding_link_index.rows)
+
+        # offset of the first vector added by this process
+        self.first_new_index = self.index_offset
+
     def add(
         self,
         content: str,
@@ -32,27 +117,162 @@ class AnnIndex:
         column_id: Union[int, None],
         value: Union[str, None],
     ):
-        log.debug("generating embedding for ", content=content, table=table_id, column=column_id, value=value)
-        embedding = generate_embedding(content, embedder=OpenAIEmbedder)
+        """
+        Queue the content to be embedded, embeddings are generated in batches when the index is flushed
+        """
+
+        log.debug("queueing embedding for ", content=content, table=table_id, column=column_id, value=value)
 
+        with self.lock:
+            self.pending.append(PendingEmbedding(content, table_id, column_id, value))
+            should_flush = len(self.pending) >= MAX_PENDING_EMBEDDINGS
+
+        if should_flush:
+            self.flush()
+
+    def take_pending(self) -> list[PendingEmbedding]:
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        return pending
+
+    def add_embeddings(self, pending: list[PendingEmbedding], embeddings: list[np.ndarray]):
         # Needs the mutex to prevent parallel columns from adding to it at the
         # same time. The index_offset is important for the vector indexing.
-        self.lock.acquire()
+        if not pending:
+            return
+
+        with self.lock:
+            for pending_embedding in pending:
+                self.embedding_link_index.add(
+                    self.index_offset, pending_embedding.table_id, pending_embedding.column_id, pending_embedding.value
+                )
+                self.index_offset += 1
+            self.embeddings.append(np.stack(embeddings, axis=0))
+
+    def flush(self):
+        flush_indexes([self])
+
+    def remove_table(self, table_id: int):
+        """
+        Drop everything previously indexed for the table, used before re-indexing a table in incremental mode
+        """
+
+        with self.lock:
+            # a table can be removed twice when a resumed import re-indexes a table it didn't finish
+            already_removed = set(self.removed_indexes)
+            self.removed_indexes += [
+                index
+                for index in self.embedding_link_index.indexes_for_table(table_id)
+                if index < self.first_new_index and index not in already_removed
+            ]
+
+    def checkpoint(self):
+        """
+        Persist the embeddings and links added so far, along with the removed indexes. Only what was added since the
+        last checkpoint is written. Must not run while embeddings are being added, see `FLUSH_BARRIER`.
+        """
+
+        with self.lock:
+            new_rows = self.embedding_link_index.rows[self.first_new_index + self.checkpointed_rows :]
+
+            self.embeddings.flush()
+
+            # the links file of a generation is started over on its first checkpoint, anything in it is a leftover
+            mode = "a" if self.checkpointed_rows else "w"
+            with open(self._links_path(self.checkpoint_generation), mode, encoding="utf-8") as f:
+                f.writelines(json.dumps(row[1:]) + "\n" for row in new_rows)
+
+            self.checkpointed_rows += len(new_rows)
+
+            # the state is written last, everything it points to is on disk by now
+            with atomic_write(self.checkpoint_path) as state_path:
+                with open(state_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "generation": self.checkpoint_generation,
+                            "rows": self.checkpointed_rows,
+                            "dimensions": self.embeddings.dimensions,
+                            "removed_indexes": self.removed_indexes,
+                        },
+                        f,
+                    )
+
+    def restore_checkpoint(self, table_ids: set[int]):
+        """
+        Pick up the embeddings and links of the given (completely indexed) tables from the last checkpoint, anything
+        added for other tables is dropped and they'll be indexed again
+        """
+
+        if not os.path.exists(self.checkpoint_path):
+            return
+
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            state = json.load(f)
 
-        previous_offset = self.index_offset
-        self.embedding_link_index.add(previous_offset, table_id, column_id, value)
-        self.embeddings.append(embedding)
-        self.index_offset += 1
+        generation = state["generation"]
 
-        self.lock.release()
+        # lines past `rows` were written by a checkpoint which didn't complete
+        with open(self._links_path(generation), encoding="utf-8") as f:
+            links = [json.loads(line) for line in itertools.islice(f, state["rows"])]
+
+        previous_embeddings = EmbeddingMatrix(self._embeddings_path(generation))
+        if state["rows"]:
+            previous_embeddings.open_existing(state["rows"], state["dimensions"])
+
+        kept = [position for position, link in enumerate(links) if link[0] in table_ids]
+
+        log.info("restoring index checkpoint", path=self.path, rows=len(kept), dropped=len(links) - len(kept))
+
+        self.checkpoint_generation = generation + 1
+        self.checkpointed_rows = 0
+        self.embeddings = EmbeddingMatrix(self._embeddings_path(self.checkpoint_generation))
+
+        for start in range(0, len(kept), RESTORE_CHUNK_SIZE):
+            self.embeddings.append(previous_embeddings.view()[kept[start : start + RESTORE_CHUNK_SIZE]])
+
+        for position in kept:
+            table_id, column_id, value = links[position]
+            self.embedding_link_index.add(self.index_offset, table_id, column_id, value)
+            self.index_offset += 1
+
+        self.removed_indexes = state["removed_indexes"]
+
+        # switch the checkpoint over to the new generation before the previous one is deleted
+        self.checkpoint()
+
+        previous_embeddings.delete()
+        os.remove(self._links_path(generation))
+
+    def discard_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            generation = json.load(f)["generation"]
+
+        for checkpoint_file in [self._embeddings_path(generation), self._links_path(generation), self.checkpoint_path]:
+            if os.path.exists(checkpoint_file):
+                os.remove(checkpoint_file)
+
+    def _embeddings_path(self, generation: int) -> str:
+        return f"{self.path}.embeddings.{generation}.f32"
+
+    def _links_path(self, generation: int) -> str:
+        return f"{self.path}.links.{generation}.jsonl"
 
     def save(self):
+        self.flush()
+
+        if self.incremental:
+            self.save_incremental()
+            return
+
         embed_size = len(self.embeddings)
         if embed_size == 0:
             return
 
-        # TODO what is this doing?
-        data = np.stack(self.embeddings, axis=0)
+        data = self.embeddings.view()
 
         # Make output folder if it doesn't exist
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
@@ -66,4 +286,65 @@ class AnnIndex:
             embed_size=embed_size,
             path=self.path,
         )
-        AnnFaiss().build_and_save(data, self.path)
+        AnnFaiss().build_and_save(data, self.path, family=self.family)
+        self.embeddings.delete()
+
+    def save_incremental(self):
+        if len(self.embeddings) == 0 and not self.removed_indexes:
+            return
+
+        data = self.embeddings.view()
+
+        log.info(
+            "update faiss index",
+            added=len(self.embeddings),
+            removed=len(self.removed_indexes),
+            path=self.path,
+        )
+
+        removed_indexes = np.array(self.removed_indexes, dtype=np.int64)
+
+        if not self.removed_indexes:
+            # appending only, writing the link index first keeps it a superset of the faiss index on disk
+            self.embedding_link_index.save()
+            AnnFaiss().update_and_save(
+                self.path, data, np.arange(self.first_new_index, self.index_offset, dtype=np.int64), removed_indexes
+            )
+            self.embeddings.delete()
+            return
+
+        # The links of removed tables are dropped, otherwise every re-import of a table would grow the link index.
+        # Everything after them moves down, in the faiss index as well, since the ids are offsets in the link index.
+        new_indexes = self.embedding_link_index.remove(set(self.removed_indexes))
+
+        # the faiss index goes first: until the link index is written, a search can come back with a wrong link, but
+        # never with an id past the end of the link index
+        AnnFaiss().update_and_save(
+            self.path,
+            data,
+            new_indexes[self.first_new_index : self.index_offset],
+            removed_indexes,
+            renumbered_ids=new_indexes[: self.first_new_index],
+        )
+        self.embedding_link_index.save()
+        self.embeddings.delete()
+
+
+def flush_indexes(indexes: list[AnnIndex]):
+    """
+    Embed everything queued on the given indexes with as few (batched) embedding requests as possible
+    """
+
+    with FLUSH_BARRIER.flushing():
+        pending = [(index, index.take_pending()) for index in indexes]
+        contents = [pending_embedding.content for _, index_pending in pending for pending_embedding in index_pending]
+
+        if not contents:
+            return
+
+        embeddings = generate_embeddings(contents, embedder=OpenAIEmbedder)
+
+        offset = 0
+        for index, index_pending in pending:
+            index.add_embeddings(index_pending, embeddings[offset : offset + len(index_pending)])
+            offset += len(index_pending)
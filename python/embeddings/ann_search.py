@@ -1,9 +1,123 @@
+from typing import Iterator, NamedTuple
+
 import numpy as np
 
 from python.embeddings.ann_faiss import AnnFaiss
 from python.embeddings.embedding_link_index import EmbeddingLinkIndex
 from python.sql.types import DbElementIds
 
+# how many hits to convert to python objects at a time when iterating over results
+ITERATION_CHUNK_SIZE = 1024
+
+
+class AnnSearchResults:
+    """
+    Columnar search results: the scores and the table/column ids for every hit are numpy arrays, gathered from the
+    memory mapped link index in one go. The (score, DbElementIds) tuples are only built for the hits that are actually
+    iterated over, the rankers merge the arrays directly (see `merge_results`).
+    """
+
+    def __init__(
+        self,
+        scores: np.ndarray,
+        offsets: np.ndarray,
+        table_ids: np.ndarray,
+        column_ids: np.ndarray,
+        embedding_link_index: EmbeddingLinkIndex,
+    ):
+        self.scores = scores
+        # offset of each hit in the link index, used to look up the value string
+        self.offsets = offsets
+        self.table_ids = table_ids
+        # -1 when the hit does not point to a column
+        self.column_ids = column_ids
+        self.embedding_link_index = embedding_link_index
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __getitem__(self, idx: int) -> tuple[float, DbElementIds]:
+        return self._build(
+            self.scores[idx].item(), self.offsets[idx].item(), self.table_ids[idx].item(), self.column_ids[idx].item()
+        )
+
+    def __iter__(self) -> Iterator[tuple[float, DbElementIds]]:
+        for start in range(0, len(self), ITERATION_CHUNK_SIZE):
+            end = start + ITERATION_CHUNK_SIZE
+
+            for score, offset, table_id, column_id in zip(
+                self.scores[start:end].tolist(),
+                self.offsets[start:end].tolist(),
+                self.table_ids[start:end].tolist(),
+                self.column_ids[start:end].tolist(),
+            ):
+                yield self._build(score, offset, table_id, column_id)
+
+    def _build(self, score: float, offset: int, table_id: int, column_id: int) -> tuple[float, DbElementIds]:
+        return (
+            score,
+            DbElementIds(table_id, None if column_id == -1 else column_id, self.embedding_link_index.value(offset)),
+        )
+
+
+class MergedResults(NamedTuple):
+    # every distinct element across the searches, in order of first appearance
+    elements: list[DbElementIds]
+    # (searches, elements), NaN where a search didn't return the element
+    scores: np.ndarray
+
+
+def merge_results(results: list[AnnSearchResults], keep_last=False) -> MergedResults:
+    """
+    Line up the hits of several searches by element, on the id arrays: a python object is only built once per distinct
+    element instead of once per hit, and value strings are only decoded for the links which have one. An element found
+    more than once by the same search keeps its best score, or the score of its last hit with `keep_last`.
+    """
+
+    keys = []
+    # value strings are compared across searches (each has its own link index) through a shared code, 0 for no value
+    value_codes: dict[str, int] = {}
+
+    for result in results:
+        codes = np.zeros(len(result), dtype=np.int64)
+
+        has_values = result.embedding_link_index.has_values(result.offsets)
+        for position, offset in zip(np.flatnonzero(has_values).tolist(), result.offsets[has_values].tolist()):
+            codes[position] = value_codes.setdefault(result.embedding_link_index.values[offset], len(value_codes) + 1)
+
+        keys.append(np.stack([result.table_ids, result.column_ids, codes], axis=1).astype(np.int64))
+
+    all_keys = np.concatenate(keys) if keys else np.zeros((0, 3), dtype=np.int64)
+    unique_keys, first_hit, element_of_hit = np.unique(all_keys, axis=0, return_index=True, return_inverse=True)
+
+    # np.unique sorts by key, put the elements back in the order they were first found in
+    order = np.argsort(first_hit, kind="stable")
+    position_of_key = np.empty(len(order), dtype=np.int64)
+    position_of_key[order] = np.arange(len(order))
+    element_of_hit = position_of_key[element_of_hit.reshape(-1)]
+
+    values = [None, *value_codes]
+    elements = [
+        DbElementIds(table_id, None if column_id == -1 else column_id, values[code])
+        for table_id, column_id, code in unique_keys[order].tolist()
+    ]
+
+    scores = np.full((len(results), len(elements)), np.nan)
+    start = 0
+    for idx, result in enumerate(results):
+        hits = element_of_hit[start : start + len(result)]
+
+        if keep_last:
+            # np.unique finds the first occurrence, which is the last hit in the reversed hits
+            elements_hit, last_hit = np.unique(hits[::-1], return_index=True)
+            scores[idx, elements_hit] = result.scores[len(hits) - 1 - last_hit]
+        else:
+            np.fmax.at(scores[idx], hits, result.scores)
+
+        start += len(result)
+
+    return MergedResults(elements, scores)
+
 
 class AnnSearch:
     def __init__(self, path: str):
@@ -18,17 +132,14 @@ class AnnSearch:
 
         return table_id_column_id_and_value
 
-    def search(self, embedding, number_of_matches: int) -> list[tuple[float, DbElementIds]]:
-        scores, results = self.index.query(embedding, number_of_matches)
+    def search(self, embedding, number_of_matches: int, normalized=False) -> AnnSearchResults:
+        scores, results = self.index.query(embedding, number_of_matches, normalized=normalized)
 
-        reject_idxs = results == -1
-        scores = np.delete(scores, reject_idxs, axis=1)
-        results = np.delete(results, reject_idxs)
+        # faiss pads the results with -1 when there are fewer than `number_of_matches` vectors in the index
+        found = results != -1
+        scores = scores[0][found]
+        offsets = results[found]
 
-        scores_results = []
-        for (score, idx) in zip(scores.tolist()[0], results.tolist()):
-            if idx != -1:
-                db_element_ids = self.lookup_link(idx)
-                scores_results.append((score, db_element_ids))
+        table_ids, column_ids = self.embedding_link_index.query_many(offsets)
 
-        return scores_results
+        return AnnSearchResults(scores, offsets, table_ids, column_ids, self.embedding_link_index)
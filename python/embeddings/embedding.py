@@ -1,17 +1,33 @@
-import io
-from typing import Type
+from typing import Iterator, Type
 
 import numpy as np
 import xxhash
+from decouple import config
 
+from python.embeddings import embedding_cache
 from python.embeddings.msmacro_embedder import MSMarcoEmbedder
 from python.embeddings.openai_embedder import OpenAIEmbedder
-from python.utils.db import application_database_connection
-from python.utils.logging import log
+from python.utils import progress
+from python.utils.lru_cache import BoundedLRUCache
+from python.utils.metrics import EMBEDDING_CACHE_REQUESTS
+from python.utils.timings import timed
+from python.utils.tokens import count_tokens
 
-from prisma import Base64
+# OpenAI accepts up to 2048 inputs per embedding request, we stay well below that
+EMBEDDING_BATCH_SIZE = 500
 
-db = application_database_connection()
+# a batch is charged to the rate limiter as one request, so it has to stay below the per minute embedding token limit
+EMBEDDING_BATCH_TOKENS = 50_000
+
+
+# Question embeddings are looked up more than once per request (ranking and few shot search) and the same questions
+# are asked repeatedly from the UI, so keep the most recent ones in memory in front of the database cache.
+# Keyed by (embedder name, content hash)
+EMBEDDING_LRU: BoundedLRUCache[tuple[str, str], np.ndarray] = BoundedLRUCache(
+    max_entries=config("EMBEDDING_LRU_MAX_ENTRIES", default=10_000, cast=int),
+    max_bytes=config("EMBEDDING_LRU_MAX_BYTES", default=128 * 1024 * 1024, cast=int),
+    sizeof=lambda embedding: embedding.nbytes,
+)
 
 
 def _hash(content):
@@ -20,44 +36,101 @@ def _hash(content):
     return xxhash.xxh64(content).hexdigest()
 
 
-def _retrieved_cached_embedding(content_hash: str) -> np.ndarray | None:
-    embedding_cache = db.embeddingcache.find_first(where={"contentHash": content_hash})
+def batch_by_token_budget(
+    contents: list[str], max_batch_size=EMBEDDING_BATCH_SIZE, max_batch_tokens=EMBEDDING_BATCH_TOKENS
+) -> Iterator[list[str]]:
+    """
+    Group the contents into batches of at most `max_batch_size` strings and `max_batch_tokens` tokens
+    """
+
+    batch: list[str] = []
+    batch_tokens = 0
 
-    if embedding_cache:
-        log.debug("embedding cache hit")
-        # Prisma requires things go through base64 to a Bytes (Blob) field. Because reasons?
-        emb_load = io.BytesIO(Base64.decode(embedding_cache.embedding))
-        emb_load.seek(0)
+    for content in contents:
+        content_tokens = count_tokens(content)
 
-        # `x` is user defined below in `savez_compressed`
-        return np.load(emb_load, allow_pickle=True)["x"]
+        if batch and (len(batch) >= max_batch_size or batch_tokens + content_tokens > max_batch_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
 
-    return None
+        batch.append(content)
+        batch_tokens += content_tokens
+
+    if batch:
+        yield batch
 
 
 # create multiple embeddings vector via openai and store to disk.
 # docs/prompt_embeddings.md for more information
+@timed("embedding")
 def generate_embedding(content_str: str, embedder: Type[OpenAIEmbedder] | Type[MSMarcoEmbedder], cache_results=True):
     content_hash = _hash(content_str)
+    lru_key = (embedder.__name__, content_hash)
+
+    if cache_results:
+        if (in_memory := EMBEDDING_LRU.get(lru_key)) is not None:
+            EMBEDDING_CACHE_REQUESTS.inc(result="memory")
+            return in_memory
 
-    if cache_results and (embedding_cache := _retrieved_cached_embedding(content_hash)) is not None:
-        return embedding_cache
+        if cached := embedding_cache.get_many([content_hash]):
+            EMBEDDING_CACHE_REQUESTS.inc(result="database")
+            return _remember(lru_key, cached[content_hash])
+
+        EMBEDDING_CACHE_REQUESTS.inc(result="miss")
 
     embed_engine = embedder()
     embedding: np.ndarray = embed_engine.encode(content_str)
 
-    # we are using numpy array for speed: these vectors are huge and are stored all in memory
-    # Serialize it to npz
-    emb_str = io.BytesIO()
-    np.savez_compressed(emb_str, x=embedding, allow_pickle=True)
-    emb_bytes = emb_str.getvalue()
+    embedding_cache.put_many({content_hash: embedding})
+
+    return _remember(lru_key, embedding)
+
 
-    db.embeddingcache.create(
-        data={
-            "contentHash": content_hash,
-            # why prisma won't let me pass in bytes is beyond me
-            "embedding": Base64.encode(emb_bytes),
-        }
-    )
+def _remember(lru_key: tuple[str, str], embedding: np.ndarray) -> np.ndarray:
+    # the same array is handed out on every hit, make sure nobody can modify it in place
+    embedding.flags.writeable = False
+    EMBEDDING_LRU.put(lru_key, embedding)
 
     return embedding
+
+
+def generate_embeddings(
+    contents: list[str], embedder: Type[OpenAIEmbedder] | Type[MSMarcoEmbedder], cache_results=True
+) -> list[np.ndarray]:
+    """
+    Batched version of `generate_embedding` for building indexes: every hash is looked up in the cache with a single
+    bulk query, misses are embedded in token budgeted, multi-input requests and written back to the cache in bulk.
+    Returns an embedding for each of the contents, in order.
+
+    The in-process LRU is skipped here, it's reserved for question embeddings and an import would just churn it.
+    """
+
+    content_hashes = [_hash(content) for content in contents]
+    embeddings: dict[str, np.ndarray] = {}
+
+    if cache_results:
+        embeddings = embedding_cache.get_many(content_hashes)
+
+    # the same string is often indexed more than once (e.g. the same value in multiple columns), only embed it once
+    missing_contents = list({h: c for h, c in zip(content_hashes, contents) if h not in embeddings}.values())
+
+    progress.increment("embedding_cache_hits", len(embeddings))
+    progress.increment("embedding_cache_misses", len(missing_contents))
+
+    if cache_results:
+        EMBEDDING_CACHE_REQUESTS.inc(len(embeddings), result="database")
+        EMBEDDING_CACHE_REQUESTS.inc(len(missing_contents), result="miss")
+
+    if missing_contents:
+        embed_engine = embedder()
+
+        for batch in batch_by_token_budget(missing_contents):
+            with progress.timer("embedding_requests"):
+                batch_embeddings = dict(zip([_hash(content) for content in batch], embed_engine.encode_batch(batch)))
+
+            # written per batch so a failure part way through an import keeps what was already paid for
+            embedding_cache.put_many(batch_embeddings)
+            embeddings.update(batch_embeddings)
+
+    return [embeddings[content_hash] for content_hash in content_hashes]
@@ -1,28 +1,38 @@
 # Called from import.py, builds and updates the embedding indexes
 
+import json
+import os
 import re
-from multiprocessing.pool import ThreadPool
+import time
+from threading import Lock
+from typing import NamedTuple
 
 from decouple import config
 
-from python import query_runner, utils
-from python.embeddings.ann_index import AnnIndex
-from python.utils import sql
-from python.utils.entropy import token_entropy
+from python import utils
+from python.embeddings.ann_index import FLUSH_BARRIER, AnnIndex, flush_indexes
+from python.embeddings.index_policy import COLUMN_FAMILY, TABLE_FAMILY, VALUE_FAMILY
+from python.embeddings.value_filter import filter_values
+from python.query_runner.column_values import load_column_values
+from python.query_runner.scheduler import run_import_query
+from python.utils import progress
+from python.utils.files import atomic_write
 from python.utils.logging import log
+from python.utils.pipeline import Pipeline, Stage
 from python.utils.sql import unqualified_table_name
 
 from prisma.models import DataSource, DataSourceTableColumn, DataSourceTableDescription
 
-# How long of a value do we create an embedding for?
-# embeddings have a window, so we truncate the values to fit into the window
-# TODO where are these limits documented in openai?
-MAX_VALUE_LENGTH = 600
-MAX_FOR_SMALL_VALUE = 100
-
 # max length is 8191 tokens, but we'll keep it below for now so we don't have to count tokens
 MAX_EMBEDDING_TOKENS = 7500
-TOKEN_ENTROPY_THRESHOLD = 2.0  # Anything less and this is probably a GUID or similar
+
+# workers for each stage of the column value pipeline: warehouse queries, filtering, embedding requests
+EXTRACTION_WORKERS = config("IMPORT_EXTRACTION_WORKERS", default=4, cast=int)
+FILTER_WORKERS = config("IMPORT_FILTER_WORKERS", default=2, cast=int)
+EMBEDDING_WORKERS = config("IMPORT_EMBEDDING_WORKERS", default=4, cast=int)
+
+# how often the progress of an import is checkpointed to disk, so it can be resumed if it dies
+CHECKPOINT_INTERVAL_SECONDS = config("IMPORT_CHECKPOINT_INTERVAL_SECONDS", default=120, cast=int)
 
 
 # TODO should use a functional util instead / make this easier to read
@@ -36,8 +46,23 @@ def in_groups_of(l, n):
 db = utils.db.application_database_connection()
 
 
+class TableValues(NamedTuple):
+    """
+    A table making its way through the column value pipeline
+    """
+
+    table: DataSourceTableDescription
+    unqualified_name: str
+    column_names: list[str]
+    value_columns: list[DataSourceTableColumn]
+    column_value_limit: int
+    row_count: int
+    # raw values by column name after extraction, (value, entropy) pairs after filtering
+    values: dict[str, list] | None = None
+
+
 class EmbeddingBuilder:
-    def __init__(self, data_source: DataSource):
+    def __init__(self, data_source: DataSource, incremental=False, resume=False):
         self.data_source = data_source
 
         # See docs/prompt_embeddings.md for info on index types
@@ -46,35 +71,74 @@ class EmbeddingBuilder:
 
         # TODO eliminate magic nubmers and use a enum
         # Table indexes (indexes that point to a table)
-        self.idx_table_name = AnnIndex(f"{indexes_path}/{self.data_source.id}/table_name")
+        self.idx_table_name = AnnIndex(
+            f"{indexes_path}/{self.data_source.id}/table_name", family=TABLE_FAMILY, incremental=incremental
+        )
         self.idx_table_and_all_column_names = AnnIndex(
-            f"{indexes_path}/{self.data_source.id}/table_and_all_column_names"
+            f"{indexes_path}/{self.data_source.id}/table_and_all_column_names",
+            family=TABLE_FAMILY,
+            incremental=incremental,
         )
         self.idx_table_and_all_column_names_and_all_values = AnnIndex(
-            f"{indexes_path}/{self.data_source.id}/table_and_all_column_names_and_all_values"
+            f"{indexes_path}/{self.data_source.id}/table_and_all_column_names_and_all_values",
+            family=TABLE_FAMILY,
+            incremental=incremental,
         )
 
         # Column indexes (indexes that point to a column)
-        self.idx_column_name = AnnIndex(f"{indexes_path}/{self.data_source.id}/column_name")
-        self.idx_table_and_column_name = AnnIndex(f"{indexes_path}/{self.data_source.id}/table_and_column_name")
+        self.idx_column_name = AnnIndex(
+            f"{indexes_path}/{self.data_source.id}/column_name", family=COLUMN_FAMILY, incremental=incremental
+        )
+        self.idx_table_and_column_name = AnnIndex(
+            f"{indexes_path}/{self.data_source.id}/table_and_column_name", family=COLUMN_FAMILY, incremental=incremental
+        )
         self.idx_column_name_and_all_values = AnnIndex(
-            f"{indexes_path}/{self.data_source.id}/column_name_and_all_values"
+            f"{indexes_path}/{self.data_source.id}/column_name_and_all_values",
+            family=COLUMN_FAMILY,
+            incremental=incremental,
         )
         self.idx_table_and_column_name_and_all_values = AnnIndex(
-            f"{indexes_path}/{self.data_source.id}/table_and_column_name_and_all_values"
+            f"{indexes_path}/{self.data_source.id}/table_and_column_name_and_all_values",
+            family=COLUMN_FAMILY,
+            incremental=incremental,
         )
 
         # Cell Values (index that point to a table+column+value)
-        self.idx_value = AnnIndex(f"{indexes_path}/{self.data_source.id}/value")
-        self.idx_table_column_and_value = AnnIndex(f"{indexes_path}/{self.data_source.id}/table_column_and_value")
+        self.idx_value = AnnIndex(
+            f"{indexes_path}/{self.data_source.id}/value", family=VALUE_FAMILY, incremental=incremental
+        )
+        self.idx_table_column_and_value = AnnIndex(
+            f"{indexes_path}/{self.data_source.id}/table_column_and_value", family=VALUE_FAMILY, incremental=incremental
+        )
 
-        # Temp store for all short string values in a table
-        # TODO: this will blow up on huge tables
-        # TODO is this really `all_table_values`? or values for a specific table?
-        self.table_values = []
+        # tables which made it all the way through the pipeline, FQN to id. Along with the embeddings added for them
+        # these are checkpointed every so often, a resumed import skips them.
+        self.completed_tables: dict[str, int] = {}
+        self.completed_lock = Lock()
+        self.checkpoint_path = f"{indexes_path}/{self.data_source.id}/import_checkpoint.json"
+        self.checkpoint_lock = Lock()
+        self.last_checkpoint = time.monotonic()
+
+        if resume:
+            self.restore_checkpoint()
+        else:
+            self.discard_checkpoint()
+
+        # Column values go through three stages, each with its own workers: pulling them from the warehouse, filtering
+        # them and embedding them. A slow warehouse query doesn't hold up embedding requests and a rate limited
+        # embedding request doesn't hold up the warehouse, the bounded queues between the stages keep memory in check.
+        self.pipeline = Pipeline(
+            [
+                Stage("extract-values", self.extract_table_values, concurrency=EXTRACTION_WORKERS),
+                Stage("filter-values", self.filter_table_values, concurrency=FILTER_WORKERS),
+                Stage("embed-values", self.index_table_values, concurrency=EMBEDDING_WORKERS),
+            ]
+        )
 
     def add_table(self, name: str, column_limit: int, column_value_limit: int) -> None:
-        self.table_values = []
+        """
+        Index the table and column names and queue the column values to be indexed, blocks while the pipeline is full
+        """
 
         unqualified_name = unqualified_table_name(name)
         table = db.datasourcetabledescription.find_first(
@@ -99,13 +163,11 @@ class EmbeddingBuilder:
 
         columns = all_columns[0:column_limit]
 
-        column_add_pool = ThreadPool(processes=20)
-
         # not all column names will be included in the index, depending on the token size
         column_names = []
 
-        # run all of the embedding results async and wait for them all to complete
-        column_add_results = []
+        # columns whose values are added to the indexes
+        value_columns = []
 
         for column in columns:
             # TODO we should be doing upsert instead
@@ -115,120 +177,111 @@ class EmbeddingBuilder:
             self.idx_column_name.add(f"{column.name}", table.id, column.id, None)
             self.idx_table_and_column_name.add(f"{unqualified_name} {column.name}", table.id, column.id, None)
 
+            # TODO this is very snowflake specific; there's just varchars in snowflake
+            # only index string columns
+            if not re.search("^VARCHAR", column.type):
+                log.debug("skipping embeddings for column, not varchar", column_name=column.name)
+                continue
+
             # TODO here we are deciding which columns should be put into the vector index,
             #      right now, we are just using the distict count of the column to decide
             #      but long term, we'd want a more complex heuristic
-            # Add cell values (requires a full scan of each table)
             # NOTE: Currently disabled, limiting this kept out some fields we wanted in. The limit is still in place
             # on the actual number of value examples we pull.
             if True or column.distinctRows < column_value_limit:
-                column_add_results.append(
-                    column_add_pool.apply_async(
-                        self.add_table_column_values, (unqualified_name, table, column, column_value_limit)
-                    )
-                )
-                # self.add_table_column_values(table, column, column_value_limit=column_value_limit)
+                value_columns.append(column)
             else:
                 log.debug(
                     "not indexing column, too many values", column_name=column.name, distinct_rows=column.distinctRows
                 )
 
-        log.debug("waiting for async results")
-
-        # wait sync for all AsyncResults to complete
-        for result in column_add_results:
-            # try:
-            result.get()
-            # except ValueError:
-            #     # TODO: should probably fail fully and we can figure it out
-            #     log.error("async result timed out")
+        # Add table and column names as a single string (for table lookup)
+        self.idx_table_and_all_column_names.add(unqualified_name + " " + " ".join(column_names), table.id, None, None)
 
-        log.debug(
-            "async results complete",
-            total=len(column_add_results),
-            successful=len([r for r in column_add_results if r.successful()]),
+        self.pipeline.submit(
+            TableValues(
+                table,
+                unqualified_name,
+                column_names,
+                value_columns,
+                column_value_limit,
+                # every column record carries the row count of its table
+                row_count=max((column.rows or 0 for column in columns), default=0),
+            )
         )
 
-        # Add table and column names as a single string (for table lookup)
-        self.idx_table_and_all_column_names.add(unqualified_name + " " + " ".join(column_names), table.id, None, None)
+    def extract_table_values(self, table_values: TableValues) -> TableValues:
+        # this is the most expensive operation in the whole indexing process: a single (sampled, on large tables) scan
+        # pulls the most common values of all of the string columns
+        with progress.timer("extract_values"):
+            values = load_column_values(
+                self.run_query,
+                table_values.table.fullyQualifiedName,
+                [column.name for column in table_values.value_columns],
+                table_values.column_value_limit,
+                row_count=table_values.row_count,
+            )
+
+        progress.increment("values_extracted", sum(len(column_values) for column_values in values.values()))
+
+        return table_values._replace(values=values)
+
+    def filter_table_values(self, table_values: TableValues) -> TableValues:
+        with progress.timer("filter_values"):
+            values = {name: filter_values(column_values) for name, column_values in table_values.values.items()}
+
+        return table_values._replace(values=values)
+
+    def index_table_values(self, table_values: TableValues) -> None:
+        with progress.timer("embed_values"):
+            self.add_table_values(table_values)
+
+        progress.increment("tables")
+
+        # everything queued for the table has been embedded by now (`add_table_values` flushes all of the indexes)
+        with self.completed_lock:
+            self.completed_tables[table_values.table.fullyQualifiedName] = table_values.table.id
+
+        self.checkpoint_if_due()
+
+    def add_table_values(self, table_values: TableValues) -> None:
+        table = table_values.table
+        unqualified_name = table_values.unqualified_name
+
+        # all short string values in the table
+        all_values = []
+
+        for column in table_values.value_columns:
+            all_values += self.add_table_column_values(
+                unqualified_name, table, column, table_values.values[column.name]
+            )
+
+        progress.increment("values_indexed", len(all_values))
 
         # Add for table + column names + all values
-        for table_value_group in in_groups_of("\n".join(self.table_values), MAX_EMBEDDING_TOKENS):
-            full_table_str = unqualified_name + "\n" + "\n".join(column_names) + "\n" + table_value_group
+        for table_value_group in in_groups_of("\n".join(all_values), MAX_EMBEDDING_TOKENS):
+            full_table_str = unqualified_name + "\n" + "\n".join(table_values.column_names) + "\n" + table_value_group
             self.idx_table_and_all_column_names_and_all_values.add(full_table_str, table.id, None, None)
 
+        # Embed everything queued for this table across all of the indexes at once: the embedding cache is checked
+        # for every string in the table with a single bulk lookup and the misses go out in batched requests
+        flush_indexes(self.indexes())
+
     def add_table_column_values(
         self,
         unqualified_table_name_val: str,
         table: DataSourceTableDescription,
         column: DataSourceTableColumn,
-        column_value_limit: int,
-    ):
-        # TODO this is very snowflake specific; there's just varchars in snowflake
-        # only index string columns
-        if not re.search("^VARCHAR", column.type):
-            log.debug("skipping embeddings for column, not varchar", column_name=column.name)
-            return
-
-        # TODO add a ttl
-        # get all the values for this column, this is the most expensive operation in the whole indexing process
-        values = query_runner.run_query(
-            self.data_source.id,
-            f"""
-            SELECT {column.name} as VALUE, COUNT(*) AS COUNT
-            FROM {sql.normalize_fqn_quoting(table.fullyQualifiedName)}
-            WHERE {column.name} IS NOT NULL
-            GROUP BY {column.name}
-            ORDER BY COUNT DESC
-            LIMIT {column_value_limit}
-            """,
-            disable_query_protections=True,
-            allow_cached_queries=True,
-        )
-
+        values: list[tuple[str, float]],
+    ) -> list[str]:
         column_values = []
 
         # Add each value to the index
-        for value in values:
-            value_str = value["VALUE"]
-
-            if not value_str:
-                log.debug("no value, skipping")
-                continue
-
-            if self.is_only_number(value_str):
-                # OpenAI indexes are a little weird when values are only numbers and we probably don't need to be
-                # matching against it in most cases anyway.
-                log.debug("value is only number", value=value_str)
-                continue
-
-            # For strings shorter than 20, it's probably not a big hex string, it might be an actual word (eg.. dead beef)
-            if len(value_str) >= 20 and self.is_hexadecimal(value_str):
-                # Big hex only values we should just skip
-                log.debug("value is only number", value=value_str)
-                continue
-
-            # TODO we could break the input into chunks and generate embedding for each chunk
-            if not value_str or len(value_str) >= MAX_VALUE_LENGTH:
-                log.debug("skipping embedding, too long")
-                continue
-
-            entropy = token_entropy(value_str)
-            if entropy <= TOKEN_ENTROPY_THRESHOLD:
-                log.debug("skipping embedding, not enough entropy", entropy=entropy)
-                continue
-
+        for value_str, entropy in values:
             log.info(
                 "adding embedding", table_name=unqualified_table_name_val, column_name=column.name, entropy=entropy
             )
 
-            # We have 5 different indexes we are building (tables, columns, column values, etc)
-            # For larger indexes, we track shorter column values. Check out `docs/prompt_embeddings.md` for more
-            if len(value_str) > MAX_FOR_SMALL_VALUE:
-                log.debug("skipping embedding, too long for small value")
-                continue
-
-            self.table_values.append(value_str)
             column_values.append(value_str)
 
             # Add both a string with `TABLE_NAME COLUMN_NAME value` and just one with the value
@@ -251,24 +304,98 @@ class EmbeddingBuilder:
                 f"{unqualified_table_name_val} {full_column_str}", table.id, column.id, None
             )
 
+        return column_values
+
+    def run_query(self, raw_sql: str) -> list[dict]:
+        # TODO add a ttl
+        # shares the data source's query slots with the importer's metadata queries
+        return run_import_query(self.data_source, raw_sql)
+
+    def indexes(self) -> list[AnnIndex]:
+        return [
+            self.idx_table_name,
+            self.idx_table_and_all_column_names,
+            self.idx_table_and_all_column_names_and_all_values,
+            self.idx_column_name,
+            self.idx_table_and_column_name,
+            self.idx_column_name_and_all_values,
+            self.idx_table_and_column_name_and_all_values,
+            self.idx_value,
+            self.idx_table_column_and_value,
+        ]
+
+    def remove_table(self, table_id: int) -> None:
+        # drop what was previously indexed for the table before it is added again in incremental mode
+        for index in self.indexes():
+            index.remove_table(table_id)
+
+    def finish(self):
+        # wait for every queued table to make it through the pipeline
+        self.pipeline.finish()
+
+    def checkpoint_if_due(self):
+        if time.monotonic() - self.last_checkpoint < CHECKPOINT_INTERVAL_SECONDS:
+            return
+
+        # one checkpoint at a time, the other workers carry on
+        if not self.checkpoint_lock.acquire(blocking=False):
+            return
+
+        try:
+            self.checkpoint()
+        finally:
+            self.checkpoint_lock.release()
+
+    def checkpoint(self):
+        # no embeddings can be in flight while the indexes are written, otherwise a completed table could be missing
+        # some of them
+        with progress.timer("checkpoint"), FLUSH_BARRIER.quiesced():
+            with self.completed_lock:
+                completed_tables = dict(self.completed_tables)
+
+            os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+
+            for index in self.indexes():
+                index.checkpoint()
+
+            # written last, the index checkpoints have everything for the tables listed here
+            with atomic_write(self.checkpoint_path) as checkpoint_path:
+                with open(checkpoint_path, "w", encoding="utf-8") as f:
+                    json.dump({"completed_tables": completed_tables}, f)
+
+        self.last_checkpoint = time.monotonic()
+        log.info("import checkpoint written", completed_tables=len(completed_tables))
+
+    def restore_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            log.info("no import checkpoint to resume from", path=self.checkpoint_path)
+            return
+
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            completed_tables: dict[str, int] = json.load(f)["completed_tables"]
+
+        for index in self.indexes():
+            index.restore_checkpoint(set(completed_tables.values()))
+
+        self.completed_tables = completed_tables
+        log.info("resuming import", completed_tables=len(completed_tables))
+
+    def discard_checkpoint(self):
+        # the import checkpoint goes first, it must never list tables the index checkpoints don't have
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        for index in self.indexes():
+            index.discard_checkpoint()
+
     # this is an expensive operation, do this as minimally as we can!
     def write_indexes_to_disk(self):
-        self.idx_table_name.save()
-        self.idx_table_and_all_column_names.save()
-        self.idx_table_and_all_column_names_and_all_values.save()
-        self.idx_column_name.save()
-        self.idx_table_and_column_name.save()
-        self.idx_column_name_and_all_values.save()
-        self.idx_table_and_column_name_and_all_values.save()
-        self.idx_value.save()
-        self.idx_table_column_and_value.save()
-
-    def is_only_number(self, string_val: str) -> bool:
-        # Regular expression to match a float or int (negative or positive)
-        pattern = r"^[-+]?(\d+\.\d*|\d*\.\d+|\d+)$"
-
-        # Check if the input string matches the pattern
-        return bool(re.match(pattern, string_val))
-
-    def is_hexadecimal(self, s: str) -> bool:
-        return bool(re.match(r"^[#0-9a-fA-F]+$", s))
+        self.finish()
+        flush_indexes(self.indexes())
+
+        with progress.timer("index_build"):
+            for index in self.indexes():
+                index.save()
+
+        # the indexes are complete, there's nothing left to resume
+        self.discard_checkpoint()
@@ -0,0 +1,72 @@
+"""
+Postgres backed cache of content hash -> embedding, so we don't have to rehit the embedding apis when re-importing.
+
+Embeddings are stored as a short format header followed by the raw little endian float32 bytes, which is a straight
+memory copy to read and write. Entries written before this used a compressed npz and are still readable.
+"""
+
+import io
+
+import numpy as np
+
+from python.utils.db import application_database_connection
+from python.utils.logging import log
+
+from prisma import Base64
+
+db = application_database_connection()
+
+RAW_FLOAT32_HEADER = b"EF32"
+
+# each hash is a bind parameter in the `IN` clause, postgres caps a query at 32767 of them
+LOOKUP_CHUNK_SIZE = 5_000
+WRITE_CHUNK_SIZE = 1_000
+
+
+def encode_embedding(embedding: np.ndarray) -> Base64:
+    raw = RAW_FLOAT32_HEADER + np.asarray(embedding, dtype="<f4").tobytes()
+
+    # why prisma won't let me pass in bytes is beyond me
+    return Base64.encode(raw)
+
+
+def decode_embedding(encoded: Base64) -> np.ndarray:
+    # Prisma requires things go through base64 to a Bytes (Blob) field. Because reasons?
+    raw = Base64.decode(encoded)
+
+    if raw.startswith(RAW_FLOAT32_HEADER):
+        return np.frombuffer(raw, dtype="<f4", offset=len(RAW_FLOAT32_HEADER)).astype(np.float32)
+
+    # legacy format, `x` is the key the embedding was saved under with `savez_compressed`
+    return np.load(io.BytesIO(raw), allow_pickle=True)["x"]
+
+
+def get_many(content_hashes: list[str]) -> dict[str, np.ndarray]:
+    """
+    Look up the cached embeddings for all of the hashes, returns only the hashes which were found
+    """
+
+    unique_hashes = list(dict.fromkeys(content_hashes))
+    embeddings: dict[str, np.ndarray] = {}
+
+    for start in range(0, len(unique_hashes), LOOKUP_CHUNK_SIZE):
+        chunk = unique_hashes[start : start + LOOKUP_CHUNK_SIZE]
+
+        for cache_entry in db.embeddingcache.find_many(where={"contentHash": {"in": chunk}}):
+            embeddings[cache_entry.contentHash] = decode_embedding(cache_entry.embedding)
+
+    log.debug("embedding cache lookup", requested=len(unique_hashes), hits=len(embeddings))
+
+    return embeddings
+
+
+def put_many(embeddings: dict[str, np.ndarray]):
+    items = list(embeddings.items())
+
+    for start in range(0, len(items), WRITE_CHUNK_SIZE):
+        db.embeddingcache.create_many(
+            data=[
+                {"contentHash": content_hash, "embedding": encode_embedding(embedding)}
+                for content_hash, embedding in items[start : start + WRITE_CHUNK_SIZE]
+            ]
+        )
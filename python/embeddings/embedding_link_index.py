@@ -1,40 +1,91 @@
 # Embedding Links point from a faiss search result index to a table_id,
 # column_id and value string for the SchemaBuilder
 
+import os
+from collections import defaultdict
+
 import numpy as np
 
+from python.embeddings.string_table import StringTable
 from python.sql.types import DbElementIds
+from python.utils.files import atomic_write
 from python.utils.logging import log
 
 
 class EmbeddingLinkIndex:
     table_and_columns: np.ndarray
-    values: np.ndarray
+    values: StringTable | np.ndarray
 
     rows: list[tuple[int, int | None, int | None, str | None]]
+    # row indexes by table id, so a table's rows can be found without scanning all of them
+    table_rows: dict[int | None, list[int]]
 
     def __init__(self, path):
         self.path = path
         self.rows = []
+        self.table_rows = defaultdict(list)
 
     def add(self, index: int, table_id: int | None, column_id: int | None, value: str | None):
         self.rows.append((index, table_id, column_id, value))
+        self.table_rows[table_id].append(index)
 
     def load(self):
         # Load the index from disk memory mapped
         self.table_and_columns = np.load(self.path + ".table_cols.npy", mmap_mode="r")
-        self.values = np.load(self.path + ".values.npy", allow_pickle=True)
+
+        if os.path.exists(self.path + ".values.blob.npy"):
+            self.values = StringTable.load(self.path + ".values")
+        else:
+            # indexes written before the string table existed store the values as a pickled object array
+            log.warn("loading legacy pickled link index values, re-import to upgrade", path=self.path)
+            self.values = np.load(self.path + ".values.npy", allow_pickle=True)
+
+    def load_rows(self):
+        """
+        Load an index saved to disk back into `rows`, so new rows can be appended to it
+        """
+
+        self.load()
+
+        self.rows = []
+        self.table_rows = defaultdict(list)
+        for idx, (table_id, column_id) in enumerate(self.table_and_columns.tolist()):
+            self.add(idx, None if table_id == -1 else table_id, None if column_id == -1 else column_id, self.value(idx))
+
+    def indexes_for_table(self, table_id: int) -> list[int]:
+        return list(self.table_rows.get(table_id, []))
+
+    def remove(self, indexes: set[int]) -> np.ndarray:
+        """
+        Drop the rows at `indexes` and renumber the remaining ones in order. Returns the new index of every previous
+        index, -1 for the dropped ones.
+        """
+
+        new_indexes = np.full(len(self.rows), -1, dtype=np.int64)
+
+        kept = []
+        self.table_rows = defaultdict(list)
+        for index, table_id, column_id, value in self.rows:
+            if index not in indexes:
+                new_indexes[index] = len(kept)
+                self.table_rows[table_id].append(len(kept))
+                kept.append((len(kept), table_id, column_id, value))
+
+        self.rows = kept
+
+        return new_indexes
 
     def save(self):
         # Find the max index in rows
-        max_index = max(self.rows, key=lambda x: x[0])[0]
+        # (-1 when every row was removed, see `remove`)
+        max_index = max((row[0] for row in self.rows), default=-1)
 
         log.debug("Save EmbeddingLink index", size=max_index)
 
         # Create the numpy arrays for the table_id/column_id and the value
         # strings
         self.table_and_columns = np.zeros((max_index + 1, 2), dtype=np.int32)
-        self.values = np.empty(max_index + 1, dtype=object)
+        values = [""] * (max_index + 1)
 
         # Loop through the rows and assign each now that we know the number
         # of rows.
@@ -42,17 +93,56 @@ class EmbeddingLinkIndex:
             # Assign -1 for None valuese
             self.table_and_columns[idx, 0] = row[1] or -1
             self.table_and_columns[idx, 1] = row[2] or -1
-            self.values[idx] = row[3] or ""
+            values[idx] = row[3] or ""
 
         # Seralize index to disk, just use .np format, not npz so we can jump
-        # directly to the spot in memory
-        np.save(self.path + ".table_cols", self.table_and_columns)
-        np.save(self.path + ".values", self.values)
+        # directly to the spot in memory. Each file is swapped in atomically, when appending to an existing index the
+        # new files are a superset of the old ones so a reader never sees a link it can't resolve (rows are only
+        # dropped by an incremental update, which writes the faiss index first, see AnnIndex.save_incremental).
+        self.values = StringTable.build(values)
+        self.values.save(self.path + ".values")
+
+        with atomic_write(self.path + ".table_cols.npy") as table_cols_path:
+            np.save(table_cols_path, self.table_and_columns)
+
+        # remove the legacy pickled values so `load` can't pick up a stale copy
+        if os.path.exists(self.path + ".values.npy"):
+            os.remove(self.path + ".values.npy")
+
+    def query_many(self, indexes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the table ids and column ids (-1 when there is no column) for many indexes with a single lookup
+        """
+
+        table_and_columns = self.table_and_columns[indexes]
+        table_ids = table_and_columns[:, 0]
+
+        if (table_ids == -1).any():
+            raise ValueError("Table ID is -1, should always be provided")
+
+        return table_ids, table_and_columns[:, 1]
+
+    def has_values(self, indexes: np.ndarray) -> np.ndarray:
+        """
+        Which of the indexes have a value, table and column links don't, without decoding any of the values
+        """
+
+        if isinstance(self.values, StringTable):
+            return self.values.lengths(indexes) > 0
+
+        return np.array([self.values[index] != "" for index in indexes.tolist()], dtype=bool)
+
+    def value(self, index: int) -> str | None:
+        value: str = self.values[index]
+
+        if value == "":
+            return None
+
+        return value
 
     def query(self, index: int) -> DbElementIds:
         table_id: int = self.table_and_columns[index, 0].item()
         column_id: int | None = self.table_and_columns[index, 1].item()
-        value: str | None = self.values[index]
 
         if table_id == -1:
             raise ValueError("Table ID is -1, should always be provided")
@@ -60,7 +150,4 @@ class EmbeddingLinkIndex:
         if column_id == -1:
             column_id = None
 
-        if value == "":
-            value = None
-
-        return DbElementIds(table_id, column_id, value)
+        return DbElementIds(table_id, column_id, self.value(index))
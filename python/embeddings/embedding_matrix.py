@@ -0,0 +1,95 @@
+# An append-only float32 matrix spilled to a memory mapped file. Embeddings are written straight to disk as they are
+# generated, so building an index keeps a bounded amount of them on the heap no matter how many values we index; the
+# OS pages them in and out as needed.
+
+import os
+
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingMatrix:
+    def __init__(self, path: str, initial_capacity=INITIAL_CAPACITY):
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.rows = 0
+        self.dimensions: int | None = None
+        self.data: np.memmap | None = None
+
+    def append(self, embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        if len(embeddings) == 0:
+            return
+
+        if self.data is None:
+            self.dimensions = embeddings.shape[1]
+            self._allocate(max(self.initial_capacity, len(embeddings)))
+        elif embeddings.shape[1] != self.dimensions:
+            raise ValueError(f"Expected embeddings of {self.dimensions} dimensions, got {embeddings.shape[1]}")
+
+        assert self.data is not None
+        if self.rows + len(embeddings) > len(self.data):
+            self._allocate(max(2 * len(self.data), self.rows + len(embeddings)))
+
+        self.data[self.rows : self.rows + len(embeddings)] = embeddings
+        self.rows += len(embeddings)
+
+    def open_existing(self, rows: int, dimensions: int):
+        """
+        Map a matrix a previous process wrote to `path` (see `AnnIndex.checkpoint`), keeping its first `rows` rows
+        """
+
+        self.dimensions = dimensions
+        capacity = os.path.getsize(self.path) // (dimensions * np.dtype(np.float32).itemsize)
+
+        if capacity < rows:
+            raise ValueError(f"Expected at least {rows} rows in {self.path}, found {capacity}")
+
+        self.data = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, dimensions))
+        self.rows = rows
+
+    def flush(self):
+        # make sure everything appended so far is on disk, not just in the page cache
+        if self.data is not None:
+            self.data.flush()
+
+    def view(self) -> np.ndarray:
+        """
+        The rows written so far, backed by the file (nothing is copied)
+        """
+
+        if self.data is None:
+            return np.empty((0, self.dimensions or 0), dtype=np.float32)
+
+        return self.data[: self.rows]
+
+    def delete(self):
+        self.data = None
+        self.rows = 0
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _allocate(self, capacity: int):
+        # Grow the file in place (the new tail reads back as zeros) and map it again with the larger shape. Growing
+        # geometrically keeps the number of remaps logarithmic in the number of rows.
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+        else:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # a leftover from a previous (killed) run is garbage at this point
+            open(self.path, "wb").close()  # pylint: disable=consider-using-with
+
+        assert self.dimensions is not None
+        with open(self.path, "r+b") as file:
+            file.truncate(capacity * self.dimensions * np.dtype(np.float32).itemsize)
+
+        self.data = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def __len__(self) -> int:
+        return self.rows
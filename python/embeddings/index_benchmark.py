@@ -0,0 +1,165 @@
+# Offline benchmark of the faiss index types we could use for the embedding indexes. Every candidate is built from
+# the same embedding matrix (a saved one, or synthetic clustered vectors) and compared against an exact Flat search:
+# recall@k, single query latency, build time and index size. No embeddings are requested from OpenAI.
+#
+#   python -m knolbe_py.cli benchmark-indexes --embeddings tmp/value.npy --output tmp/index_benchmark.json
+
+import json
+import os
+import tempfile
+import time
+from typing import NamedTuple
+
+import faiss
+import numpy as np
+
+from python.embeddings.ann_faiss import ADD_CHUNK_SIZE, normalized_copy, training_sample
+from python.embeddings.index_policy import ivf_lists
+from python.utils.logging import log
+
+
+class Candidate(NamedTuple):
+    # faiss index factory string, `{nlist}` is replaced like in index_policy
+    factory: str
+    search_parameters: dict[str, int]
+
+
+DEFAULT_CANDIDATES = [
+    Candidate("Flat", {}),
+    Candidate("IVF{nlist},Flat", {"nprobe": 8}),
+    Candidate("IVF{nlist},Flat", {"nprobe": 16}),
+    Candidate("IVF{nlist},Flat", {"nprobe": 32}),
+    Candidate("IVF{nlist},SQ8", {"nprobe": 16}),
+    Candidate("IVF{nlist},SQ8", {"nprobe": 32}),
+    Candidate("IVF{nlist},PQ64", {"nprobe": 32}),
+    Candidate("HNSW32", {"efSearch": 64}),
+    Candidate("HNSW32", {"efSearch": 128}),
+]
+
+
+def synthetic_embeddings(rows: int, dimensions=1536, clusters=100, seed=0) -> np.ndarray:
+    """
+    Vectors scattered around random centers. Real embeddings are far from uniformly distributed, and uniform random
+    data makes every approximate index look much worse than it is in practice.
+    """
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    assignments = rng.integers(0, clusters, rows)
+
+    return centers[assignments] + 0.5 * rng.standard_normal((rows, dimensions), dtype=np.float32)
+
+
+def query_set(data: np.ndarray, queries: int, seed=1) -> np.ndarray:
+    # perturbed copies of indexed vectors, a question is close to (but never exactly) the values it should match
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(data), min(queries, len(data)), replace=False))
+    sample = np.array(data[rows], dtype=np.float32)
+
+    return sample + 0.1 * sample.std() * rng.standard_normal(sample.shape, dtype=np.float32)
+
+
+def benchmark_indexes(
+    data: np.ndarray,
+    queries: np.ndarray,
+    k=10,
+    candidates: list[Candidate] | None = None,
+) -> dict:
+    """
+    Build every candidate from `data` and search it with `queries`, returns a JSON serializable report
+    """
+
+    rows, dimensions = data.shape
+    queries = normalized_copy(queries)
+
+    # the exact neighbours every candidate is measured against
+    exact = faiss.IndexFlatIP(dimensions)
+    add_normalized(exact, data)
+    _, expected = exact.search(queries, k)  # type: ignore
+    del exact
+
+    results = []
+    for candidate in candidates or DEFAULT_CANDIDATES:
+        factory = candidate.factory.format(nlist=ivf_lists(rows))
+        log.info("benchmarking index", factory=factory, search_parameters=candidate.search_parameters)
+
+        results.append(
+            {
+                "factory": factory,
+                "search_parameters": candidate.search_parameters,
+                **benchmark_index(data, queries, expected, k, factory, candidate.search_parameters),
+            }
+        )
+
+    return {"rows": rows, "dimensions": dimensions, "queries": len(queries), "k": k, "results": results}
+
+
+def benchmark_index(
+    data: np.ndarray, queries: np.ndarray, expected: np.ndarray, k: int, factory: str, search_parameters: dict[str, int]
+) -> dict:
+    resident_before = resident_bytes()
+    start = time.perf_counter()
+
+    index = faiss.index_factory(data.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(training_sample(data))  # type: ignore
+    add_normalized(index, data)
+
+    build_seconds = time.perf_counter() - start
+    resident_after = resident_bytes()
+
+    parameter_space = faiss.ParameterSpace()
+    for name, value in search_parameters.items():
+        parameter_space.set_index_parameter(index, name, value)
+
+    # one query at a time, like the ranker does
+    latencies = []
+    found = np.empty_like(expected)
+    for idx in range(len(queries)):
+        query_start = time.perf_counter()
+        _, found[idx : idx + 1] = index.search(queries[idx : idx + 1], k)  # type: ignore
+        latencies.append(time.perf_counter() - query_start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, "index.faiss")
+        faiss.write_index(index, index_path)
+        disk_bytes = os.path.getsize(index_path)
+
+    return {
+        f"recall_at_{k}": recall(found, expected),
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "build_seconds": build_seconds,
+        "disk_bytes": disk_bytes,
+        # rough in-memory size: how much the process grew while building (linux only), memory freed by the previous
+        # candidate can be reused so small indexes may report less than they use
+        "rss_growth_bytes": (
+            None if resident_before is None or resident_after is None else resident_after - resident_before
+        ),
+    }
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    # the fraction of the exact top-k that the index returned, in any order
+    hits = sum(len(np.intersect1d(found_row, expected_row)) for found_row, expected_row in zip(found, expected))
+    return hits / expected.size
+
+
+def add_normalized(index: faiss.Index, data: np.ndarray):
+    for start in range(0, len(data), ADD_CHUNK_SIZE):
+        index.add(normalized_copy(data[start : start + ADD_CHUNK_SIZE]))  # type: ignore
+
+
+def resident_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def write_report(report: dict, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
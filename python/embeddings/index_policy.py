@@ -0,0 +1,84 @@
+# Which faiss index type to build for an index, based on the index family (what the index points to) and its size.
+# Small indexes are searched exhaustively, brute force is fast enough and exact. Large value indexes dominate ranking
+# latency, so they move to an inverted file index, which only scans the `nprobe` closest lists at query time.
+#
+# The chosen factory string and search parameters are recorded next to the index (see AnnFaiss) so loading an index
+# restores the parameters it was built for.
+
+import math
+from typing import NamedTuple
+
+from decouple import config
+
+# index families, see python/embeddings/multi_ann_search.py for which index belongs to which family
+TABLE_FAMILY = "table"
+COLUMN_FAMILY = "column"
+VALUE_FAMILY = "value"
+QUESTION_FAMILY = "question"
+
+# upper bound on the number of IVF lists, so the training sample (see AnnFaiss) still has ~39 points per centroid
+MAX_IVF_LISTS = 2048
+
+
+class IndexTier(NamedTuple):
+    # the tier applies to indexes with at least this many rows
+    min_rows: int
+    # faiss index factory string, `{nlist}` is replaced by the number of IVF lists for the index size
+    factory: str
+    search_parameters: dict[str, int]
+
+
+class IndexPolicy(NamedTuple):
+    factory: str
+    search_parameters: dict[str, int]
+
+
+FLAT = [IndexTier(0, "Flat", {})]
+
+INDEX_TIERS: dict[str, list[IndexTier]] = {
+    # The training ranker uses the scores of every table and column, which only an exhaustive search returns. These
+    # indexes are sized by the number of tables and columns, so they are small anyway.
+    TABLE_FAMILY: FLAT,
+    COLUMN_FAMILY: FLAT,
+    VALUE_FAMILY: [
+        IndexTier(0, "Flat", {}),
+        IndexTier(50_000, "IVF{nlist},Flat", {"nprobe": 16}),
+        # 4x smaller than storing the raw floats, with a small loss in recall
+        IndexTier(1_000_000, "IVF{nlist},SQ8", {"nprobe": 32}),
+    ],
+    QUESTION_FAMILY: FLAT,
+}
+
+
+def index_policy(family: str, rows: int) -> IndexPolicy:
+    """
+    Pick the index type for an index of `rows` vectors. `FAISS_<FAMILY>_INDEX_FACTORY` (e.g. `HNSW32` or
+    `IVF{nlist},PQ64`) and `FAISS_<FAMILY>_SEARCH_PARAMETERS` (e.g. `efSearch=64`) override the tiers for a family.
+    """
+
+    override = config(f"FAISS_{family.upper()}_INDEX_FACTORY", default=None)
+    if override:
+        factory = override
+        search_parameters = parse_search_parameters(config(f"FAISS_{family.upper()}_SEARCH_PARAMETERS", default=""))
+    else:
+        tier = [tier for tier in INDEX_TIERS.get(family, FLAT) if rows >= tier.min_rows][-1]
+        factory, search_parameters = tier.factory, tier.search_parameters
+
+    return IndexPolicy(factory.format(nlist=ivf_lists(rows)), dict(search_parameters))
+
+
+def ivf_lists(rows: int) -> int:
+    # the usual rule of thumb is ~4 * sqrt(n) lists
+    return max(1, min(MAX_IVF_LISTS, int(4 * math.sqrt(rows))))
+
+
+def supports_removal(factory: str) -> bool:
+    # graph based indexes can't remove vectors, which incremental updates rely on
+    return "HNSW" not in factory and "NSG" not in factory
+
+
+def parse_search_parameters(parameters: str) -> dict[str, int]:
+    return {
+        name.strip(): int(value)
+        for name, value in (parameter.split("=") for parameter in parameters.split(",") if parameter.strip())
+    }
@@ -26,6 +26,13 @@ class MSMarcoEmbedder:
 
         return result
 
+    def encode_batch(self, contents: list[str]) -> np.ndarray:
+        result = self.model.encode(contents, convert_to_numpy=True)
+        if not isinstance(result, np.ndarray):
+            raise ValueError("Expected a numpy array of embeddings")
+
+        return result
+
     def test(self):
         # t1 = time.time()
         # for i in range(100):
@@ -0,0 +1,95 @@
+# Loads all of the embedding indexes for a data source and searches them with a single query embedding. The query is
+# normalized once and the faiss searches (which release the GIL) run concurrently rather than one after another.
+
+import atexit
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from decouple import config
+
+from python.embeddings.ann_faiss import normalize_query
+from python.embeddings.ann_search import AnnSearch, AnnSearchResults
+from python.utils.timings import timed
+
+# See docs/prompt_embeddings.md for info on index types. The order within each group matters: the rankers line
+# their weights up against it.
+
+# Table indexes (indexes that point to a table)
+TABLE_INDEX_NAMES = [
+    "table_name",
+    "table_and_all_column_names",
+    "table_and_all_column_names_and_all_values",
+]
+
+# Column indexes (indexes that point to a column)
+COLUMN_INDEX_NAMES = [
+    "column_name",
+    "table_and_column_name",
+    "column_name_and_all_values",
+    "table_and_column_name_and_all_values",
+]
+
+# Cell Values (index that point to a table+column+value)
+VALUE_INDEX_NAMES = [
+    "value",
+    "table_column_and_value",
+]
+
+INDEX_NAMES = TABLE_INDEX_NAMES + COLUMN_INDEX_NAMES + VALUE_INDEX_NAMES
+
+SearchResults = dict[str, AnnSearchResults]
+
+# shared across every searcher in the process, a ranker is created per data source (and per question when generating
+# datasets) so we don't want a pool per instance. A search mostly waits on faiss, which has threads of its own, so there
+# is no point in running more of them at once than there are cores.
+SEARCH_THREADS = config("FAISS_SEARCH_THREADS", default=min(len(INDEX_NAMES), os.cpu_count() or 1), cast=int)
+SEARCH_POOL: ThreadPoolExecutor | None = None
+SEARCH_POOL_LOCK = Lock()
+
+
+def _search_pool() -> ThreadPoolExecutor:
+    global SEARCH_POOL  # pylint: disable=global-statement
+
+    with SEARCH_POOL_LOCK:
+        if SEARCH_POOL is None:
+            SEARCH_POOL = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="ann-search")
+
+        return SEARCH_POOL
+
+
+@atexit.register
+def close_search_pool():
+    global SEARCH_POOL  # pylint: disable=global-statement
+
+    with SEARCH_POOL_LOCK:
+        pool, SEARCH_POOL = SEARCH_POOL, None
+
+    if pool is not None:
+        pool.shutdown()
+
+
+class MultiAnnSearch:
+    def __init__(self, path: str, index_names: list[str] | None = None):
+        if index_names is None:
+            index_names = INDEX_NAMES
+
+        self.indexes = {name: AnnSearch(f"{path}/{name}") for name in index_names}
+
+    @timed("index_search")
+    def search(self, embedding, number_of_matches: dict[str, int]) -> SearchResults:
+        """
+        Search each named index for the given number of matches, returns the hit list for each index by name
+        """
+
+        query = normalize_query(embedding)
+
+        def search_index(name: str):
+            return self.indexes[name].search(query, number_of_matches[name], normalized=True)
+
+        names = list(number_of_matches.keys())
+
+        # the error of a failed search is raised here, once the results get to it
+        results = _search_pool().map(search_index, names)
+
+        return dict(zip(names, results))
@@ -11,3 +11,10 @@ class OpenAIEmbedder:
         result = openai_throttled.embed(model="text-embedding-ada-002", input=content_str)
 
         return result
+
+    def encode_batch(self, contents: list[str]) -> np.ndarray:
+        log.debug("batch encoding with OpenAI", size=len(contents))
+
+        result = openai_throttled.embed(model="text-embedding-ada-002", input=contents)
+
+        return result
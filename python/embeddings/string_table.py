@@ -0,0 +1,53 @@
+# A compact, memory mappable table of strings. Every string is stored back to back in a single utf-8 blob, with an
+# offsets array pointing at the start of each one. Both arrays are plain .npy files so they can be loaded with
+# `mmap_mode`: loading is instant, nothing is unpickled onto the heap, and the pages are shared across processes.
+
+import numpy as np
+
+from python.utils.files import atomic_write
+
+
+class StringTable:
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        # len(strings) + 1 entries, string `i` is blob[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, strings: list[str]) -> "StringTable":
+        encoded = [string.encode("utf-8") for string in strings]
+
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded)))
+
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        return cls(blob, offsets)
+
+    @classmethod
+    def load(cls, path: str) -> "StringTable":
+        return cls(
+            np.load(path + ".blob.npy", mmap_mode="r"),
+            np.load(path + ".offsets.npy", mmap_mode="r"),
+        )
+
+    def save(self, path: str):
+        with atomic_write(path + ".blob.npy") as blob_path:
+            np.save(blob_path, self.blob)
+
+        with atomic_write(path + ".offsets.npy") as offsets_path:
+            np.save(offsets_path, self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def lengths(self, indexes: np.ndarray) -> np.ndarray:
+        """
+        Encoded length of many strings, without decoding them
+        """
+
+        return self.offsets[indexes + 1] - self.offsets[indexes]
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
@@ -0,0 +1,61 @@
+# Decides which cell values pulled from a column are worth an embedding. A column can have tens of thousands of
+# candidate values, so they are filtered as a batch: the cheap checks run first and the token entropy of everything
+# left is computed with a single batched encode.
+
+import re
+
+from python.utils.entropy import token_entropies
+
+# How long of a value do we create an embedding for?
+# TODO where are these limits documented in openai?
+MAX_FOR_SMALL_VALUE = 100
+
+TOKEN_ENTROPY_THRESHOLD = 2.0  # Anything less and this is probably a GUID or similar
+
+# For strings shorter than this, it's probably not a big hex string, it might be an actual word (eg.. dead beef)
+MIN_HEXADECIMAL_LENGTH = 20
+
+# a float or int (negative or positive)
+NUMBER_PATTERN = re.compile(r"^[-+]?(\d+\.\d*|\d*\.\d+|\d+)$")
+HEXADECIMAL_PATTERN = re.compile(r"^[#0-9a-fA-F]+$")
+
+
+def is_only_number(value: str) -> bool:
+    return bool(NUMBER_PATTERN.match(value))
+
+
+def is_hexadecimal(value: str) -> bool:
+    return bool(HEXADECIMAL_PATTERN.match(value))
+
+
+def is_candidate_value(value: str) -> bool:
+    if not value:
+        return False
+
+    # OpenAI indexes are a little weird when values are only numbers and we probably don't need to be matching against
+    # it in most cases anyway.
+    if is_only_number(value):
+        return False
+
+    # Big hex only values we should just skip
+    if len(value) >= MIN_HEXADECIMAL_LENGTH and is_hexadecimal(value):
+        return False
+
+    # We have 5 different indexes we are building (tables, columns, column values, etc)
+    # For larger indexes, we track shorter column values. Check out `docs/prompt_embeddings.md` for more
+    # TODO we could break the input into chunks and generate embedding for each chunk
+    return len(value) <= MAX_FOR_SMALL_VALUE
+
+
+def filter_values(values: list[str]) -> list[tuple[str, float]]:
+    """
+    The values which should be embedded, in their original order, along with their token entropy
+    """
+
+    candidates = [value for value in values if is_candidate_value(value)]
+
+    return [
+        (value, entropy)
+        for value, entropy in zip(candidates, token_entropies(candidates))
+        if entropy > TOKEN_ENTROPY_THRESHOLD
+    ]
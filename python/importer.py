@@ -3,25 +3,25 @@ from python.setup import log
 import json
 import re
 import typing as t
-from multiprocessing.pool import ThreadPool
 
-import query_runner
 import utils
+from decouple import config
 
 from python.embeddings.embedding_builder import EmbeddingBuilder
-from python.utils import sql
+from python.query_runner.information_schema import load_schema_metadata
+from python.query_runner.scheduler import QueryScheduler
+from python.utils import progress, sql
+from python.utils.progress import Progress
 
 from prisma.models import DataSource, DataSourceTableDescription
 from prisma.types import (
     DataSourceTableColumnCreateInput,
     DataSourceTableColumnUpdateInput,
-    DataSourceTableColumnWhereInput,
     DataSourceTableDescriptionCreateInput,
-    DataSourceTableDescriptionWhereInput,
 )
 
 # Imports the schema, and schema, metadata from the snowflake database to the local database.
-# on the SQL side, this mostly performs a bunch of describes & COUNTs
+# on the SQL side, this reads the INFORMATION_SCHEMA and runs a COUNT(DISTINCT ...) query per table
 
 SKIP_COLUMNS = [
     # some end with one `_`, some with two
@@ -40,9 +40,6 @@ SKIP_COLUMNS = [
 
 SKIP_TABLES = ["FIVETRAN_AUDIT", "^_AIRBYTE_", "_SCD$"]
 
-# TODO source this from the ENV?
-THREAD_POOL_SIZE = 20
-
 
 """
 Imports the schema and metadata from the snowflake database to the
@@ -94,8 +91,21 @@ MAX_LIMIT = 10_000
 
 
 class Importer:
-    def __init__(self, data_source_id: int, table_limit: int, column_limit: int, column_value_limit: int):
-        self.column_pool = ThreadPool(processes=THREAD_POOL_SIZE)
+    def __init__(
+        self,
+        data_source_id: int,
+        table_limit: int,
+        column_limit: int,
+        column_value_limit: int,
+        incremental: bool = False,
+        table_names: list[str] | None = None,
+        approximate_counts: bool = False,
+        import_progress: Progress | None = None,
+        resume: bool = False,
+    ):
+        if table_names and not incremental:
+            raise ValueError("only an incremental import can be limited to some tables")
+
         self.limits = {
             "table": table_limit or MAX_LIMIT,
             "column": column_limit or MAX_LIMIT,
@@ -112,22 +122,41 @@ class Importer:
         if data_source is None:
             raise RuntimeError("data source not found")
 
-        self.embedding_builder = EmbeddingBuilder(data_source)
+        # In incremental mode the existing indexes are updated in place and only the tables in `table_names` (or all
+        # tables, if none are given) are re-indexed. Otherwise all indexes are rebuilt from scratch.
+        self.incremental = incremental
+        self.table_names = [name.upper() for name in table_names] if table_names else None
+        # APPROX_COUNT_DISTINCT instead of COUNT(DISTINCT) for the column statistics
+        self.approximate_counts = approximate_counts
+
+        # counters and timers for every stage of the import, written to `import_summary.json` next to the indexes
+        self.progress = import_progress or Progress()
+
+        with progress.track(self.progress):
+            # metadata queries go through the scheduler, which caps how many queries (these and the value extraction
+            # queries) run against the warehouse at once
+            self.scheduler = QueryScheduler(data_source)
+
+            # when resuming, tables the last run got all the way through are picked up from its checkpoint
+            self.embedding_builder = EmbeddingBuilder(data_source, incremental=incremental, resume=resume)
 
-        self.create_table_records(data_source)
+            self.create_table_records(data_source)
 
-        # Save embedding indexes to the file system, this must be done in one fell swoop due to how the
-        # embeddings indexes are generated. This cannot be done incrementally.
-        self.embedding_builder.write_indexes_to_disk()
+            # Save embedding indexes to the file system. On a full import this builds every index in one fell swoop,
+            # in incremental mode only the changed vectors are written.
+            self.embedding_builder.write_indexes_to_disk()
+
+            self.scheduler.shutdown()
+
+        summary_path = f"{config('FAISS_INDEXES_PATH')}/{data_source.id}/import_summary.json"
+        self.progress.write_summary(summary_path)
+        log.info("import complete", summary=summary_path, **self.progress.snapshot()["counters"])
 
     def create_table_records(self, data_source: DataSource) -> None:
-        # TODO this will create a new cursor each time, we should use a single cursor for this script
-        table_list = query_runner.run_query(
-            data_source_id=data_source.id,
-            sql=f"SHOW TABLES LIMIT {self.limits['table']}",
-            disable_query_protections=True,
-            allow_cached_queries=True,
-        )
+        # every table and column in the schema comes from two INFORMATION_SCHEMA queries, instead of a SHOW TABLES
+        # plus a DESCRIBE TABLE for each table
+        schema_metadata = load_schema_metadata(self.scheduler.run, self.limits["table"])
+        table_list = schema_metadata.tables
 
         # TODO so terrible, refact when we settled on a functional lib
         tables_with_content = []
@@ -146,51 +175,83 @@ class Importer:
 
         log.info("inspecting tables", table_count=len(tables_with_content))
 
+        selected_tables = []
         for table in tables_with_content:
             # TODO this is really confusing syntax, if we can land on a functional lib for python we should replace this
             if any(re.search(regex, table["name"]) for regex in SKIP_TABLES):
                 log.debug("skipping table", table=table)
+            elif self.table_names is not None and table["name"].upper() not in self.table_names:
+                log.debug("skipping table, not selected for import", table=table["name"])
+            elif fqn_from_table_description(table) in self.embedding_builder.completed_tables:
+                log.debug("skipping table, imported before the import was resumed", table=table["name"])
+                self.progress.increment("tables_resumed")
             else:
-                self.create_table_record(data_source, table)
+                selected_tables.append(table)
 
-    def create_table_record(self, data_source: DataSource, table: SnowflakeTableDescription):
-        fqn = fqn_from_table_description(table)
-        log.debug("creating local table record", fqn=fqn)
+        self.progress.set_total("tables", len(selected_tables))
 
-        table_locator = DataSourceTableDescriptionWhereInput(
-            **{
-                "dataSourceId": data_source.id,
-                "fullyQualifiedName": fqn,
-            }
+        table_descriptions = self.create_table_description_records(
+            data_source, [fqn_from_table_description(table) for table in selected_tables]
+        )
+
+        for table in selected_tables:
+            columns = t.cast(list[SnowflakeColumnDescription], schema_metadata.columns.get(table["name"], []))
+            self.create_table_record(table_descriptions[fqn_from_table_description(table)], columns)
+
+    def create_table_description_records(
+        self, data_source: DataSource, fqns: list[str]
+    ) -> dict[str, DataSourceTableDescription]:
+        """
+        Table records for every given FQN by FQN, the missing ones are created in a single insert
+        """
+
+        existing = self.db.datasourcetabledescription.find_many(
+            where={"dataSourceId": data_source.id, "fullyQualifiedName": {"in": fqns}}
         )
+        existing_fqns = {table_description.fullyQualifiedName for table_description in existing}
+
+        missing = [
+            DataSourceTableDescriptionCreateInput(dataSourceId=data_source.id, fullyQualifiedName=fqn)
+            for fqn in dict.fromkeys(fqns)
+            if fqn not in existing_fqns
+        ]
+
+        if missing:
+            log.debug("creating local table records", count=len(missing))
 
-        # Still can't believe you can't unique query on a compound index in prisma!
-        table_description = self.db.datasourcetabledescription.find_first(where=table_locator)
+            with self.progress.timer("database_writes"):
+                # `skip_duplicates` in case another import of the same data source created some of them in the meantime
+                self.db.datasourcetabledescription.create_many(data=missing, skip_duplicates=True)
 
-        if not table_description:
-            # TODO this isn't great, but typedicts aren't great either...
-            table_locator = t.cast(DataSourceTableDescriptionCreateInput, table_locator)
-            table_description = self.db.datasourcetabledescription.create(data=table_locator)
+                # create_many does not return the records, the new ids are needed for the column records
+                existing = self.db.datasourcetabledescription.find_many(
+                    where={"dataSourceId": data_source.id, "fullyQualifiedName": {"in": fqns}}
+                )
 
-        self.create_column_records(data_source, table_description)
+        return {table_description.fullyQualifiedName: table_description for table_description in existing}
+
+    def create_table_record(
+        self, table_description: DataSourceTableDescription, columns: list[SnowflakeColumnDescription]
+    ):
+        fqn = table_description.fullyQualifiedName
+        log.debug("inspecting table", fqn=fqn)
+
+        if self.incremental:
+            # the table is being re-indexed, drop its old vectors from the existing indexes
+            self.embedding_builder.remove_table(table_description.id)
+
+        self.create_column_records(table_description, columns)
 
         # this is an expensive operation, does a full table scan for each column in
         self.embedding_builder.add_table(
             fqn, column_limit=self.limits["column"], column_value_limit=self.limits["column_value"]
         )
 
-    def create_column_records(self, data_source: DataSource, table_description: DataSourceTableDescription):
-        row_count = self.get_total_rows(data_source, table_description)
-
-        raw_column_list = query_runner.run_query(
-            data_source.id,
-            f"""
-            DESCRIBE TABLE {sql.normalize_fqn_quoting(table_description.fullyQualifiedName)}
-            """,
-            disable_query_protections=True,
-            allow_cached_queries=True,
-        )
-
+    def create_column_records(
+        self,
+        table_description: DataSourceTableDescription,
+        raw_column_list: list[SnowflakeColumnDescription],
+    ):
         log.info(
             "inspecting columns",
             table_name=sql.unqualified_table_name(table_description.fullyQualifiedName),
@@ -198,45 +259,43 @@ class Importer:
             limit=self.limits["column"],
         )
 
-        futures = [
-            self.column_pool.apply_async(
-                self.create_column_record, args=(data_source, table_description, column, row_count)
-            )
-            # result is not important, otherwise we would `async_task.get()`
+        columns = [
+            column
             for column in raw_column_list[0 : self.limits["column"]]
+            if not any(re.search(regex, column["name"]) for regex in SKIP_COLUMNS)
         ]
 
-        # TODO what is the default timeout of `get`?
-        # Wait for futures to finish
-        [future.get() for future in futures]
+        # the row count and every distinct count come from a single scan of the table, instead of one per column
+        statistics = self.scheduler.column_statistics(
+            table_description.fullyQualifiedName,
+            [column["name"] for column in columns],
+            approximate=self.approximate_counts,
+        )
 
-    # TODO a better approach here would be to use the INFORMATION_SCHEMA of the database to get the row count
-    def get_total_rows(self, data_source: DataSource, table_description: DataSourceTableDescription) -> int:
-        raw_sql = f"""
-        SELECT COUNT(*) as COUNT
-        FROM {sql.normalize_fqn_quoting(table_description.fullyQualifiedName)}
-        """
+        payloads = [
+            self.column_record_payload(
+                table_description,
+                column,
+                statistics.row_count,
+                statistics.distinct_counts[column["name"]],
+            )
+            for column in columns
+        ]
 
-        counts = query_runner.run_query(
-            data_source.id, raw_sql, disable_query_protections=True, allow_cached_queries=True
-        )
+        with self.progress.timer("database_writes"):
+            self.save_column_records(table_description, payloads)
 
-        # TODO this will throw an error if there's an upstream issue, which is what we want for now
-        return counts[0]["COUNT"]
+        self.progress.increment("columns", len(payloads))
 
-    def create_column_record(
+    def column_record_payload(
         self,
-        data_source: DataSource,
         table_description: DataSourceTableDescription,
         column: SnowflakeColumnDescription,
         row_count: int,
-    ) -> None:
+        distinct_row_count: int,
+    ) -> DataSourceTableColumnCreateInput:
         name = column["name"]
 
-        if any(re.search(regex, name) for regex in SKIP_COLUMNS):
-            log.debug("skipping column", column=name)
-            return
-
         log.info(
             "inspecting column",
             table_name=sql.unqualified_table_name(table_description.fullyQualifiedName),
@@ -245,63 +304,61 @@ class Importer:
             column=name,
         )
 
-        # since we are in a thread pool, we want to use a unique cursor to avoid any state issues
-        # by default the query runner uses a unique cursor per query
-
-        distinct_row_count = self.get_unique_row_count(data_source, table_description, name)
-
-        column_external_id_locator = DataSourceTableColumnWhereInput(
-            **{"dataSourceTableDescriptionId": table_description.id, "name": name}
-        )
-
         # TODO this is terrible, but do are typedicts
-        column_description_payload = DataSourceTableColumnCreateInput(
-            **(
-                # TODO if there's a way around this, please please please do it
-                t.cast(dict, column_external_id_locator)
-                | {
-                    "dataSourceId": data_source.id,
-                    "type": column["type"],
-                    "kind": column["kind"],
-                    "isNull": column["null?"] == "Y",
-                    "default": column["default"],
-                    "distinctRows": distinct_row_count,
-                    # TODO ideally, this should not be passed here and already added upstream
-                    "rows": row_count,
-                    "extendedProperties": json.dumps(
-                        # TODO are there any other properties from snowflake?
-                        {
-                            "comment": column["comment"],
-                        }
-                    ),
-                }
-            )
+        return DataSourceTableColumnCreateInput(
+            **{
+                "dataSourceTableDescriptionId": table_description.id,
+                "name": name,
+                "dataSourceId": table_description.dataSourceId,
+                "type": column["type"],
+                "kind": column["kind"],
+                "isNull": column["null?"] == "Y",
+                "default": column["default"],
+                "distinctRows": distinct_row_count,
+                # TODO ideally, this should not be passed here and already added upstream
+                "rows": row_count,
+                "extendedProperties": json.dumps(
+                    # TODO are there any other properties from snowflake?
+                    {
+                        "comment": column["comment"],
+                    }
+                ),
+            }
         )
 
-        # TODO I hope we can use upsert here instead...
-        table_column = self.db.datasourcetablecolumn.find_first(where=column_external_id_locator)
+    def save_column_records(
+        self, table_description: DataSourceTableDescription, payloads: list[DataSourceTableColumnCreateInput]
+    ) -> None:
+        """
+        Writes all column records of a table in one transaction: a single insert for the new columns and a batch of
+        updates for the ones which already exist, instead of a find + create/update round trip per column.
+        """
 
-        if table_column:
-            log.debug("updating column record", column=name)
-            column_description_payload = t.cast(DataSourceTableColumnUpdateInput, column_description_payload)
-            self.db.datasourcetablecolumn.update(data=column_description_payload, where={"id": table_column.id})
-        else:
-            self.db.datasourcetablecolumn.create(data=column_description_payload)
+        # prisma can't upsert on a non-unique (table, name) pair, so match the existing records up front
+        existing_ids = {
+            table_column.name: table_column.id
+            for table_column in self.db.datasourcetablecolumn.find_many(
+                where={"dataSourceTableDescriptionId": table_description.id}
+            )
+        }
 
-    def get_unique_row_count(
-        self, data_source: DataSource, table_description: DataSourceTableDescription, column_name: str
-    ):
-        # TODO I imagine this has to do a full table scan as well
-        #      we should try to figure ouw how much these queries cost
-        raw_sql = f"""
-        SELECT COUNT(DISTINCT({sql.normalize_fqn_quoting(table_description.fullyQualifiedName)}.{sql.normalize_fqn_quoting(column_name)})) as count
-        FROM {sql.normalize_fqn_quoting(table_description.fullyQualifiedName)}
-        """
+        new_payloads = [payload for payload in payloads if payload["name"] not in existing_ids]
+        updated_payloads = [payload for payload in payloads if payload["name"] in existing_ids]
 
-        # Gets the distinct rows for the column and the total rows
-        counts = query_runner.run_query(
-            data_source.id, raw_sql, disable_query_protections=True, allow_cached_queries=True
+        log.debug(
+            "saving column records",
+            table_name=sql.unqualified_table_name(table_description.fullyQualifiedName),
+            created=len(new_payloads),
+            updated=len(updated_payloads),
         )
 
-        # TODO this will break if the upstream breaks, this is intentional for now
-        return counts[0]["COUNT"]
+        # the batch is sent as a single transaction when the block exits
+        with self.db.batch_() as batcher:
+            if new_payloads:
+                batcher.datasourcetablecolumn.create_many(data=new_payloads)
+
+            for payload in updated_payloads:
+                batcher.datasourcetablecolumn.update(
+                    data=t.cast(DataSourceTableColumnUpdateInput, payload),
+                    where={"id": existing_ids[payload["name"]]},
+                )
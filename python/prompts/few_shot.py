@@ -7,6 +7,7 @@ from python.schema.simple_schema_builder import build_simple_schema
 from python.sql.sql_parser import SqlParser
 from python.utils.db import application_database_connection
 from python.utils.indexes_and_models import application_indexes_and_models
+from python.utils.timings import timed
 
 db = application_database_connection()
 indexes_and_models = application_indexes_and_models()
@@ -37,6 +38,7 @@ class FewShot:
         self.question_prefix = question_prefix
         self.is_chat = is_chat
 
+    @timed("few_shot")
     def generate(self, current_question: str) -> tuple[list[str], list[str], list[ElementRank]]:
         # Find similar questions to use as few shot examples
         ids = indexes_and_models.few_shot(self.data_source_id).search(current_question, 3)
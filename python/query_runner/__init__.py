@@ -1,60 +1,182 @@
-import pickle
+import time
 
 import xxhash
+from decouple import config
+from redis.exceptions import RedisError
 
-from python.utils.db import application_database_connection
+from python.utils import progress
 from python.utils.logging import log
+from python.utils.metrics import QUERY_CACHE_REQUESTS, SNOWFLAKE_QUERY_SECONDS
 from python.utils.redis import application_redis_connection
+from python.utils.single_flight import SingleFlight
 
 from prisma.enums import DataSourceType
+from prisma.models import DataSource
 
+from .data_sources import get_data_source
+from .query_result import QueryResult
 from .snowflake import run_snowflake_query
 
 redis = application_redis_connection()
 
+# results bigger than this (encoded and compressed) are not worth keeping in redis
+QUERY_CACHE_MAX_BYTES = config("QUERY_CACHE_MAX_BYTES", default=8 * 1024 * 1024, cast=int)
+
+# Identical queries running at the same time are only sent to the warehouse once. Within a process callers wait on
+# the query already in flight, across processes the process holding the lock runs the query and the others poll the
+# cache for its result. The lock outlives the statement timeout, so a crashed process doesn't block anyone for long.
+QUERY_FLIGHTS: SingleFlight[str, QueryResult] = SingleFlight()
+QUERY_LOCK_TIMEOUT_SECONDS = 60
+QUERY_LOCK_POLL_SECONDS = 0.1
+
 
 def _query_cache_key(data_source_id: int, sql: str) -> str:
     hashed_sql = xxhash.xxh64(sql).hexdigest()
     return f"query-cache-{data_source_id}-{hashed_sql}"
 
 
-def _cached_query_result(data_source_id: int, sql: str) -> None | list[dict]:
+def _cached_query_result(data_source_id: int, sql: str) -> None | QueryResult:
     cache_key = _query_cache_key(data_source_id, sql)
     cached_query_result = redis.get(cache_key)
 
     if cached_query_result:
         log.debug("query cache hit")
-        return pickle.loads(cached_query_result)
+        return QueryResult.decode(cached_query_result)
 
     return None
 
 
-def _cache_query_result(data_source_id: int, sql: str, result: list[dict]):
+def _cache_query_result(data_source_id: int, sql: str, result: list[dict] | QueryResult):
+    if isinstance(result, list):
+        result = QueryResult(rows=result)
+
+    encoded_result = result.encode()
+    if len(encoded_result) > QUERY_CACHE_MAX_BYTES:
+        log.debug("query result too large to cache", size=len(encoded_result), rows=len(result))
+        return
+
     # TODO we need to wrap all redis calls in a protection block like this
     try:
         redis.setex(
             _query_cache_key(data_source_id, sql),
             # 48hr is completely arbitrary and is geared towards the import script
             60 * 60 * 24 * 2,
-            # TODO since the result is returned as JSON, shouldn't we be able to store it as JSON?
-            pickle.dumps(result),
+            encoded_result,
         )
     except Exception as e:
         log.error("failed to cache query result: " + str(e))
 
 
-# TODO allow data_source record to be passed in
-def run_query(data_source_id: int, sql: str, allow_cached_queries=False, **kwargs) -> list[dict]:
-    db = application_database_connection()
+def run_query(data_source: int | DataSource, sql: str, allow_cached_queries=False, **kwargs) -> list[dict]:
+    """
+    `data_source` is either a record the caller already has, or an id which is resolved through the in-process
+    registry, and only when the result isn't cached
+    """
+
+    return run_query_columnar(data_source, sql, allow_cached_queries=allow_cached_queries, **kwargs).rows()
+
+
+def run_query_columnar(data_source: int | DataSource, sql: str, allow_cached_queries=False, **kwargs) -> QueryResult:
+    """
+    Same as `run_query`, but a cached result is returned as is: row dicts are only built when they are iterated over
+    """
+
+    data_source_id = data_source if isinstance(data_source, int) else data_source.id
+    progress.increment("queries")
+
+    if allow_cached_queries:
+        if (cached_result := _cached_query_result(data_source_id, sql)) is not None:
+            progress.increment("query_cache_hits")
+            QUERY_CACHE_REQUESTS.inc(result="hit")
+            return cached_result
+
+        QUERY_CACHE_REQUESTS.inc(result="miss")
+
+    # kwargs (e.g. disable_query_protections) change the query that is actually sent, and only callers which accept a
+    # cached result can be handed a result another process cached
+    flight_key = (
+        _query_cache_key(data_source_id, sql) + repr(sorted(kwargs.items())) + f"-cached={allow_cached_queries}"
+    )
+
+    result = QUERY_FLIGHTS.do(
+        flight_key, lambda: _run_query_once(data_source, data_source_id, sql, allow_cached_queries, **kwargs)
+    )
+
+    # every caller in the flight gets the same result, each gets rows of its own
+    return result.copy()
+
+
+def _run_query_once(
+    data_source: int | DataSource, data_source_id: int, sql: str, allow_cached_queries: bool, **kwargs
+) -> QueryResult:
+    # only cached results can be shared with other processes
+    if not allow_cached_queries:
+        return _execute_query(data_source, data_source_id, sql, allow_cached_queries, **kwargs)
+
+    lock = redis.lock(f"{_query_cache_key(data_source_id, sql)}-lock", timeout=QUERY_LOCK_TIMEOUT_SECONDS)
 
-    data_source = db.datasource.find_first(where={"id": data_source_id})
-    assert data_source is not None
+    try:
+        is_leader = lock.acquire(blocking=False)
+    except RedisError as e:
+        log.error("failed to acquire query lock: " + str(e))
+        return _execute_query(data_source, data_source_id, sql, allow_cached_queries, **kwargs)
 
-    if allow_cached_queries and (cached_result := _cached_query_result(data_source_id, sql)):
+    if not is_leader and (cached_result := _wait_for_cached_query_result(data_source_id, sql, lock)) is not None:
         return cached_result
 
+    try:
+        return _execute_query(data_source, data_source_id, sql, allow_cached_queries, **kwargs)
+    finally:
+        if is_leader:
+            try:
+                lock.release()
+            except RedisError as e:
+                # the lock expired while the query ran, someone else may have run it as well
+                log.warning("failed to release query lock: " + str(e))
+
+
+def _wait_for_cached_query_result(data_source_id: int, sql: str, lock) -> None | QueryResult:
+    """
+    Wait for another process running the same query. Returns None when it finished without caching a result (the
+    query failed, or the result was too large), in which case the caller runs the query itself.
+    """
+
+    log.debug("waiting for the same query running in another process")
+    deadline = time.monotonic() + QUERY_LOCK_TIMEOUT_SECONDS
+
+    try:
+        while time.monotonic() < deadline:
+            if (cached_result := _cached_query_result(data_source_id, sql)) is not None:
+                return cached_result
+
+            if not lock.locked():
+                # the result may have been cached right before the lock was released
+                return _cached_query_result(data_source_id, sql)
+
+            time.sleep(QUERY_LOCK_POLL_SECONDS)
+    except RedisError as e:
+        log.error("failed to wait for query result: " + str(e))
+
+    return None
+
+
+def _execute_query(
+    data_source: int | DataSource, data_source_id: int, sql: str, allow_cached_queries: bool, **kwargs
+) -> QueryResult:
+    if isinstance(data_source, int):
+        data_source = get_data_source(data_source)
+
     if data_source.type == DataSourceType.SNOWFLAKE:
-        result = run_snowflake_query(data_source, sql, **kwargs)
+        status = "error"
+        start = time.perf_counter()
+
+        try:
+            with progress.timer("warehouse_queries"):
+                result = QueryResult(rows=run_snowflake_query(data_source, sql, **kwargs))
+
+            status = "success"
+        finally:
+            SNOWFLAKE_QUERY_SECONDS.observe(time.perf_counter() - start, status=status)
 
         if allow_cached_queries:
             _cache_query_result(data_source_id, sql, result)
@@ -0,0 +1,75 @@
+# The most common values of every string column in a table, from a single scan: the columns are UNPIVOTed into
+# (column, value) pairs which are counted together, instead of a GROUP BY query (and a full table scan) per column.
+# Large tables are sampled, the most common values of a column show up in a sample just as well.
+
+import typing as t
+
+from decouple import config
+
+from python.utils import sql
+
+# tables with more rows than this are sampled down to about this many rows
+VALUE_SAMPLE_ROWS = config("IMPORT_VALUE_SAMPLE_ROWS", default=1_000_000, cast=int)
+
+# past this many times the sample size, fixed size row sampling (which still reads the whole table) is replaced with
+# block sampling, which only reads the sampled micro-partitions
+BLOCK_SAMPLE_FACTOR = 100
+
+# block samples are seeded so the query text, and the cached result, is stable across imports
+SAMPLE_SEED = 0
+
+
+def sample_clause(row_count: int | None, sample_rows: int = VALUE_SAMPLE_ROWS) -> str:
+    if not row_count or row_count <= sample_rows:
+        return ""
+
+    if row_count <= sample_rows * BLOCK_SAMPLE_FACTOR:
+        return f"SAMPLE ({sample_rows} ROWS)"
+
+    percent = 100 * sample_rows / row_count
+    return f"SAMPLE SYSTEM ({percent:.6f}) SEED ({SAMPLE_SEED})"
+
+
+def column_values_sql(
+    table_fqn: str, column_names: list[str], limit: int, row_count: int | None = None, sample_rows=VALUE_SAMPLE_ROWS
+) -> str:
+    # columns are aliased by position, column names can contain anything. Every column is cast to VARCHAR since
+    # UNPIVOT needs a single type, and UNPIVOT drops NULLs
+    projections = [f'{sql.quote_identifier(name)}::VARCHAR AS "VALUE_{idx}"' for idx, name in enumerate(column_names)]
+    aliases = [f'"VALUE_{idx}"' for idx in range(len(column_names))]
+
+    return f"""
+        WITH sampled AS (
+            SELECT {", ".join(projections)}
+            FROM {sql.normalize_fqn_quoting(table_fqn)} {sample_clause(row_count, sample_rows)}
+        )
+        SELECT COLUMN_NAME, VALUE, COUNT(*) AS COUNT
+        FROM sampled UNPIVOT (VALUE FOR COLUMN_NAME IN ({", ".join(aliases)}))
+        GROUP BY COLUMN_NAME, VALUE
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY COLUMN_NAME ORDER BY COUNT(*) DESC) <= {limit}
+        ORDER BY COLUMN_NAME, COUNT DESC
+        """
+
+
+def load_column_values(
+    run: t.Callable[[str], list[dict]],
+    table_fqn: str,
+    column_names: list[str],
+    limit: int,
+    row_count: int | None = None,
+) -> dict[str, list[str]]:
+    """
+    Up to `limit` of the most common values of each column, most common first
+    """
+
+    values: dict[str, list[str]] = {name: [] for name in column_names}
+
+    if not column_names:
+        return values
+
+    for row in run(column_values_sql(table_fqn, column_names, limit, row_count)):
+        # UNPIVOT reports the alias, VALUE_<position>
+        name = column_names[int(row["COLUMN_NAME"].rsplit("_", 1)[1])]
+        values[name].append(row["VALUE"])
+
+    return values
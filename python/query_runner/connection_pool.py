@@ -0,0 +1,166 @@
+# A small thread safe connection pool. Opening a warehouse connection means a full login handshake plus the session
+# setup statements, which costs far more than most of the queries we run (the importer runs thousands of tiny
+# COUNT/GROUP BY queries from many threads), so connections are kept around and handed out again.
+
+import time
+import typing as t
+from contextlib import contextmanager
+from threading import Condition
+
+from python.utils.logging import log
+
+Connection = t.TypeVar("Connection")
+
+
+class PooledConnection(t.Generic[Connection]):
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool(t.Generic[Connection]):
+    def __init__(
+        self,
+        connect: t.Callable[[], Connection],
+        close: t.Callable[[Connection], None],
+        is_healthy: t.Callable[[Connection], bool],
+        max_size=20,
+        max_idle_seconds=300.0,
+        health_check_after_seconds=60.0,
+        checkout_timeout_seconds=60.0,
+    ):
+        """
+        `connect` opens a connection with its session already set up. Idle connections are closed after
+        `max_idle_seconds`, and `is_healthy` is checked before handing out a connection that has been idle for longer
+        than `health_check_after_seconds`.
+        """
+
+        self._connect = connect
+        self._close = close
+        self._is_healthy = is_healthy
+
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_after_seconds = health_check_after_seconds
+        self.checkout_timeout_seconds = checkout_timeout_seconds
+
+        # most recently used last, connections are reused LIFO so the rest can go idle and get evicted
+        self._idle: list[PooledConnection[Connection]] = []
+        # idle + checked out + being opened
+        self._size = 0
+        self._closed = False
+        self._condition = Condition()
+
+    @contextmanager
+    def connection(self) -> t.Iterator[Connection]:
+        pooled = self._checkout()
+        healthy = True
+
+        try:
+            yield pooled.connection
+        except Exception:
+            # the connection might be what failed, don't hand it out again without checking it
+            healthy = self._is_healthy(pooled.connection)
+            raise
+        finally:
+            self._checkin(pooled, healthy)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+    def _checkout(self) -> PooledConnection[Connection]:
+        deadline = time.monotonic() + self.checkout_timeout_seconds
+
+        while True:
+            evicted = []
+            pooled = None
+
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+
+                evicted = self._evict_idle()
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif self._size < self.max_size:
+                    # reserve the slot, the connection is opened outside of the lock
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"no connection available after {self.checkout_timeout_seconds}s")
+
+                    self._condition.wait(remaining)
+                    continue
+
+            for stale in evicted:
+                self._discard(stale)
+
+            if pooled is None:
+                return self._open()
+
+            if time.monotonic() - pooled.last_used_at < self.health_check_after_seconds or self._is_healthy(
+                pooled.connection
+            ):
+                return pooled
+
+            log.info("dropping unhealthy pooled connection")
+            self._release_slot()
+            self._discard(pooled)
+
+    def _open(self) -> PooledConnection[Connection]:
+        try:
+            return PooledConnection(self._connect())
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _checkin(self, pooled: PooledConnection[Connection], healthy: bool):
+        pooled.last_used_at = time.monotonic()
+
+        with self._condition:
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append(pooled)
+            else:
+                self._size -= 1
+
+            self._condition.notify()
+
+        if not keep:
+            self._discard(pooled)
+
+    def _evict_idle(self) -> list[PooledConnection[Connection]]:
+        # called with the lock held, the oldest idle connections are at the front
+        now = time.monotonic()
+        evicted = []
+
+        while self._idle and now - self._idle[0].last_used_at > self.max_idle_seconds:
+            evicted.append(self._idle.pop(0))
+            self._size -= 1
+
+        return evicted
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _discard(self, pooled: PooledConnection[Connection]):
+        try:
+            self._close(pooled.connection)
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning("failed to close pooled connection: " + str(e))
@@ -0,0 +1,49 @@
+# In-process registry of DataSource records. Running a query needs the data source (type and credentials) but the
+# record almost never changes, so it's kept in memory for a while instead of fetched from postgres for every query.
+#
+# Data sources are edited by the web app, which doesn't tell this process about it: an edited data source is picked up
+# once its entry expires (DATA_SOURCE_TTL_SECONDS), a deleted one keeps working until then.
+
+import time
+from threading import Lock
+
+from decouple import config
+
+from python.utils.db import application_database_connection
+
+from prisma.models import DataSource
+
+# the web app can update credentials at any time, this is how long it takes for this process to pick them up
+DATA_SOURCE_TTL_SECONDS = config("DATA_SOURCE_TTL_SECONDS", default=300, cast=float)
+
+
+class DataSourceRegistry:
+    def __init__(self, ttl_seconds: float = DATA_SOURCE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._data_sources: dict[int, tuple[float, DataSource]] = {}
+        self._lock = Lock()
+
+    def get(self, data_source_id: int) -> DataSource:
+        with self._lock:
+            entry = self._data_sources.get(data_source_id)
+
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+
+        data_source = application_database_connection().datasource.find_first(where={"id": data_source_id})
+        if data_source is None:
+            raise LookupError(f"Unknown data source: {data_source_id}")
+
+        self.put(data_source)
+        return data_source
+
+    def put(self, data_source: DataSource):
+        with self._lock:
+            self._data_sources[data_source.id] = (time.monotonic(), data_source)
+
+
+DATA_SOURCES = DataSourceRegistry()
+
+
+def get_data_source(data_source_id: int) -> DataSource:
+    return DATA_SOURCES.get(data_source_id)
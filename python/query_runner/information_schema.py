@@ -0,0 +1,91 @@
+# Schema metadata for a whole snowflake schema in two queries: every table (with its cached row count) from
+# INFORMATION_SCHEMA.TABLES and every column from INFORMATION_SCHEMA.COLUMNS. The rows are returned in the same shape
+# as `SHOW TABLES` and `DESCRIBE TABLE` results, which the importer was built around.
+
+import typing as t
+
+# the schema the data source connection is set to use (see `connect_to_snowflake`)
+TABLES_SQL = """
+    SELECT TABLE_CATALOG, TABLE_SCHEMA, TABLE_NAME, ROW_COUNT, BYTES, COMMENT, CREATED
+    FROM INFORMATION_SCHEMA.TABLES
+    WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_TYPE = 'BASE TABLE'
+    ORDER BY TABLE_NAME
+    LIMIT {limit}
+"""
+
+COLUMNS_SQL = """
+    SELECT
+        TABLE_NAME, COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE,
+        DATETIME_PRECISION, IS_NULLABLE, COLUMN_DEFAULT, COMMENT
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = CURRENT_SCHEMA()
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# DATA_TYPE uses synonyms for some types, DESCRIBE reports the underlying type
+DATA_TYPE_NAMES = {"TEXT": "VARCHAR"}
+
+# the timestamp/time types DESCRIBE reports with their precision, e.g. TIMESTAMP_NTZ(9)
+DATETIME_TYPES = ["TIME", "TIMESTAMP_LTZ", "TIMESTAMP_NTZ", "TIMESTAMP_TZ"]
+
+
+class SchemaMetadata(t.NamedTuple):
+    # `SHOW TABLES` shaped rows
+    tables: list[dict]
+    # `DESCRIBE TABLE` shaped rows by table name, in column order
+    columns: dict[str, list[dict]]
+
+
+def load_schema_metadata(run: t.Callable[[str], list[dict]], table_limit: int) -> SchemaMetadata:
+    tables = [table_description(row) for row in run(TABLES_SQL.format(limit=table_limit))]
+
+    columns: dict[str, list[dict]] = {}
+    for row in run(COLUMNS_SQL):
+        columns.setdefault(row["TABLE_NAME"], []).append(column_description(row))
+
+    return SchemaMetadata(tables, columns)
+
+
+def table_description(row: dict) -> dict:
+    return {
+        "name": row["TABLE_NAME"],
+        "database_name": row["TABLE_CATALOG"],
+        "schema_name": row["TABLE_SCHEMA"],
+        "kind": "TABLE",
+        # the row count is maintained by snowflake, no need to scan the table
+        "rows": row["ROW_COUNT"],
+        "bytes": row["BYTES"],
+        "comment": row["COMMENT"],
+        "created_on": row["CREATED"],
+    }
+
+
+def column_description(row: dict) -> dict:
+    return {
+        "name": row["COLUMN_NAME"],
+        "type": describe_type(row),
+        "kind": "COLUMN",
+        "null?": "Y" if row["IS_NULLABLE"] == "YES" else "N",
+        "default": row["COLUMN_DEFAULT"],
+        "comment": row["COMMENT"],
+    }
+
+
+def describe_type(row: dict) -> str:
+    """
+    The column type as `DESCRIBE TABLE` reports it (e.g. VARCHAR(16777216), NUMBER(38,0), TIMESTAMP_NTZ(9)), the
+    schema builder and the embedding builder match on these
+    """
+
+    data_type = DATA_TYPE_NAMES.get(row["DATA_TYPE"], row["DATA_TYPE"])
+
+    if data_type in ("VARCHAR", "BINARY") and row["CHARACTER_MAXIMUM_LENGTH"] is not None:
+        return f"{data_type}({row['CHARACTER_MAXIMUM_LENGTH']})"
+
+    if data_type == "NUMBER" and row["NUMERIC_PRECISION"] is not None:
+        return f"NUMBER({row['NUMERIC_PRECISION']},{row['NUMERIC_SCALE']})"
+
+    if data_type in DATETIME_TYPES and row["DATETIME_PRECISION"] is not None:
+        return f"{data_type}({row['DATETIME_PRECISION']})"
+
+    return data_type
@@ -0,0 +1,102 @@
+# Query results as stored in the query cache. Instead of pickling a list of row dicts, which repeats every column
+# name in every row, results are stored column by column: a header with the column names and one list of values per
+# column, pickled (values can be decimals, dates, etc) and compressed. Row dicts are only built when they're used.
+
+import pickle
+import typing as t
+import zlib
+
+# results cached before the columnar format were plain pickles, which never start with this
+COLUMNAR_MAGIC = b"QRC1"
+
+# fast setting, results are mostly small and compress well anyway
+COMPRESSION_LEVEL = 1
+
+
+class QueryResult:
+    def __init__(
+        self,
+        rows: list[dict] | None = None,
+        columns: list[str] | None = None,
+        values: list[list] | None = None,
+    ):
+        """
+        Created either from rows (straight from the warehouse) or from columns + per column values (from the cache),
+        the other representation is built when it's first needed
+        """
+
+        assert rows is not None or (columns is not None and values is not None)
+
+        self._rows = rows
+        self._columns = columns
+        self._values = values
+
+    def __len__(self) -> int:
+        if self._rows is not None:
+            return len(self._rows)
+
+        assert self._values is not None
+        return len(self._values[0]) if self._values else 0
+
+    def iter_rows(self) -> t.Iterator[dict]:
+        if self._rows is not None:
+            yield from self._rows
+            return
+
+        assert self._columns is not None and self._values is not None
+        for row_values in zip(*self._values):
+            yield dict(zip(self._columns, row_values))
+
+    def rows(self) -> list[dict]:
+        if self._rows is None:
+            self._rows = list(self.iter_rows())
+
+        return self._rows
+
+    def copy(self) -> "QueryResult":
+        """
+        A result a caller can modify without affecting anyone else holding this one. Columnar values are shared, they
+        are never modified, rows built from them are separate dicts already.
+        """
+
+        if self._columns is not None and self._values is not None:
+            return QueryResult(columns=self._columns, values=self._values)
+
+        assert self._rows is not None
+        return QueryResult(rows=[dict(row) for row in self._rows])
+
+    def encode(self) -> bytes:
+        columns, values = self._columnar()
+
+        if columns is None:
+            # rows don't share the same columns (error results, for instance), keep them as they are
+            payload = pickle.dumps((None, self.rows()), protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            payload = pickle.dumps((columns, values), protocol=pickle.HIGHEST_PROTOCOL)
+
+        return COLUMNAR_MAGIC + zlib.compress(payload, COMPRESSION_LEVEL)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "QueryResult":
+        if not data.startswith(COLUMNAR_MAGIC):
+            return cls(rows=pickle.loads(data))
+
+        columns, values = pickle.loads(zlib.decompress(data[len(COLUMNAR_MAGIC) :]))
+        if columns is None:
+            return cls(rows=values)
+
+        return cls(columns=columns, values=values)
+
+    def _columnar(self) -> tuple[list[str] | None, list[list]]:
+        if self._columns is not None and self._values is not None:
+            return self._columns, self._values
+
+        rows = self.rows()
+        if not rows:
+            return [], []
+
+        columns = list(rows[0].keys())
+        if any(row.keys() != rows[0].keys() for row in rows):
+            return None, []
+
+        return columns, [[row[column] for row in rows] for column in columns]
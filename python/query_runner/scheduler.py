@@ -0,0 +1,103 @@
+# Runs the importer's metadata queries against a data source. Per column aggregates are batched into one multi column
+# SELECT per table, instead of a query (and a full table scan) per column, and the number of queries running against
+# the warehouse at once is capped.
+
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+from decouple import config
+
+from python.utils import sql
+
+from prisma.models import DataSource
+
+from . import run_query
+
+# how many queries an import runs against the warehouse at the same time
+MAX_CONCURRENT_QUERIES = config("IMPORT_MAX_CONCURRENT_QUERIES", default=4, cast=int)
+
+# aggregates per SELECT, very wide tables are split over a few queries (which run concurrently)
+MAX_COLUMNS_PER_QUERY = 50
+
+# shared by every query an import runs against a data source (metadata and column value extraction), so the cap holds
+# for the data source as a whole and not per thread pool
+WAREHOUSE_SLOTS: dict[int, BoundedSemaphore] = {}
+WAREHOUSE_SLOTS_LOCK = Lock()
+
+
+def warehouse_slots(data_source_id: int) -> BoundedSemaphore:
+    with WAREHOUSE_SLOTS_LOCK:
+        if data_source_id not in WAREHOUSE_SLOTS:
+            WAREHOUSE_SLOTS[data_source_id] = BoundedSemaphore(MAX_CONCURRENT_QUERIES)
+
+        return WAREHOUSE_SLOTS[data_source_id]
+
+
+def run_import_query(data_source: DataSource, raw_sql: str, **kwargs) -> list[dict]:
+    """
+    Runs a query for an import, waiting while the data source already has `MAX_CONCURRENT_QUERIES` import queries
+    running against it
+    """
+
+    with warehouse_slots(data_source.id):
+        return run_query(data_source, raw_sql, disable_query_protections=True, allow_cached_queries=True, **kwargs)
+
+
+class ColumnStatistics(t.NamedTuple):
+    row_count: int
+    distinct_counts: dict[str, int]
+
+
+class QueryScheduler:
+    def __init__(self, data_source: DataSource, max_concurrency=MAX_CONCURRENT_QUERIES):
+        self.data_source = data_source
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"query-{data_source.id}")
+
+    def submit(self, raw_sql: str, **kwargs) -> Future[list[dict]]:
+        return self.executor.submit(run_import_query, self.data_source, raw_sql, **kwargs)
+
+    def run(self, raw_sql: str, **kwargs) -> list[dict]:
+        return self.submit(raw_sql, **kwargs).result()
+
+    def column_statistics(self, table_fqn: str, column_names: list[str], approximate=False) -> ColumnStatistics:
+        """
+        Row count of the table and the number of distinct values of each column. `approximate` uses
+        APPROX_COUNT_DISTINCT (HyperLogLog, within a few percent) which is much cheaper on large tables.
+        """
+
+        chunks = [
+            column_names[start : start + MAX_COLUMNS_PER_QUERY]
+            for start in range(0, len(column_names), MAX_COLUMNS_PER_QUERY)
+        ] or [[]]
+
+        futures = [self.submit(column_statistics_sql(table_fqn, chunk, approximate=approximate)) for chunk in chunks]
+
+        row_count = 0
+        distinct_counts = {}
+        for chunk, future in zip(chunks, futures):
+            # TODO this will throw an error if there's an upstream issue, which is what we want for now
+            result = future.result()[0]
+
+            row_count = result["ROW_COUNT"]
+            distinct_counts |= {name: result[f"DISTINCT_{idx}"] for idx, name in enumerate(chunk)}
+
+        return ColumnStatistics(row_count, distinct_counts)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def column_statistics_sql(table_fqn: str, column_names: list[str], approximate=False) -> str:
+    count_distinct = "APPROX_COUNT_DISTINCT({})" if approximate else "COUNT(DISTINCT {})"
+
+    # columns are aliased by position, column names can contain anything
+    aggregates = ['COUNT(*) AS "ROW_COUNT"'] + [
+        count_distinct.format(sql.quote_identifier(name)) + f' AS "DISTINCT_{idx}"'
+        for idx, name in enumerate(column_names)
+    ]
+
+    return f"""
+        SELECT {", ".join(aggregates)}
+        FROM {sql.normalize_fqn_quoting(table_fqn)}
+        """
@@ -1,12 +1,20 @@
 from python.setup import log
 
+import atexit
+import json
 import re
 import typing as t
+from contextlib import contextmanager
+from threading import Lock
 
 import sentry_sdk
 import snowflake.connector
+import xxhash
+from decouple import config
+from snowflake.connector import SnowflakeConnection
 from snowflake.connector.cursor import DictCursor, SnowflakeCursor
 
+from python.query_runner.connection_pool import ConnectionPool
 from python.utils.batteries import log_execution_time, not_none
 from python.utils.environments import is_production
 
@@ -22,34 +30,140 @@ class SnowflakeCredentials(t.TypedDict):
     schema: str
 
 
-# by default, the cursor is locked to the credentials context
-# when setting up an account it's helpful to create an unscoped cursor for DB inspection
-def get_snowflake_cursor(data_source: DataSource, without_context=False):
+def connect_to_snowflake(data_source: DataSource, without_context=False) -> SnowflakeConnection:
     snowflake_credentials = t.cast(SnowflakeCredentials, data_source.credentials)
 
+    # set timeout in non-prod lower to avoid long-running queries by accident
+    # https://community.snowflake.com/s/article/Parameter-STATEMENT-TIMEOUT-IN-SECONDS-covers-the-overall-time-of-query-execution
+    default_timeout = 15
+    if is_production():
+        default_timeout = 30
+
     connection = snowflake.connector.connect(
         user=snowflake_credentials["username"],
         password=snowflake_credentials["password"],
         account=snowflake_credentials["account"],
+        # sent along with the login request, no extra round trip
+        session_parameters={"STATEMENT_TIMEOUT_IN_SECONDS": default_timeout},
     )
 
-    cursor = connection.cursor(cursor_class=DictCursor)
-
     if not without_context:
-        cursor.execute(f"use warehouse {snowflake_credentials['warehouse']};")
-        cursor.execute(f"use {snowflake_credentials['database']}.{snowflake_credentials['schema']};")
+        use_data_source_context(connection, snowflake_credentials)
+
+    return connection
 
-    # set timeout in non-prod lower to avoid long-running queries by accident
-    # https://community.snowflake.com/s/article/Parameter-STATEMENT-TIMEOUT-IN-SECONDS-covers-the-overall-time-of-query-execution
-    default_timeout = 15
-    if is_production():
-        default_timeout = 30
 
-    cursor.execute(f"set STATEMENT_TIMEOUT_IN_SECONDS = {default_timeout};")
+def same_identifier(current: str | None, configured: str) -> bool:
+    # snowflake reports the resolved name, unquoted identifiers resolve to upper case
+    resolved = configured[1:-1] if configured.startswith('"') and configured.endswith('"') else configured.upper()
+    return current == resolved
+
+
+def use_data_source_context(connection: SnowflakeConnection, snowflake_credentials: SnowflakeCredentials):
+    """
+    Points the session at the warehouse and schema of the data source. The connector keeps track of the session's
+    current context, so a round trip is only needed when it changed (someone ran a `USE`).
+    """
+
+    warehouse = snowflake_credentials["warehouse"]
+    database = snowflake_credentials["database"]
+    schema = snowflake_credentials["schema"]
+
+    statements = []
+    if not same_identifier(connection.warehouse, warehouse):
+        statements.append(f"use warehouse {warehouse};")
+    if not (same_identifier(connection.database, database) and same_identifier(connection.schema, schema)):
+        statements.append(f"use {database}.{schema};")
+
+    if not statements:
+        return
+
+    cursor = connection.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+
+
+# by default, the cursor is locked to the credentials context
+# when setting up an account it's helpful to create an unscoped cursor for DB inspection
+def get_snowflake_cursor(data_source: DataSource, without_context=False):
+    connection = connect_to_snowflake(data_source, without_context=without_context)
+    cursor = connection.cursor(cursor_class=DictCursor)
 
     return cursor, connection
 
 
+def is_healthy_connection(connection: SnowflakeConnection) -> bool:
+    if connection.is_closed():
+        return False
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("select 1")
+        cursor.close()
+        return True
+    except snowflake.connector.errors.Error:
+        return False
+
+
+# pools are shared by the server, the importer and the validator, keyed by data source and credentials so updating
+# the credentials of a data source starts a new pool
+SNOWFLAKE_POOLS: dict[tuple[int, str], ConnectionPool[SnowflakeConnection]] = {}
+SNOWFLAKE_POOLS_LOCK = Lock()
+
+
+def snowflake_connection_pool(data_source: DataSource) -> ConnectionPool[SnowflakeConnection]:
+    credentials_hash = xxhash.xxh64(json.dumps(data_source.credentials, sort_keys=True)).hexdigest()
+    key = (data_source.id, credentials_hash)
+
+    with SNOWFLAKE_POOLS_LOCK:
+        if key in SNOWFLAKE_POOLS:
+            return SNOWFLAKE_POOLS[key]
+
+        stale_pools = [SNOWFLAKE_POOLS.pop(stale) for stale in list(SNOWFLAKE_POOLS) if stale[0] == data_source.id]
+
+        pool = SNOWFLAKE_POOLS[key] = ConnectionPool(
+            connect=lambda: connect_to_snowflake(data_source),
+            close=lambda connection: connection.close(),
+            is_healthy=is_healthy_connection,
+            max_size=config("SNOWFLAKE_POOL_MAX_SIZE", default=20, cast=int),
+            max_idle_seconds=config("SNOWFLAKE_POOL_MAX_IDLE_SECONDS", default=300, cast=float),
+        )
+
+    for stale_pool in stale_pools:
+        stale_pool.close()
+
+    return pool
+
+
+@atexit.register
+def close_snowflake_connection_pools():
+    with SNOWFLAKE_POOLS_LOCK:
+        pools = list(SNOWFLAKE_POOLS.values())
+        SNOWFLAKE_POOLS.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+@contextmanager
+def snowflake_cursor(data_source: DataSource) -> t.Iterator[SnowflakeCursor]:
+    """
+    A cursor on a pooled connection, the connection goes back to the pool once the block completes
+    """
+
+    with snowflake_connection_pool(data_source).connection() as connection:
+        # an earlier borrower of the connection might have switched to another schema or warehouse
+        use_data_source_context(connection, t.cast(SnowflakeCredentials, data_source.credentials))
+
+        cursor = connection.cursor(cursor_class=DictCursor)
+
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
 def apply_query_protections(sql):
     if not re.search(r"\sLIMIT\s", sql):
         sql += " LIMIT 100"
@@ -99,9 +213,52 @@ def get_query_results(cursor: SnowflakeCursor, sql: str, disable_query_protectio
 
 
 def run_snowflake_query(data_source: DataSource, sql: str, disable_query_protections=False):
-    cursor, connection = get_snowflake_cursor(data_source)
+    with snowflake_cursor(data_source) as cursor:
+        return get_query_results(cursor, sql, disable_query_protections=disable_query_protections)
+
 
-    results = get_query_results(cursor, sql, disable_query_protections=disable_query_protections)
+# rows fetched at a time when streaming rows rather than arrow batches
+STREAM_FETCH_ROWS = 10_000
 
-    connection.close()
-    return results
+
+def stream_snowflake_query(
+    data_source: DataSource, sql: str, disable_query_protections=False, arrow=False
+) -> t.Iterator[t.Any]:
+    """
+    Run the query and yield the result one batch at a time, so only a single batch is held in memory: pyarrow Tables
+    (one per result chunk sent by snowflake) when `arrow` is set, lists of row dicts otherwise. The pooled connection
+    is held until the generator is exhausted or closed.
+
+    Only pass `arrow` when the caller needs pyarrow Tables, results snowflake can't send as arrow (SHOW, DESCRIBE, ...)
+    are fetched as rows and converted.
+    """
+
+    if not disable_query_protections:
+        sql = apply_query_protections(sql)
+
+    log.debug("streaming query", sql=sql)
+
+    with snowflake_cursor(data_source) as cursor:
+        with log_execution_time("snowflake query runtime"):
+            cursor.execute(sql)
+
+        if arrow:
+            try:
+                arrow_batches = cursor.fetch_arrow_batches()
+                first_batch = next(arrow_batches, None)
+            except snowflake.connector.errors.NotSupportedError:
+                log.debug("result can't be fetched as arrow, converting rows")
+            else:
+                if first_batch is not None:
+                    yield first_batch
+                    yield from arrow_batches
+                return
+
+            import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+            while batch := cursor.fetchmany(STREAM_FETCH_ROWS):
+                yield pa.Table.from_pylist(batch)
+            return
+
+        while batch := cursor.fetchmany(STREAM_FETCH_ROWS):
+            yield batch
@@ -0,0 +1,55 @@
+# Encoders for streaming query results (see `stream_snowflake_query`) back to the client one batch at a time:
+# newline delimited JSON, or an Arrow IPC stream. pyarrow is optional, it is only installed along with the arrow
+# extras of the snowflake connector.
+
+import importlib.util
+import io
+import typing as t
+
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def ndjson_stream(batches: t.Iterable[t.Any], dumps: t.Callable[[t.Any], str]) -> t.Iterator[str]:
+    """
+    One JSON object per row and line, one chunk per batch. Batches are either pyarrow Tables or lists of row dicts.
+    """
+
+    for batch in batches:
+        rows = batch.to_pylist() if hasattr(batch, "to_pylist") else batch
+        if rows:
+            yield "".join(dumps(row) + "\n" for row in rows)
+
+
+def arrow_ipc_stream(batches: t.Iterable[t.Any]) -> t.Iterator[bytes]:
+    """
+    Arrow IPC streaming format, every pyarrow Table is written (and flushed to the client) as it comes in
+    """
+
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+    sink = io.BytesIO()
+    writer = None
+
+    for table in batches:
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, table.schema)
+
+        writer.write_table(table)
+        yield _drain(sink)
+
+    # an empty result has no batches to take the schema from
+    if writer is None:
+        writer = pa.ipc.new_stream(sink, pa.schema([]))
+
+    writer.close()
+    yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+
+    return data
@@ -24,6 +24,7 @@ from python.utils.indexes_and_models import application_indexes_and_models
 from python.utils.logging import log
 from python.utils.openai import OpenAIEngineOptions, is_chat_engine, openai_engine
 from python.utils.openai_rate_throttled import openai_throttled
+from python.utils.timings import timed
 
 db = python.utils.db.application_database_connection()
 
@@ -37,7 +38,8 @@ indexes_and_models = application_indexes_and_models()
 def question_with_data_source_to_sql(
     data_source_id: int, question: str, engine: OpenAIEngineOptions | None = None
 ) -> str:
-    ranked_schema = indexes_and_models.ranker(data_source_id).rank(question)
+    with timed("ranking"):
+        ranked_schema = indexes_and_models.ranker(data_source_id).rank(question)
 
     log.debug("building schema")
 
@@ -49,10 +51,10 @@ def question_with_data_source_to_sql(
     else:
         prompt_generator = CodexPrompt(engine, data_source_id, ranked_schema, question)
 
-    with log_execution_time("prompt generation"):
+    with log_execution_time("prompt generation"), timed("prompt"):
         prompt = prompt_generator.generate()
 
-    with log_execution_time("question to sql"):
+    with log_execution_time("question to sql"), timed("completion"):
         simple_schema = build_simple_schema(data_source_id)
         sql = _question_with_prompt(simple_schema, prompt, engine)
 
@@ -1,10 +1,17 @@
+import math
 from pprint import pprint
 from typing import Tuple
 
 from decouple import config
 
-from python.embeddings.ann_search import AnnSearch
+from python.embeddings.ann_search import AnnSearchResults, merge_results
 from python.embeddings.embedding import generate_embedding
+from python.embeddings.multi_ann_search import (
+    COLUMN_INDEX_NAMES,
+    TABLE_INDEX_NAMES,
+    VALUE_INDEX_NAMES,
+    MultiAnnSearch,
+)
 from python.embeddings.openai_embedder import OpenAIEmbedder
 from python.sql.types import DbElementIds, ElementIdsAndScores, ElementScores
 
@@ -18,112 +25,51 @@ class TrainingRanker:
 
         indexes_path = config("FAISS_INDEXES_PATH")
 
-        # Table indexes (indexes that point to a table)
-        self.idx_table_name = AnnSearch(f"{indexes_path}/{datasource_id}/table_name")
-        self.idx_table_and_all_column_names = AnnSearch(f"{indexes_path}/{datasource_id}/table_and_all_column_names")
-        self.idx_table_and_all_column_names_and_all_values = AnnSearch(
-            f"{indexes_path}/{datasource_id}/table_and_all_column_names_and_all_values"
-        )
-
-        # Column indexes (indexes that point to a column)
-        self.idx_column_name = AnnSearch(f"{indexes_path}/{datasource_id}/column_name")
-        self.idx_table_and_column_name = AnnSearch(f"{indexes_path}/{datasource_id}/table_and_column_name")
-        self.idx_column_name_and_all_values = AnnSearch(f"{indexes_path}/{datasource_id}/column_name_and_all_values")
-        self.idx_table_and_column_name_and_all_values = AnnSearch(
-            f"{indexes_path}/{datasource_id}/table_and_column_name_and_all_values"
-        )
-
-        # Cell Values (index that point to a table+column+value)
-        self.idx_value = AnnSearch(f"{indexes_path}/{datasource_id}/value")
-        self.idx_table_column_and_value = AnnSearch(f"{indexes_path}/{datasource_id}/table_column_and_value")
+        self.indexes = MultiAnnSearch(f"{indexes_path}/{datasource_id}")
 
     def rank(
         self, query: str, embedder=OpenAIEmbedder, cache_results=True
     ) -> Tuple[ElementIdsAndScores, ElementIdsAndScores, ElementIdsAndScores]:
         query_embedding = generate_embedding(query, embedder=embedder, cache_results=cache_results)
 
-        # Fetch ranked table id
-        table_name_matches = self.idx_table_name.search(query_embedding, self.match_limit)
-        table_and_all_column_names_matches = self.idx_table_and_all_column_names.search(
-            query_embedding, self.match_limit
-        )
-        table_and_all_column_names_and_all_values_matches = self.idx_table_and_all_column_names_and_all_values.search(
-            query_embedding, self.match_limit
-        )
-        # log.debug("Table matches", matches=table_matches)
-
-        column_name_matches = self.idx_column_name.search(query_embedding, self.match_limit)
-        table_and_column_name_matches = self.idx_table_and_column_name.search(query_embedding, self.match_limit)
-        column_name_and_all_values_matches = self.idx_column_name_and_all_values.search(
-            query_embedding, self.match_limit
-        )
-        table_and_column_name_and_all_values_matches = self.idx_table_and_column_name_and_all_values.search(
-            query_embedding, self.match_limit
+        # Fetch ranked tables, columns and value hints in one pass over all of the indexes
+        matches = self.indexes.search(
+            query_embedding,
+            {name: self.match_limit for name in TABLE_INDEX_NAMES + COLUMN_INDEX_NAMES}
+            | {name: self.value_hint_search_limit for name in VALUE_INDEX_NAMES},
         )
 
-        # log.debug("Column matches", matches=columns_matches)
-
-        # search for value hint matches in the faaise index
-        value_matches = self.idx_value.search(query_embedding, self.value_hint_search_limit)
-        table_column_and_value_matches = self.idx_table_column_and_value.search(
-            query_embedding, self.value_hint_search_limit
-        )
-        # print(
-        #     "Query Match Len: ",
-        #     len(idx_table_names_rankings),
-        #     len(idx_column_names_rankings),
-        #     len(idx_table_and_column_names_rankings),
-        #     len(idx_column_name_and_all_column_values_rankings),
-        #     len(idx_table_column_and_value_rankings),
-        #     len(idx_values_rankings),
-        # )
-
-        table_scores: ElementIdsAndScores = {}
-        column_scores: ElementIdsAndScores = {}
-        value_scores: ElementIdsAndScores = {}
-
-        self.merge_search_results(table_scores, table_name_matches, "table_name")
-        self.merge_search_results(table_scores, table_and_all_column_names_matches, "table_and_all_column_names")
-        self.merge_search_results(
-            table_scores, table_and_all_column_names_and_all_values_matches, "table_and_all_column_names_and_all_values"
-        )
+        table_scores = self.merge_search_results(matches, TABLE_INDEX_NAMES)
 
         # When merging columns, pass in the table scores dict as well so we can look up the table scores and copy
         # it over.
-        self.merge_search_results(column_scores, column_name_matches, "column_name", table_scores)
-        self.merge_search_results(column_scores, table_and_column_name_matches, "table_and_column_name", table_scores)
-        self.merge_search_results(
-            column_scores, column_name_and_all_values_matches, "column_name_and_all_values", table_scores
-        )
-        self.merge_search_results(
-            column_scores,
-            table_and_column_name_and_all_values_matches,
-            "table_and_column_name_and_all_values",
-            table_scores,
-        )
+        column_scores = self.merge_search_results(matches, COLUMN_INDEX_NAMES, table_scores)
 
-        self.merge_search_results(value_scores, value_matches, "value")
-        self.merge_search_results(value_scores, table_column_and_value_matches, "table_column_and_value")
+        value_scores = self.merge_search_results(matches, VALUE_INDEX_NAMES)
 
         return table_scores, column_scores, value_scores
 
     def merge_search_results(
         self,
-        scores: ElementIdsAndScores,
-        faiss_rankings: list[tuple[float, DbElementIds]],
-        ranking_name: str,
+        matches: dict[str, AnnSearchResults],
+        ranking_names: list[str],
         table_scores: ElementIdsAndScores | None = None,
-    ):
-        for ranking in faiss_rankings:
-            score, db_element = ranking
+    ) -> ElementIdsAndScores:
+        # the hits of all of the indexes are lined up by element on the id arrays, so the loop below runs once per
+        # element instead of once per hit. An element an index found more than once gets the score of its last hit,
+        # the models were trained on the scores picked that way.
+        merged = merge_results([matches[name] for name in ranking_names], keep_last=True)
+        index_scores = merged.scores.tolist()
 
-            if db_element not in scores:
-                scores[db_element] = ElementScores()
+        scores: ElementIdsAndScores = {}
 
-            current_scores = scores[db_element]
+        for position, db_element in enumerate(merged.elements):
+            current_scores = ElementScores()
 
-            # Update the score on the ElementRanking
-            setattr(current_scores, ranking_name + "_score", score)
+            # Update the scores on the ElementRanking, for the indexes which found the element
+            for ranking_name, ranking_scores in zip(ranking_names, index_scores):
+                if not math.isnan(score := ranking_scores[position]):
+                    setattr(current_scores, ranking_name + "_score", score)
 
             if table_scores:
                 # For columns, we pass in the table_scores dict as well, and use it to find the table scores for the
@@ -140,6 +86,10 @@ class TrainingRanker:
                         table_score.table_and_all_column_names_and_all_values_score
                     )
 
+            scores[db_element] = current_scores
+
+        return scores
+
 
 if __name__ == "__main__":
     ranker = TrainingRanker(1)
@@ -21,6 +21,7 @@ from python.sql.types import DbElementIds, ElementIdsAndScores
 from python.sql.utils.touch_points import convert_db_element_ids_to_db_element
 from python.utils.batteries import log_execution_time
 from python.utils.logging import log
+from python.utils.timings import timed
 
 
 class LearnedRanker:
@@ -82,6 +83,7 @@ class LearnedRanker:
 
         return rankings
 
+    @timed("model_scoring")
     def get_element_ranks_via_models(self, element_scores: ElementIdsAndScores, element_type: str) -> list[ElementRank]:
         # Since python 3.10, dicts are ordered
         elements = list(element_scores.keys())
@@ -5,10 +5,17 @@ import sys
 import time
 import typing as t
 
+import numpy as np
 from decouple import config
 
-from python.embeddings.ann_search import AnnSearch
+from python.embeddings.ann_search import AnnSearchResults, merge_results
 from python.embeddings.embedding import generate_embedding
+from python.embeddings.multi_ann_search import (
+    COLUMN_INDEX_NAMES,
+    TABLE_INDEX_NAMES,
+    VALUE_INDEX_NAMES,
+    MultiAnnSearch,
+)
 from python.embeddings.openai_embedder import OpenAIEmbedder
 from python.sql.types import DbElementIds
 from python.sql.utils.touch_points import convert_db_element_ids_to_db_element
@@ -33,24 +40,7 @@ class Ranker:
     def __init__(self, datasource_id: int):
         indexes_path = config("FAISS_INDEXES_PATH")
 
-        # Table indexes (indexes that point to a table)
-        self.idx_table_name = AnnSearch(f"{indexes_path}/{datasource_id}/table_name")
-        self.idx_table_and_all_column_names = AnnSearch(f"{indexes_path}/{datasource_id}/table_and_all_column_names")
-        self.idx_table_and_all_column_names_and_all_values = AnnSearch(
-            f"{indexes_path}/{datasource_id}/table_and_all_column_names_and_all_values"
-        )
-
-        # Column indexes (indexes that point to a column)
-        self.idx_column_name = AnnSearch(f"{indexes_path}/{datasource_id}/column_name")
-        self.idx_table_and_column_name = AnnSearch(f"{indexes_path}/{datasource_id}/table_and_column_name")
-        self.idx_column_name_and_all_values = AnnSearch(f"{indexes_path}/{datasource_id}/column_name_and_all_values")
-        self.idx_table_and_column_name_and_all_values = AnnSearch(
-            f"{indexes_path}/{datasource_id}/table_and_column_name_and_all_values"
-        )
-
-        # Cell Values (index that point to a table+column+value)
-        self.idx_value = AnnSearch(f"{indexes_path}/{datasource_id}/value")
-        self.idx_table_column_and_value = AnnSearch(f"{indexes_path}/{datasource_id}/table_column_and_value")
+        self.indexes = MultiAnnSearch(f"{indexes_path}/{datasource_id}")
 
     def rank(
         self,
@@ -76,53 +66,27 @@ class Ranker:
         match_limit = 1000
 
         log.debug("Start ranking")
-        # Fetch ranked table id
-        table_name_matches = self.idx_table_name.search(query_embedding, match_limit)
-        table_and_all_column_names_matches = self.idx_table_and_all_column_names.search(query_embedding, match_limit)
-        table_and_all_column_names_and_all_values_matches = self.idx_table_and_all_column_names_and_all_values.search(
-            query_embedding, match_limit
-        )
-        # log.debug("Table matches", matches=table_matches)
-
-        column_name_matches = self.idx_column_name.search(query_embedding, match_limit)
-        table_and_column_name_matches = self.idx_table_and_column_name.search(query_embedding, match_limit)
-        column_name_and_all_values_matches = self.idx_column_name_and_all_values.search(query_embedding, match_limit)
-        table_and_column_name_and_all_values_matches = self.idx_table_and_column_name_and_all_values.search(
-            query_embedding, match_limit
-        )
-
-        # log.debug("Column matches", matches=columns_matches)
 
         # search for value hint matches in the faaise index
         value_hint_search_limit = 100
-        value_matches = self.idx_value.search(query_embedding, value_hint_search_limit)
-        table_column_and_value_matches = self.idx_table_column_and_value.search(
-            query_embedding, value_hint_search_limit
-        )
 
-        tables = self.merge_ranks(
-            [table_name_matches, table_and_all_column_names_matches, table_and_all_column_names_and_all_values_matches],
-            table_weights,
-            0,
-        )
-        columns = self.merge_ranks(
-            [
-                column_name_matches,
-                table_and_column_name_matches,
-                column_name_and_all_values_matches,
-                table_and_column_name_and_all_values_matches,
-            ],
-            column_weights,
-            1,
+        # Fetch ranked tables, columns and value hints in one pass over all of the indexes
+        matches = self.indexes.search(
+            query_embedding,
+            {name: match_limit for name in TABLE_INDEX_NAMES + COLUMN_INDEX_NAMES}
+            | {name: value_hint_search_limit for name in VALUE_INDEX_NAMES},
         )
 
+        tables = self.merge_ranks([matches[name] for name in TABLE_INDEX_NAMES], table_weights)
+        columns = self.merge_ranks([matches[name] for name in COLUMN_INDEX_NAMES], column_weights)
+
         if os.getenv("DEBUG_RANKER"):
             log.debug("--------------------------------------")
-            score_and_element = map(lambda x: (x[0], convert_db_element_ids_to_db_element(x[1])), value_matches)
+            score_and_element = map(lambda x: (x[0], convert_db_element_ids_to_db_element(x[1])), matches["value"])
             for score, element in score_and_element:
                 log.debug("Value matches", score=score, element=element)
 
-        values = self.merge_ranks([value_matches, table_column_and_value_matches], value_weights, 2)
+        values = self.merge_ranks([matches[name] for name in VALUE_INDEX_NAMES], value_weights)
 
         # rankings = list(map(lambda x: ElementRank(table_id=x[1][0], column_id=x[1][1], value_hint=x[1][2], score=x[0]), tables + columns + values))
         rankings: list[ElementRank] = list(
@@ -148,30 +112,21 @@ class Ranker:
 
         return rankings
 
-    def merge_ranks(self, scores_and_associations, weights, remove_dups_idx=None):
-        # Merge the output of multiple AnnSearch#search's via the passed in
-        # weights
-        merged = []
-        for idx, scores_and_assocs in enumerate(scores_and_associations):
-            for score_and_assoc in scores_and_assocs:
-                # Multiply the scores by the the associated weight
-                merged.append((score_and_assoc[0] * weights[idx], score_and_assoc[1]))
-
-        # Sort
-        merged.sort(key=lambda x: x[0], reverse=True)
-
-        if remove_dups_idx is not None:
-            # Remove duplicates for the target table, column, or value
-            final = []
-            seen = set()
-            for score_and_assoc in merged:
-                if score_and_assoc[1] not in seen:
-                    final.append(score_and_assoc)
-                    seen.add(score_and_assoc[1])
-        else:
-            final = merged
-
-        return final
+    def merge_ranks(
+        self, search_results: list[AnnSearchResults], weights: list[float]
+    ) -> list[tuple[float, DbElementIds]]:
+        # Merge the output of multiple AnnSearch#search's via the passed in weights, every element keeps its best
+        # weighted score
+        merged = merge_results(search_results)
+        if not merged.elements:
+            return []
+
+        weighted = np.nanmax(merged.scores * np.array(weights)[:, None], axis=0)
+
+        # Sort, highest score first
+        order = np.argsort(-weighted, kind="stable")
+
+        return [(score, merged.elements[idx]) for score, idx in zip(weighted[order].tolist(), order.tolist())]
 
     def pull_assoc(self, scores_and_assocs, assoc_idx):
         # Grabs the table, column, or value from the association tuple
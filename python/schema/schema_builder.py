@@ -13,6 +13,7 @@ from python.utils.batteries import unique
 from python.utils.db import application_database_connection
 from python.utils.logging import log
 from python.utils.sql import unqualified_table_name
+from python.utils.timings import timed
 from python.utils.tokens import count_tokens
 
 from prisma.models import DataSourceTableColumn, DataSourceTableDescription
@@ -48,6 +49,7 @@ class SchemaBuilder:
         self.cached_tables: dict[int, DataSourceTableDescription] = {}
         self.tokens_so_far = 0
 
+    @timed("schema_build")
     def build(self, data_source_id: int, ranked_schema: SCHEMA_RANKING_TYPE, available_tokens: int) -> str:
         # The available tokens is determiend based on the engine and the amount of tokens used for the rest of the
         # prompt
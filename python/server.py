@@ -1,11 +1,28 @@
+import itertools
 import os
-
-from flask import Flask, jsonify, request
-
-from python.query_runner import run_query
+import time
+
+import snowflake.connector
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+
+from python.query_runner import run_query_columnar
+from python.query_runner.data_sources import get_data_source
+from python.query_runner.query_result import QueryResult
+from python.query_runner.snowflake import stream_snowflake_query
+from python.query_runner.streaming import (
+    arrow_available,
+    arrow_ipc_stream,
+    ndjson_stream,
+)
 from python.questions import question_with_data_source_to_sql
+from python.utils import metrics, timings
 from python.utils.environments import is_production
 from python.utils.logging import log
+from python.utils.metrics import (
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    QUESTION_STAGE_SECONDS,
+)
 from python.utils.sentry import configure_sentry
 
 application = Flask(__name__)
@@ -16,11 +33,35 @@ from decouple import config
 configure_sentry()
 
 
+@application.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@application.after_request
+def record_request_metrics(response: Response):
+    # the route template, requests which didn't match a route are grouped together so a scanner can't create series
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    labels = {"method": request.method, "route": route, "status": str(response.status_code)}
+
+    HTTP_REQUESTS.inc(**labels)
+
+    if (request_start := g.get("request_start")) is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - request_start, **labels)
+
+    return response
+
+
 @application.route("/healthcheck", methods=["GET"])
 def healthcheck():
     return jsonify({})
 
 
+@application.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # TODO this doesn't work...
 @application.route("/import", methods=["POST"])
 def import_data_source():
@@ -39,9 +80,19 @@ def question():
     question_text = json_data["question"]
     data_source_id = json_data["data_source_id"]
 
-    sql = question_with_data_source_to_sql(data_source_id, question_text)
+    with timings.collect() as question_timings:
+        sql = question_with_data_source_to_sql(data_source_id, question_text)
+
+    for stage, seconds in question_timings.items():
+        QUESTION_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    response = {"question": question_text, "data_source_id": data_source_id, "sql": sql}
+
+    # seconds spent in each stage of answering the question, see python/utils/timings.py
+    if json_data.get("timings"):
+        response["timings"] = timings.rounded(question_timings)
 
-    return jsonify({"question": question_text, "data_source_id": data_source_id, "sql": sql})
+    return jsonify(response)
 
 
 @application.route("/query", methods=["POST"])
@@ -53,9 +104,71 @@ def query():
     data_source_id = json_data["data_source_id"]
     allow_cached_queries = json_data["allow_cached_queries"]
 
-    results = run_query(data_source_id, sql, allow_cached_queries=allow_cached_queries)
+    results = run_query_columnar(data_source_id, sql, allow_cached_queries=allow_cached_queries)
+
+    # same body as `jsonify({"sql": sql, "results": results})`, but rows are encoded as the response is written, so a
+    # large result is never turned into a list of dicts and a JSON string at once
+    return Response(_stream_query_response(sql, results), mimetype="application/json")
+
+
+# rows encoded per chunk written to the response
+QUERY_RESPONSE_CHUNK_ROWS = 500
+
+
+def _stream_query_response(sql: str, results: QueryResult):
+    yield '{"sql": ' + application.json.dumps(sql) + ', "results": ['
+
+    chunk = []
+    for idx, row in enumerate(results.iter_rows()):
+        chunk.append(("," if idx else "") + application.json.dumps(row))
+
+        if len(chunk) == QUERY_RESPONSE_CHUNK_ROWS:
+            yield "".join(chunk)
+            chunk = []
+
+    yield "".join(chunk) + "]}"
+
+
+@application.route("/query/stream", methods=["POST"])
+def query_stream():
+    """
+    Streams the whole result back as it is fetched, instead of building it in memory: `format` is either `ndjson` (one
+    row per line) or `arrow` (Arrow IPC stream). Results are never cached.
+    """
+
+    json_data = request.get_json()
+    assert json_data is not None
+
+    sql = json_data["sql"]
+    data_source = get_data_source(json_data["data_source_id"])
+    disable_query_protections = json_data.get("disable_query_protections", False)
+    response_format = json_data.get("format", "ndjson")
+
+    if response_format not in ("ndjson", "arrow"):
+        return jsonify({"error": f"unknown format: {response_format}"}), 400
+
+    if response_format == "arrow" and not arrow_available():
+        return jsonify({"error": "arrow format requires pyarrow"}), 400
+
+    batches = stream_snowflake_query(
+        data_source, sql, disable_query_protections=disable_query_protections, arrow=response_format == "arrow"
+    )
+
+    # the query runs when the first batch is requested, pull it before responding so errors get a proper status
+    try:
+        first_batch = next(batches, None)
+    except snowflake.connector.errors.ProgrammingError as e:
+        log.exception("snowflake connector programming error")
+        return jsonify({"sql": sql, "error": str(e)}), 400
+
+    batches = itertools.chain([] if first_batch is None else [first_batch], batches)
+
+    if response_format == "arrow":
+        return Response(stream_with_context(arrow_ipc_stream(batches)), mimetype="application/vnd.apache.arrow.stream")
 
-    return jsonify({"sql": sql, "results": results})
+    return Response(
+        stream_with_context(ndjson_stream(batches, application.json.dumps)), mimetype="application/x-ndjson"
+    )
 
 
 if __name__ == "__main__":
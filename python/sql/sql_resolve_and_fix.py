@@ -12,9 +12,11 @@ from python.sql.sql_inspector import SqlInspector
 from python.sql.sql_parser import SqlParser
 from python.sql.types import SimpleSchema
 from python.sql.utils.snowflake_keywords import SNOWFLAKE_KEYWORDS
+from python.utils.timings import timed
 
 
 class SqlResolveAndFix:
+    @timed("sql_fixup")
     def run(self, sql: str, simple_schema: SimpleSchema):
         ast = SqlParser().run(sql)
         SqlInspector(ast, simple_schema, SqlParser.in_dialect)
@@ -0,0 +1,53 @@
+from unittest import mock
+
+import faiss
+import numpy as np
+import pytest
+
+from python.embeddings.ann_faiss import AnnFaiss, normalized_copy
+from python.embeddings.index_policy import VALUE_FAMILY, IndexPolicy
+
+
+def vectors(rows: int) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((rows, 32)).astype(np.float32)
+
+
+# the tiers large value indexes are built with, see INDEX_TIERS
+@pytest.mark.parametrize("factory", ["Flat", "IVF16,Flat", "IVF16,SQ8"])
+def test_incremental_update(tmp_path, factory):
+    path = str(tmp_path / "values")
+    data = vectors(2000)
+    added = vectors(2100)[2000:]
+
+    policy = IndexPolicy(factory, {"nprobe": 16} if "IVF" in factory else {})
+    with mock.patch("python.embeddings.ann_faiss.index_policy", return_value=policy):
+        AnnFaiss().build_and_save(data, path, family=VALUE_FAMILY)
+
+    AnnFaiss().update_and_save(path, added, np.arange(2000, 2100), np.arange(100, 600))
+
+    index = AnnFaiss()
+    index.load(path)
+
+    assert index.index.ntotal == 1500 + 100
+
+    # kept and appended vectors are still found under their own ids, the removed ones are gone
+    for row, vector in [(50, data[50]), (1500, data[1500]), (2050, added[50])]:
+        _, ids = index.query(vector, 1)
+        assert ids[0] == row
+
+    _, ids = index.query(data[300], 10)
+    assert not set(ids) & set(range(100, 600))
+
+
+def test_rejects_removal_from_wrapped_ivf_index(tmp_path):
+    path = str(tmp_path / "values")
+    data = normalized_copy(vectors(1000))
+
+    # how IVF indexes used to be built
+    index = faiss.IndexIDMap(faiss.index_factory(32, "IVF16,Flat", faiss.METRIC_INNER_PRODUCT))
+    index.train(data)
+    index.add_with_ids(data, np.arange(1000, dtype=np.int64))
+    faiss.write_index(index, path + ".faiss")
+
+    with pytest.raises(RuntimeError):
+        AnnFaiss().update_and_save(path, vectors(1), np.array([1000]), np.array([0]))
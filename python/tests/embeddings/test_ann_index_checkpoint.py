@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from python.embeddings.ann_index import AnnIndex
+
+
+def fake_embedding(content: str) -> np.ndarray:
+    return np.full(8, len(content), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings():
+    with patch(
+        "python.embeddings.ann_index.generate_embeddings",
+        side_effect=lambda contents, embedder: [fake_embedding(content) for content in contents],
+    ):
+        yield
+
+
+def add_table(index: AnnIndex, table_id: int, values: list[str]):
+    for value in values:
+        index.add(value, table_id, None, value)
+
+    index.flush()
+
+
+def test_resume_keeps_completed_tables_only(tmp_path):
+    path = str(tmp_path / "value")
+
+    index = AnnIndex(path)
+    add_table(index, 1, ["a", "bb"])
+    add_table(index, 2, ["ccc"])
+    index.checkpoint()
+    add_table(index, 3, ["dddd"])
+    index.checkpoint()
+
+    # the import dies before table 2 is marked as completed
+    resumed = AnnIndex(path)
+    resumed.restore_checkpoint({1, 3})
+
+    assert [row[1:] for row in resumed.embedding_link_index.rows] == [
+        (1, None, "a"),
+        (1, None, "bb"),
+        (3, None, "dddd"),
+    ]
+    np.testing.assert_array_equal(
+        resumed.embeddings.view(), np.stack([fake_embedding("a"), fake_embedding("bb"), fake_embedding("dddd")])
+    )
+
+    # new rows are appended after the restored ones
+    add_table(resumed, 2, ["ccc"])
+    assert resumed.embedding_link_index.rows[-1] == (3, 2, None, "ccc")
+
+
+def test_checkpoint_ignores_rows_written_after_the_state(tmp_path):
+    path = str(tmp_path / "value")
+
+    index = AnnIndex(path)
+    add_table(index, 1, ["a"])
+    index.checkpoint()
+
+    # a checkpoint which died after appending links, but before writing its state
+    with open(path + ".links.0.jsonl", "a", encoding="utf-8") as f:
+        f.write('[2, null, "partial"')
+
+    resumed = AnnIndex(path)
+    resumed.restore_checkpoint({1, 2})
+
+    assert [row[1:] for row in resumed.embedding_link_index.rows] == [(1, None, "a")]
+
+
+def test_discard_checkpoint(tmp_path):
+    path = str(tmp_path / "value")
+
+    index = AnnIndex(path)
+    add_table(index, 1, ["a"])
+    index.checkpoint()
+    index.discard_checkpoint()
+
+    resumed = AnnIndex(path)
+    resumed.restore_checkpoint({1})
+
+    assert not resumed.embedding_link_index.rows
+    assert not list(tmp_path.iterdir())
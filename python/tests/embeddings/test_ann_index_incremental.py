@@ -0,0 +1,64 @@
+import zlib
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from python.embeddings.ann_faiss import AnnFaiss
+from python.embeddings.ann_index import AnnIndex
+from python.embeddings.embedding_link_index import EmbeddingLinkIndex
+from python.embeddings.index_policy import VALUE_FAMILY, IndexPolicy
+
+
+def fake_embedding(content: str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(content.encode())).standard_normal(16).astype(np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings():
+    with patch(
+        "python.embeddings.ann_index.generate_embeddings",
+        side_effect=lambda contents, embedder: [fake_embedding(content) for content in contents],
+    ):
+        yield
+
+
+def import_tables(path: str, tables: dict[int, list[str]], incremental: bool):
+    index = AnnIndex(path, family=VALUE_FAMILY, incremental=incremental)
+
+    for table_id, values in tables.items():
+        index.remove_table(table_id)
+
+        for value in values:
+            index.add(value, table_id, None, value)
+
+    index.flush()
+    index.save()
+
+
+@pytest.mark.parametrize("factory", ["Flat", "IVF4,Flat"])
+def test_reimporting_a_table_replaces_its_links(tmp_path, factory):
+    path = str(tmp_path / "value")
+    policy = IndexPolicy(factory, {"nprobe": 4} if "IVF" in factory else {})
+
+    with patch("python.embeddings.ann_faiss.index_policy", return_value=policy):
+        import_tables(path, {1: [f"one {i}" for i in range(100)], 2: [f"two {i}" for i in range(100)]}, False)
+
+    # the same table imported twice, the second time with fewer values
+    import_tables(path, {1: [f"new one {i}" for i in range(100)]}, True)
+    import_tables(path, {1: [f"newer one {i}" for i in range(50)]}, True)
+
+    links = EmbeddingLinkIndex(path)
+    links.load_rows()
+
+    assert len(links.rows) == 150
+    assert sorted(row[3] for row in links.rows if row[1] == 1) == sorted(f"newer one {i}" for i in range(50))
+
+    faiss_index = AnnFaiss()
+    faiss_index.load(path)
+    assert faiss_index.index.ntotal == 150
+
+    # every vector still points at its own link
+    for value in ["two 0", "two 99", "newer one 0", "newer one 49"]:
+        _, ids = faiss_index.query(fake_embedding(value), 1)
+        assert links.value(ids[0]) == value
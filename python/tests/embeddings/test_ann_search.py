@@ -0,0 +1,65 @@
+import numpy as np
+
+from python.embeddings.ann_search import AnnSearchResults, merge_results
+from python.embeddings.embedding_link_index import EmbeddingLinkIndex
+from python.sql.types import DbElementIds
+
+
+def search_results(tmp_path, name: str, hits: list[tuple[float, int, int | None, str | None]]) -> AnnSearchResults:
+    links = EmbeddingLinkIndex(str(tmp_path / name))
+    for idx, (_, table_id, column_id, value) in enumerate(hits):
+        links.add(idx, table_id, column_id, value)
+
+    links.save()
+    links.load()
+
+    offsets = np.arange(len(hits))
+    table_ids, column_ids = links.query_many(offsets)
+    scores = np.array([hit[0] for hit in hits], dtype=np.float32)
+
+    return AnnSearchResults(scores, offsets, table_ids, column_ids, links)
+
+
+def test_merge_results(tmp_path):
+    first = search_results(tmp_path, "first", [(0.9, 1, None, None), (0.5, 2, 3, "Montana"), (0.25, 2, 3, None)])
+    second = search_results(tmp_path, "second", [(0.75, 2, 3, "Montana"), (0.5, 4, None, None), (0.5, 1, None, None)])
+
+    merged = merge_results([first, second])
+
+    # the same value from two different link indexes is the same element
+    assert merged.elements == [
+        DbElementIds(1, None, None),
+        DbElementIds(2, 3, "Montana"),
+        DbElementIds(2, 3, None),
+        DbElementIds(4, None, None),
+    ]
+    np.testing.assert_allclose(merged.scores, [[0.9, 0.5, 0.25, np.nan], [0.5, 0.75, np.nan, 0.5]])
+
+    # matches building the elements hit by hit
+    for idx, results in enumerate([first, second]):
+        assert {element: score for score, element in results} == {
+            element: score
+            for element, score in zip(merged.elements, merged.scores[idx].tolist())
+            if not np.isnan(score)
+        }
+
+
+def test_merge_no_results(tmp_path):
+    merged = merge_results([search_results(tmp_path, "empty", [])])
+
+    assert not merged.elements
+    assert merged.scores.shape == (1, 0)
+
+
+def test_merge_element_found_twice_by_one_search(tmp_path):
+    results = search_results(
+        tmp_path, "values", [(0.9, 2, 3, "Montana"), (0.5, 1, None, None), (0.25, 2, 3, "Montana")]
+    )
+
+    merged = merge_results([results])
+
+    assert merged.elements == [DbElementIds(2, 3, "Montana"), DbElementIds(1, None, None)]
+    np.testing.assert_allclose(merged.scores, [[0.9, 0.5]])
+
+    # the score the training ranker used to end up with, setting the score of every hit in order
+    np.testing.assert_allclose(merge_results([results], keep_last=True).scores, [[0.25, 0.5]])
@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from python.embeddings.embedding import generate_embedding
+from python.embeddings.embedding import batch_by_token_budget, generate_embedding
 from python.embeddings.openai_embedder import OpenAIEmbedder
 
 
@@ -12,3 +12,12 @@ def test_embedding():
     # TODO no idea what an effective test here is...
     assert isinstance(e, np.ndarray)
     assert len(e) > 1000
+
+
+def test_batch_by_token_budget():
+    contents = ["hello world"] * 5
+
+    assert [len(batch) for batch in batch_by_token_budget(contents, max_batch_size=2)] == [2, 2, 1]
+
+    # "hello world" is two tokens
+    assert [len(batch) for batch in batch_by_token_budget(contents, max_batch_tokens=5)] == [2, 2, 1]
@@ -0,0 +1,37 @@
+import io
+
+import numpy as np
+
+from python.embeddings.embedding_cache import (
+    decode_embedding,
+    encode_embedding,
+    get_many,
+    put_many,
+)
+
+from prisma import Base64
+
+
+def test_embedding_round_trip():
+    embedding = np.random.rand(1536).astype(np.float32)
+
+    assert np.array_equal(decode_embedding(encode_embedding(embedding)), embedding)
+
+
+def test_decodes_legacy_npz_embeddings():
+    embedding = np.random.rand(1536).astype(np.float32)
+
+    legacy = io.BytesIO()
+    np.savez_compressed(legacy, x=embedding)
+
+    assert np.array_equal(decode_embedding(Base64.encode(legacy.getvalue())), embedding)
+
+
+def test_bulk_put_and_get():
+    embeddings = {"hash-one": np.random.rand(8).astype(np.float32), "hash-two": np.random.rand(8).astype(np.float32)}
+
+    put_many(embeddings)
+    found = get_many(["hash-one", "hash-two", "hash-missing"])
+
+    assert found.keys() == embeddings.keys()
+    assert np.array_equal(found["hash-one"], embeddings["hash-one"])
@@ -0,0 +1,19 @@
+import numpy as np
+
+from python.embeddings.embedding_matrix import EmbeddingMatrix
+
+
+def test_embedding_matrix_grows(tmp_path):
+    matrix = EmbeddingMatrix(str(tmp_path / "index.embeddings.f32"), initial_capacity=2)
+    expected = np.random.default_rng(0).random((7, 4), dtype=np.float32)
+
+    matrix.append(expected[0])
+    matrix.append(expected[1:5])
+    matrix.append(expected[5:])
+
+    assert len(matrix) == 7
+    np.testing.assert_array_equal(matrix.view(), expected)
+
+    matrix.delete()
+    assert not (tmp_path / "index.embeddings.f32").exists()
+    assert len(matrix.view()) == 0
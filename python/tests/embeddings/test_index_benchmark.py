@@ -0,0 +1,26 @@
+from python.embeddings.index_benchmark import (
+    Candidate,
+    benchmark_indexes,
+    query_set,
+    synthetic_embeddings,
+)
+
+
+def test_benchmark_indexes():
+    data = synthetic_embeddings(2000, dimensions=32, clusters=10)
+
+    report = benchmark_indexes(
+        data,
+        query_set(data, 20),
+        k=5,
+        candidates=[Candidate("Flat", {}), Candidate("IVF{nlist},Flat", {"nprobe": 4})],
+    )
+
+    assert report["rows"] == 2000
+    assert [result["factory"] for result in report["results"]] == ["Flat", "IVF178,Flat"]
+
+    flat, ivf = report["results"]
+    assert flat["recall_at_5"] == 1.0
+    assert 0 < ivf["recall_at_5"] <= 1.0
+    assert flat["disk_bytes"] > 0
+    assert flat["latency_p99_ms"] >= flat["latency_p50_ms"]
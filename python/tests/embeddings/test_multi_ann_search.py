@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from python.embeddings.ann_faiss import AnnFaiss
+from python.embeddings.ann_search import AnnSearch
+from python.embeddings.embedding_link_index import EmbeddingLinkIndex
+from python.embeddings.multi_ann_search import INDEX_NAMES, MultiAnnSearch
+
+
+@pytest.fixture
+def indexes_path(tmp_path):
+    rng = np.random.default_rng(0)
+
+    # a small index for each name, pointing at different tables
+    for table_id, name in enumerate(INDEX_NAMES, start=1):
+        path = str(tmp_path / name)
+        links = EmbeddingLinkIndex(path)
+
+        for idx in range(20):
+            links.add(idx, table_id, idx, f"{name} {idx}")
+
+        links.save()
+        AnnFaiss().build_and_save(rng.standard_normal((20, 8)).astype(np.float32), path)
+
+    return str(tmp_path)
+
+
+def test_matches_searching_one_index_at_a_time(indexes_path):
+    query = np.random.default_rng(1).standard_normal(8).astype(np.float32)
+    number_of_matches = {name: 5 + idx for idx, name in enumerate(INDEX_NAMES)}
+
+    results = MultiAnnSearch(indexes_path).search(query, number_of_matches)
+
+    assert list(results) == INDEX_NAMES
+
+    for name in INDEX_NAMES:
+        expected = AnnSearch(f"{indexes_path}/{name}").search(query, number_of_matches[name])
+        assert list(results[name]) == list(expected)
+
+
+def test_raises_search_errors(indexes_path):
+    searcher = MultiAnnSearch(indexes_path)
+
+    with patch.object(searcher.indexes["value"], "search", side_effect=RuntimeError("broken index")):
+        with pytest.raises(RuntimeError, match="broken index"):
+            searcher.search(np.ones(8, dtype=np.float32), {name: 5 for name in INDEX_NAMES})
@@ -0,0 +1,17 @@
+from python.embeddings.string_table import StringTable
+
+
+def test_string_table_round_trip(tmp_path):
+    strings = ["Montana", "", "São Paulo", "a much longer value with spaces"]
+
+    StringTable.build(strings).save(str(tmp_path / "values"))
+    table = StringTable.load(str(tmp_path / "values"))
+
+    assert len(table) == len(strings)
+    assert [table[idx] for idx in range(len(table))] == strings
+
+
+def test_empty_string_table(tmp_path):
+    StringTable.build([]).save(str(tmp_path / "values"))
+
+    assert len(StringTable.load(str(tmp_path / "values"))) == 0
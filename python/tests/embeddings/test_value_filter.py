@@ -0,0 +1,27 @@
+from python.embeddings.value_filter import filter_values, is_candidate_value
+from python.utils.entropy import token_entropy
+
+
+def test_is_candidate_value():
+    assert is_candidate_value("Enterprise")
+    # short hex strings might be actual words
+    assert is_candidate_value("deadbeef")
+
+    assert not is_candidate_value("")
+    assert not is_candidate_value("-12.5")
+    assert not is_candidate_value("0123456789abcdef0123456789abcdef")
+    assert not is_candidate_value("x" * 101)
+
+
+def test_filter_values():
+    values = ["Enterprise", "42", "North America", "a1b2c3d4e5f6a7b8c9d0e1f2", "Self Serve"]
+
+    filtered = filter_values(values)
+
+    assert [value for value, _ in filtered] == ["Enterprise", "North America", "Self Serve"]
+    assert all(entropy == token_entropy(value) for value, entropy in filtered)
+
+
+def test_filter_values_drops_low_entropy_values():
+    # GUID-like values tokenize into many short tokens
+    assert not filter_values(["3f2b9c1e-7a4d-4c8e-9b1a-2d6f8e0c4a7b"])
@@ -1,9 +1,10 @@
 import json
-import pickle
 import typing as t
+from threading import Timer
 from unittest.mock import patch
 
-from python.query_runner import _cache_query_result, run_query
+from python.query_runner import _cache_query_result, _query_cache_key, run_query
+from python.query_runner.query_result import QueryResult
 from python.utils.db import application_database_connection
 from python.utils.redis import application_redis_connection
 
@@ -38,9 +39,9 @@ def test_caches_result(run_snowflake_query):
     assert len(keys) == 1
     key = keys[0]
 
-    pickle_str = redis.get(key)
-    assert pickle_str is not None
-    assert pickle.loads(pickle_str) == results
+    cached_result = redis.get(key)
+    assert cached_result is not None
+    assert QueryResult.decode(cached_result).rows() == results
 
 
 @patch("python.query_runner.run_snowflake_query", return_value=[{"COUNT": 1}])
@@ -59,3 +60,42 @@ def test_uses_cache(run_snowflake_query):
 
     assert results == run_snowflake_query.return_value
     assert run_snowflake_query.call_count == 0
+
+
+@patch("python.query_runner.get_data_source")
+@patch("python.query_runner.run_snowflake_query", return_value=[{"COUNT": 1}])
+def test_cache_hit_skips_data_source_lookup(run_snowflake_query, get_data_source):
+    sql = "SELECT * FROM ORDERS"
+    _cache_query_result(1, sql, run_snowflake_query.return_value)
+
+    results = run_query(1, sql, allow_cached_queries=True)
+
+    assert results == run_snowflake_query.return_value
+    get_data_source.assert_not_called()
+
+
+@patch("python.query_runner.run_snowflake_query", return_value=[{"COUNT": 1}])
+def test_accepts_data_source_record(run_snowflake_query):
+    data_source = make_data_source()
+
+    assert run_query(data_source, "SELECT 1") == run_snowflake_query.return_value
+    assert run_snowflake_query.call_args.args[0] == data_source
+
+
+@patch("python.query_runner.run_snowflake_query", return_value=[{"COUNT": 1}])
+def test_waits_for_query_running_in_another_process(run_snowflake_query):
+    sql = "SELECT * FROM ORDERS"
+    data_source = make_data_source()
+
+    # another process is already running the query
+    lock = redis.lock(f"{_query_cache_key(data_source.id, sql)}-lock", timeout=5)
+    assert lock.acquire(blocking=False)
+
+    def finish_query():
+        _cache_query_result(data_source.id, sql, [{"COUNT": 2}])
+        lock.release()
+
+    Timer(0.2, finish_query).start()
+
+    assert run_query(data_source, sql, allow_cached_queries=True) == [{"COUNT": 2}]
+    assert run_snowflake_query.call_count == 0
@@ -0,0 +1,55 @@
+from python.query_runner.column_values import (
+    column_values_sql,
+    load_column_values,
+    sample_clause,
+)
+
+
+def normalize_whitespace(raw_sql: str) -> str:
+    return " ".join(raw_sql.split())
+
+
+def test_sample_clause():
+    assert sample_clause(None, sample_rows=1_000) == ""
+    assert sample_clause(1_000, sample_rows=1_000) == ""
+    assert sample_clause(50_000, sample_rows=1_000) == "SAMPLE (1000 ROWS)"
+    assert sample_clause(1_000_000, sample_rows=1_000) == "SAMPLE SYSTEM (0.100000) SEED (0)"
+
+
+def test_column_values_sql():
+    raw_sql = normalize_whitespace(column_values_sql("DB.SCHEMA.ORDERS", ["STATUS", 'WEIRD "NAME"'], 10))
+
+    assert 'SELECT "STATUS"::VARCHAR AS "VALUE_0", "WEIRD ""NAME"""::VARCHAR AS "VALUE_1"' in raw_sql
+    assert 'FROM DB.SCHEMA."ORDERS" )' in raw_sql
+    assert 'UNPIVOT (VALUE FOR COLUMN_NAME IN ("VALUE_0", "VALUE_1"))' in raw_sql
+    assert "ROW_NUMBER() OVER (PARTITION BY COLUMN_NAME ORDER BY COUNT(*) DESC) <= 10" in raw_sql
+
+
+def test_column_values_sql_samples_large_tables():
+    raw_sql = column_values_sql("DB.SCHEMA.ORDERS", ["STATUS"], 10, row_count=5_000, sample_rows=1_000)
+
+    assert 'FROM DB.SCHEMA."ORDERS" SAMPLE (1000 ROWS)' in raw_sql
+
+
+def test_load_column_values():
+    queries = []
+
+    def run(raw_sql):
+        queries.append(raw_sql)
+        return [
+            {"COLUMN_NAME": "VALUE_0", "VALUE": "shipped", "COUNT": 10},
+            {"COLUMN_NAME": "VALUE_0", "VALUE": "pending", "COUNT": 4},
+            {"COLUMN_NAME": "VALUE_1", "VALUE": "EU", "COUNT": 7},
+        ]
+
+    values = load_column_values(run, "DB.SCHEMA.ORDERS", ["STATUS", "REGION", "NOTES"], 10)
+
+    assert len(queries) == 1
+    assert values == {"STATUS": ["shipped", "pending"], "REGION": ["EU"], "NOTES": []}
+
+
+def test_load_column_values_without_columns():
+    def run(raw_sql):
+        raise AssertionError("no query should run")
+
+    assert not load_column_values(run, "DB.SCHEMA.ORDERS", [], 10)
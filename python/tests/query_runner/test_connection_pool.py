@@ -0,0 +1,89 @@
+from threading import Thread
+
+import pytest
+
+from python.query_runner.connection_pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool(
+        connect=connect,
+        close=lambda connection: setattr(connection, "closed", True),
+        is_healthy=lambda connection: connection.healthy,
+        **kwargs,
+    )
+    return pool, opened
+
+
+def test_reuses_connections():
+    pool, opened = make_pool()
+
+    for _ in range(3):
+        with pool.connection():
+            pass
+
+    assert len(opened) == 1
+    assert pool.stats() == {"size": 1, "idle": 1, "max_size": 20}
+
+
+def test_drops_unhealthy_connections():
+    pool, opened = make_pool(health_check_after_seconds=0)
+
+    with pool.connection() as connection:
+        connection.healthy = False
+
+    with pool.connection() as connection:
+        assert connection is opened[1]
+
+    assert opened[0].closed
+
+
+def test_evicts_idle_connections():
+    pool, opened = make_pool(max_idle_seconds=0)
+
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+
+    assert len(opened) == 2
+    assert opened[0].closed
+
+
+def test_times_out_when_exhausted():
+    pool, _ = make_pool(max_size=1, checkout_timeout_seconds=0.01)
+
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+
+
+def test_waits_for_a_connection():
+    pool, opened = make_pool(max_size=2)
+
+    def use_connection():
+        for _ in range(20):
+            with pool.connection():
+                pass
+
+    threads = [Thread(target=use_connection) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(opened) <= 2
+    assert pool.stats()["size"] == len(opened)
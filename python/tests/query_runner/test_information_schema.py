@@ -0,0 +1,49 @@
+from python.query_runner.information_schema import load_schema_metadata
+
+TABLE = {
+    "TABLE_CATALOG": "DB",
+    "TABLE_SCHEMA": "SHOPIFY",
+    "TABLE_NAME": "ORDERS",
+    "ROW_COUNT": 42,
+    "BYTES": 1024,
+    "COMMENT": None,
+    "CREATED": None,
+}
+
+
+def column(name, data_type, length=None, precision=None, scale=None, datetime_precision=None, nullable="YES"):
+    return {
+        "TABLE_NAME": "ORDERS",
+        "COLUMN_NAME": name,
+        "DATA_TYPE": data_type,
+        "CHARACTER_MAXIMUM_LENGTH": length,
+        "NUMERIC_PRECISION": precision,
+        "NUMERIC_SCALE": scale,
+        "DATETIME_PRECISION": datetime_precision,
+        "IS_NULLABLE": nullable,
+        "COLUMN_DEFAULT": None,
+        "COMMENT": None,
+    }
+
+
+def test_load_schema_metadata():
+    columns = [
+        column("ID", "NUMBER", precision=38, scale=0, nullable="NO"),
+        column("NAME", "TEXT", length=16777216),
+        column("CREATED_AT", "TIMESTAMP_NTZ", datetime_precision=9),
+        column("TOTAL", "FLOAT"),
+        column("PROPERTIES", "VARIANT"),
+    ]
+
+    metadata = load_schema_metadata(lambda raw_sql: [TABLE] if "INFORMATION_SCHEMA.TABLES" in raw_sql else columns, 10)
+
+    assert [(table["name"], table["database_name"], table["rows"]) for table in metadata.tables] == [
+        ("ORDERS", "DB", 42)
+    ]
+    assert [(column["name"], column["type"], column["null?"]) for column in metadata.columns["ORDERS"]] == [
+        ("ID", "NUMBER(38,0)", "N"),
+        ("NAME", "VARCHAR(16777216)", "Y"),
+        ("CREATED_AT", "TIMESTAMP_NTZ(9)", "Y"),
+        ("TOTAL", "FLOAT", "Y"),
+        ("PROPERTIES", "VARIANT", "Y"),
+    ]
@@ -0,0 +1,44 @@
+import datetime
+import pickle
+from decimal import Decimal
+
+from python.query_runner.query_result import QueryResult
+
+ROWS = [
+    {"ID": 1, "NAME": "Montana", "TOTAL": Decimal("1.50"), "CREATED_AT": datetime.date(2023, 1, 1)},
+    {"ID": 2, "NAME": None, "TOTAL": Decimal("0"), "CREATED_AT": datetime.date(2023, 1, 2)},
+]
+
+
+def test_round_trip():
+    decoded = QueryResult.decode(QueryResult(rows=ROWS).encode())
+
+    assert len(decoded) == 2
+    assert list(decoded.iter_rows()) == ROWS
+    assert decoded.rows() == ROWS
+
+
+def test_round_trip_without_shared_columns():
+    rows = [{"COUNT": 1}, {"error": "syntax error"}]
+
+    assert QueryResult.decode(QueryResult(rows=rows).encode()).rows() == rows
+
+
+def test_empty_result():
+    decoded = QueryResult.decode(QueryResult(rows=[]).encode())
+
+    assert len(decoded) == 0
+    assert decoded.rows() == []
+
+
+def test_decodes_legacy_pickled_results():
+    assert QueryResult.decode(pickle.dumps(ROWS)).rows() == ROWS
+
+
+def test_copy():
+    for result in [QueryResult(rows=[dict(row) for row in ROWS]), QueryResult.decode(QueryResult(rows=ROWS).encode())]:
+        copied = result.copy()
+        copied.rows()[0]["NAME"] = "Idaho"
+        copied.rows().pop()
+
+        assert result.rows() == ROWS
@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from python.query_runner.scheduler import (
+    MAX_CONCURRENT_QUERIES,
+    QueryScheduler,
+    column_statistics_sql,
+    run_import_query,
+)
+
+
+def normalize_whitespace(raw_sql: str) -> str:
+    return " ".join(raw_sql.split())
+
+
+def test_column_statistics_sql():
+    raw_sql = column_statistics_sql("DB.SCHEMA.ORDERS", ["ID", 'WEIRD "NAME"'])
+
+    assert normalize_whitespace(raw_sql) == (
+        'SELECT COUNT(*) AS "ROW_COUNT", COUNT(DISTINCT "ID") AS "DISTINCT_0", '
+        'COUNT(DISTINCT "WEIRD ""NAME""") AS "DISTINCT_1" FROM DB.SCHEMA."ORDERS"'
+    )
+
+
+def test_approximate_column_statistics_sql():
+    raw_sql = column_statistics_sql("DB.SCHEMA.ORDERS", ["ID"], approximate=True)
+
+    assert 'APPROX_COUNT_DISTINCT("ID") AS "DISTINCT_0"' in raw_sql
+
+
+def test_import_queries_share_the_data_source_slots():
+    data_source = SimpleNamespace(id=12345)
+    running = 0
+    most_running = 0
+    lock = Lock()
+
+    def slow_query(*args, **kwargs):
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+
+        time.sleep(0.01)
+
+        with lock:
+            running -= 1
+
+        return [{}]
+
+    with patch("python.query_runner.scheduler.run_query", side_effect=slow_query):
+        scheduler = QueryScheduler(data_source)
+
+        # metadata queries through the scheduler and value extraction queries from their own threads
+        futures = [scheduler.submit("SELECT 1") for _ in range(20)]
+        with ThreadPoolExecutor(max_workers=8) as extraction:
+            list(extraction.map(lambda _: run_import_query(data_source, "SELECT 2"), range(20)))
+
+        for future in futures:
+            future.result()
+
+        scheduler.shutdown()
+
+    assert most_running == MAX_CONCURRENT_QUERIES
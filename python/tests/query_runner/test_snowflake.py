@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from python.query_runner.snowflake import (
+    close_snowflake_connection_pools,
+    snowflake_cursor,
+)
+
+
+class FakeSession:
+    """
+    Keeps track of the session's context the way the connector does, from the (upper cased) names snowflake resolves
+    """
+
+    def __init__(self):
+        self.warehouse = None
+        self.database = None
+        self.schema = None
+        self.statements = []
+
+    def cursor(self, cursor_class=None):
+        return self
+
+    def execute(self, statement: str):
+        self.statements.append(statement)
+        words = statement.rstrip(";").upper().split()
+
+        if words[:2] == ["USE", "WAREHOUSE"]:
+            self.warehouse = words[2]
+        elif words[:2] == ["USE", "SCHEMA"]:
+            self.schema = words[2]
+        elif words[0] == "USE":
+            self.database, self.schema = words[1].split(".")
+
+    def is_closed(self):
+        return False
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def data_source():
+    yield SimpleNamespace(
+        id=1,
+        credentials={
+            "username": "user",
+            "password": "password",
+            "account": "account",
+            "warehouse": "compute_wh",
+            "database": "analytics",
+            "schema": "public",
+        },
+    )
+
+    close_snowflake_connection_pools()
+
+
+def test_checkout_restores_the_data_source_context(data_source):
+    session = FakeSession()
+
+    with patch("snowflake.connector.connect", return_value=session):
+        with snowflake_cursor(data_source) as cursor:
+            cursor.execute("USE SCHEMA other")
+
+        with snowflake_cursor(data_source):
+            assert (session.warehouse, session.database, session.schema) == ("COMPUTE_WH", "ANALYTICS", "PUBLIC")
+
+    # the pooled connection was reused, only the schema had to be switched back
+    assert session.statements == [
+        "use warehouse compute_wh;",
+        "use analytics.public;",
+        "USE SCHEMA other",
+        "use analytics.public;",
+    ]
+
+
+def test_checkout_without_context_changes(data_source):
+    session = FakeSession()
+
+    with patch("snowflake.connector.connect", return_value=session):
+        for _ in range(3):
+            with snowflake_cursor(data_source) as cursor:
+                cursor.execute("SELECT 1")
+
+    assert session.statements == ["use warehouse compute_wh;", "use analytics.public;"] + ["SELECT 1"] * 3
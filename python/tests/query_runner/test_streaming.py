@@ -0,0 +1,62 @@
+import io
+import json
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import pytest
+import snowflake.connector
+
+from python.query_runner.snowflake import stream_snowflake_query
+from python.query_runner.streaming import arrow_ipc_stream, ndjson_stream
+
+
+def test_ndjson_stream():
+    batches = [[{"ID": 1}, {"ID": 2}], [], [{"ID": 3}]]
+
+    chunks = list(ndjson_stream(batches, json.dumps))
+
+    assert len(chunks) == 2
+    assert [json.loads(line) for line in "".join(chunks).splitlines()] == [{"ID": 1}, {"ID": 2}, {"ID": 3}]
+
+
+def test_arrow_ipc_stream():
+    pa = pytest.importorskip("pyarrow")
+
+    batches = [pa.table({"ID": [1, 2]}), pa.table({"ID": [3]})]
+    stream = b"".join(arrow_ipc_stream(batches))
+
+    assert pa.ipc.open_stream(io.BytesIO(stream)).read_all().to_pydict() == {"ID": [1, 2, 3]}
+
+    # tables are also accepted by the ndjson encoder
+    assert "".join(ndjson_stream(batches, json.dumps)).count("\n") == 3
+
+
+class ShowCursor:
+    """
+    A cursor for a result snowflake can't send as arrow, like SHOW TABLES
+    """
+
+    def __init__(self):
+        self.batches = [[{"name": "ORDERS"}, {"name": "CUSTOMERS"}], []]
+
+    def execute(self, sql):
+        pass
+
+    def fetch_arrow_batches(self):
+        raise snowflake.connector.errors.NotSupportedError("not an arrow result")
+
+    def fetchmany(self, size):
+        return self.batches.pop(0)
+
+
+def test_arrow_stream_of_non_arrow_result():
+    pa = pytest.importorskip("pyarrow")
+
+    @contextmanager
+    def show_cursor(data_source):
+        yield ShowCursor()
+
+    with patch("python.query_runner.snowflake.snowflake_cursor", show_cursor):
+        batches = list(stream_snowflake_query(None, "SHOW TABLES", disable_query_protections=True, arrow=True))
+
+    assert pa.concat_tables(batches).to_pydict() == {"name": ["ORDERS", "CUSTOMERS"]}
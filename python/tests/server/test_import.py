@@ -12,3 +12,9 @@ def test_basic_import(client):
     Importer(data_source_id=data_source_id, table_limit=1, column_limit=1, column_value_limit=1)
 
     breakpoint()
+
+
+def test_table_names_require_incremental():
+    # a full import of some tables would rebuild the indexes without all of the others
+    with pytest.raises(ValueError):
+        Importer(data_source_id=1, table_limit=1, column_limit=1, column_value_limit=1, table_names=["ORDERS"])
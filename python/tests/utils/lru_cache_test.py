@@ -0,0 +1,30 @@
+from python.utils.lru_cache import BoundedLRUCache
+
+
+def test_evicts_least_recently_used_entry():
+    cache = BoundedLRUCache(max_entries=2, max_bytes=100, sizeof=len)
+
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats() == {"entries": 2, "bytes": 2, "hits": 3, "misses": 1}
+
+
+def test_evicts_by_size():
+    cache = BoundedLRUCache(max_entries=10, max_bytes=5, sizeof=len)
+
+    cache.put("a", "123")
+    cache.put("b", "456")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "456"
+
+    # larger than the whole cache, never stored
+    cache.put("c", "123456")
+    assert cache.get("c") is None
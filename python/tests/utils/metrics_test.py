@@ -0,0 +1,74 @@
+import pytest
+
+from python.utils.metrics import Counter, Gauge, Histogram, counter, histogram, render
+
+
+def test_histogram_buckets():
+    latency = Histogram("latency_seconds", "latency", labels=("stage",), buckets=(0.1, 1.0))
+
+    latency.observe(0.05, stage="ranking")
+    latency.observe(0.1, stage="ranking")
+    latency.observe(0.5, stage="ranking")
+    latency.observe(5, stage="ranking")
+    latency.observe(0.2, stage="prompt")
+
+    cumulative, count, total = latency.snapshot()[("ranking",)]
+
+    # an observation on a bucket boundary is counted in that bucket
+    assert cumulative == [2, 3]
+    assert count == 4
+    assert total == 5.65
+
+    assert latency.snapshot()[("prompt",)][0] == [0, 1]
+
+
+def test_histogram_registry():
+    assert histogram("registry_test_seconds", "test") is histogram("registry_test_seconds", "test")
+
+    with pytest.raises(ValueError):
+        counter("registry_test_seconds", "test")
+
+
+def test_counter_and_gauge():
+    requests = Counter("requests_total", "requests", labels=("result",))
+    requests.inc(result="hit")
+    requests.inc(2, result="hit")
+
+    assert requests.value(result="hit") == 3
+    assert requests.value(result="miss") == 0
+
+    with pytest.raises(ValueError):
+        requests.inc(-1, result="hit")
+
+    waiting = Gauge("waiting", "waiting")
+    waiting.inc()
+    waiting.inc()
+    waiting.dec()
+
+    assert waiting.value() == 1
+
+
+def test_render():
+    requests = Counter("requests_total", "Requests\nhandled", labels=("route",))
+    requests.inc(route='/say "hi"')
+
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+
+    rendered = render({"requests_total": requests, "latency_seconds": latency, "idle": Gauge("idle", "Idle")})
+
+    assert rendered == (
+        "# HELP idle Idle\n"
+        "# TYPE idle gauge\n"
+        "idle 0\n"
+        "# HELP latency_seconds Latency\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 0\n'
+        'latency_seconds_bucket{le="1"} 1\n'
+        'latency_seconds_bucket{le="+Inf"} 1\n'
+        "latency_seconds_sum 0.5\n"
+        "latency_seconds_count 1\n"
+        "# HELP requests_total Requests\\nhandled\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/say \\"hi\\""} 1\n'
+    )
@@ -2,6 +2,7 @@ from unittest import mock
 
 import pytest
 
+from python.utils.metrics import RATE_LIMITER_WAIT_SECONDS, RATE_LIMITER_WAITING
 from python.utils.multi_bucket_limiter import MultiBucketLimiter
 
 sleeps = []
@@ -57,3 +58,19 @@ def test_can_bucket_limiter_multi_limit():
                 pass
 
     assert sleeps == [12.0]
+
+
+def test_bucket_limiter_reports_waiting_requests():
+    _, waits_before, _ = RATE_LIMITER_WAIT_SECONDS.snapshot()[()]
+    limiter = MultiBucketLimiter({"requests": 2, "tokens": 10})
+
+    with limiter.request_when_available({"requests": 1, "tokens": 0}):
+        # the request is no longer waiting once its block runs
+        assert RATE_LIMITER_WAITING.value() == 0
+
+    with pytest.raises(RuntimeError):
+        with limiter.request_when_available({"requests": 1, "tokens": 0}):
+            raise RuntimeError("request failed")
+
+    assert RATE_LIMITER_WAITING.value() == 0
+    assert RATE_LIMITER_WAIT_SECONDS.snapshot()[()][1] == waits_before + 2
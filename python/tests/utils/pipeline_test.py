@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from python.utils.pipeline import Pipeline, Stage
+
+
+def test_runs_items_through_every_stage():
+    results = []
+    results_lock = threading.Lock()
+
+    def collect(item):
+        with results_lock:
+            results.append(item)
+
+    pipeline = Pipeline(
+        [
+            Stage("double", lambda item: item * 2, concurrency=3),
+            # odd numbers are dropped
+            Stage("filter", lambda item: item if item % 4 == 0 else None, concurrency=2),
+            Stage("collect", collect),
+        ]
+    )
+
+    for item in range(10):
+        pipeline.submit(item)
+
+    pipeline.finish()
+
+    assert sorted(results) == [0, 4, 8, 12, 16]
+
+
+def test_bounded_queues_apply_backpressure():
+    release = threading.Event()
+    processed = []
+
+    def slow(item):
+        release.wait()
+        processed.append(item)
+
+    pipeline = Pipeline([Stage("slow", slow, queue_size=1)])
+
+    # one item is picked up by the worker and one sits in the queue, the third has to wait for room
+    pipeline.submit(1)
+    pipeline.submit(2)
+
+    blocked = threading.Thread(target=pipeline.submit, args=(3,))
+    blocked.start()
+    blocked.join(timeout=0.1)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join()
+    pipeline.finish()
+
+    assert processed == [1, 2, 3]
+
+
+def test_raises_stage_errors():
+    def failing(item):
+        raise ValueError(f"boom {item}")
+
+    pipeline = Pipeline([Stage("failing", failing)])
+    pipeline.submit(1)
+
+    with pytest.raises(ValueError):
+        pipeline.finish()
+
+    with pytest.raises(RuntimeError):
+        pipeline.submit(2)
@@ -0,0 +1,71 @@
+import json
+import threading
+
+from python.utils import progress
+from python.utils.progress import Progress, format_duration, report_periodically
+
+
+def test_counts_only_while_tracked():
+    job = Progress()
+
+    progress.increment("queries")
+
+    with progress.track(job):
+        progress.increment("queries")
+        progress.increment("embedding_tokens", 120)
+        with progress.timer("warehouse_queries"):
+            pass
+
+    progress.increment("queries")
+
+    snapshot = job.snapshot()
+    assert snapshot["counters"] == {"queries": 1, "embedding_tokens": 120}
+    assert "warehouse_queries" in snapshot["timers_seconds"]
+
+
+def test_counts_from_other_threads():
+    job = Progress()
+
+    with progress.track(job):
+        threads = [threading.Thread(target=progress.increment, args=("values",)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert job.counters["values"] == 10
+
+
+def test_eta():
+    job = Progress()
+    assert job.eta_seconds("tables") is None
+
+    job.set_total("tables", 4)
+    job.increment("tables")
+    job.started_at -= 10
+
+    assert round(job.eta_seconds("tables")) == 30
+    assert job.summary_line("tables").startswith("tables 1/4")
+
+
+def test_write_summary(tmp_path):
+    job = Progress()
+    job.increment("columns", 3)
+
+    path = tmp_path / "1" / "import_summary.json"
+    job.write_summary(str(path))
+
+    assert json.loads(path.read_text())["counters"] == {"columns": 3}
+
+
+def test_report_periodically_reports_when_done():
+    reports = []
+
+    with report_periodically(Progress(), reports.append, interval_seconds=60):
+        pass
+
+    assert len(reports) == 1
+
+
+def test_format_duration():
+    assert format_duration(3725) == "1:02:05"
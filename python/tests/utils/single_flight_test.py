@@ -0,0 +1,55 @@
+import time
+from threading import Event, Thread
+
+import pytest
+
+from python.utils.single_flight import SingleFlight
+
+
+def test_coalesces_concurrent_calls():
+    flights: SingleFlight[str, int] = SingleFlight()
+    started, release = Event(), Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return 42
+
+    results = []
+    leader = Thread(target=lambda: results.append(flights.do("key", slow_call)))
+    leader.start()
+    started.wait()
+
+    followers = [Thread(target=lambda: results.append(flights.do("key", slow_call))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+
+    # give the followers time to start waiting on the call in flight
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert results == [42] * 4
+    assert len(calls) == 1
+
+
+def test_does_not_cache_results():
+    flights: SingleFlight[str, int] = SingleFlight()
+
+    assert flights.do("key", lambda: 1) == 1
+    assert flights.do("key", lambda: 2) == 2
+
+
+def test_propagates_exceptions():
+    flights: SingleFlight[str, int] = SingleFlight()
+
+    def failing_call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flights.do("key", failing_call)
+
+    assert not flights.in_flight
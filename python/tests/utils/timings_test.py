@@ -0,0 +1,36 @@
+from python.utils import timings
+from python.utils.timings import timed
+
+
+@timed("embedding")
+def embed():
+    pass
+
+
+def test_collects_nested_stages():
+    with timings.collect() as collected:
+        with timed("ranking"):
+            embed()
+
+        with timed("prompt"):
+            with timed("token_counting"):
+                pass
+            with timed("token_counting"):
+                pass
+
+    assert set(collected) == {"ranking", "ranking/embedding", "prompt", "prompt/token_counting"}
+    assert collected["ranking"] >= collected["ranking/embedding"]
+
+
+def test_does_nothing_outside_of_collect():
+    with timings.collect() as collected:
+        pass
+
+    with timed("ranking"):
+        embed()
+
+    assert not collected
+
+
+def test_rounded():
+    assert timings.rounded({"ranking": 0.12345}) == {"ranking": 0.123}
@@ -1,16 +1,28 @@
 import collections
+import functools
 import math
 
 import tiktoken
 
 
+@functools.cache
+def gpt2_encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding("gpt2")
+
+
 def token_entropy(text: str):
-    enc = tiktoken.get_encoding("gpt2")
-    encoded = enc.encode(text)
+    encoded = gpt2_encoding().encode(text)
 
     return len(text) / float(len(encoded))
 
 
+def token_entropies(texts: list[str]) -> list[float]:
+    # encode_batch tokenizes on a thread pool, strings must not be empty
+    encoded = gpt2_encoding().encode_batch(texts)
+
+    return [len(text) / float(len(tokens)) for text, tokens in zip(texts, encoded)]
+
+
 # TODO what is shannon entropy? This isn't being used anywhere?
 def estimate_shannon_entropy(dna_sequence):
     m = len(dna_sequence)
@@ -0,0 +1,26 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def _temporary_path(path: str) -> str:
+    # keep the extension so libraries that append one (np.save) write to exactly this path
+    root, extension = os.path.splitext(path)
+    return f"{root}.tmp{extension}"
+
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[str]:
+    """
+    Yields a temporary path to write to, which is renamed over `path` once the block completes. Readers will either
+    see the old file or the new one, never a partially written file.
+    """
+
+    temporary_path = _temporary_path(path)
+
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
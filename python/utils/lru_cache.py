@@ -0,0 +1,66 @@
+# A small in-process LRU cache, bounded by both the number of entries and their total size in bytes.
+import typing as t
+from collections import OrderedDict
+from threading import Lock
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+
+class BoundedLRUCache(t.Generic[K, V]):
+    def __init__(self, max_entries: int, max_bytes: int, sizeof: t.Callable[[V], int]):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self.entries: OrderedDict[K, V] = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        # the web server handles requests on multiple threads
+        self.lock = Lock()
+
+    def get(self, key: K) -> V | None:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+            return self.entries[key]
+
+    def put(self, key: K, value: V):
+        size = self.sizeof(value)
+
+        # a single value larger than the cache would just evict everything else
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizeof(self.entries.pop(key))
+
+            self.entries[key] = value
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizeof(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
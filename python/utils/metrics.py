@@ -0,0 +1,252 @@
+# A small in-process metrics registry, exposed in the Prometheus text format on the server's `/metrics`. Metrics are
+# created once at import time with `counter(...)`/`gauge(...)`/`histogram(...)` and updated from anywhere in the
+# process, every update is a dict lookup and an addition under a lock.
+#
+# NOTE the registry is per process, which is all we need while the server runs as a single (threaded) waitress process
+
+import bisect
+import math
+import threading
+import typing as t
+
+# seconds, from a cached lookup to a slow completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series: dict[tuple[str, ...], t.Any] = {}
+        self.lock = threading.Lock()
+
+        # a metric without labels has exactly one series, report it before anything is recorded
+        if not labels:
+            self.series[()] = self._new_series()
+
+    def _new_series(self) -> t.Any:
+        return 0.0
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self) -> t.Iterator[tuple[str, dict[str, str], float]]:
+        """
+        (sample name, labels, value) of every series, in the order they are exposed
+        """
+
+        with self.lock:
+            series = dict(self.series)
+
+        for key, value in sorted(series.items()):
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("counters can only go up")
+
+        key = self._key(labels)
+
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self.lock:
+            return self.series.get(self._key(labels), 0.0)
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.lock:
+            self.series[self._key(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        with self.lock:
+            return self.series.get(self._key(labels), 0.0)
+
+
+class HistogramSeries:
+    def __init__(self, bucket_count: int):
+        # observations per bucket (not cumulative), the last one counts everything above the largest bucket
+        self.bucket_counts = [0] * (bucket_count + 1)
+        self.sum = 0.0
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_series(self) -> HistogramSeries:
+        return HistogramSeries(len(self.buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            if (series := self.series.get(key)) is None:
+                series = self.series[key] = self._new_series()
+
+            series.bucket_counts[bucket] += 1
+            series.sum += value
+
+    def snapshot(self) -> dict[tuple[str, ...], tuple[list[int], int, float]]:
+        """
+        Cumulative bucket counts, count and sum of every series, by label values
+        """
+
+        with self.lock:
+            series = {key: (list(s.bucket_counts), s.sum) for key, s in self.series.items()}
+
+        snapshot = {}
+        for key, (bucket_counts, total) in series.items():
+            cumulative = []
+            running = 0
+            for count in bucket_counts[:-1]:
+                running += count
+                cumulative.append(running)
+
+            snapshot[key] = (cumulative, sum(bucket_counts), total)
+
+        return snapshot
+
+    def samples(self) -> t.Iterator[tuple[str, dict[str, str], float]]:
+        for key, (cumulative, count, total) in sorted(self.snapshot().items()):
+            labels = dict(zip(self.labels, key))
+
+            for upper_bound, bucket_count in zip(self.buckets, cumulative):
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(upper_bound)}, bucket_count
+
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+REGISTRY: dict[str, Metric] = {}
+REGISTRY_LOCK = threading.Lock()
+
+MetricT = t.TypeVar("MetricT", bound=Metric)
+
+
+def _register(metric_class: type[MetricT], name: str, documentation: str, **kwargs) -> MetricT:
+    with REGISTRY_LOCK:
+        if name not in REGISTRY:
+            REGISTRY[name] = metric_class(name, documentation, **kwargs)
+
+        metric = REGISTRY[name]
+
+    if not isinstance(metric, metric_class):
+        raise ValueError(f"metric {name} is already registered as a {metric.type_name}")
+
+    return metric
+
+
+def counter(name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+    return _register(Counter, name, documentation, labels=labels)
+
+
+def gauge(name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+    return _register(Gauge, name, documentation, labels=labels)
+
+
+def histogram(name: str, documentation: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, documentation, labels=labels, buckets=buckets)
+
+
+def render(registry: dict[str, Metric] | None = None) -> str:
+    """
+    Every metric in the Prometheus text exposition format
+    """
+
+    if registry is None:
+        with REGISTRY_LOCK:
+            registry = dict(REGISTRY)
+
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append(f"# HELP {name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {name} {metric.type_name}")
+
+        for sample_name, labels, value in metric.samples():
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _escape(text: str, quotes=False) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{label}="{_escape(value, quotes=True)}"' for label, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+# how long each stage of answering a question took, see python/utils/timings.py
+QUESTION_STAGE_SECONDS = histogram(
+    "question_stage_seconds", "Time spent in each stage of a /question request", labels=("stage",)
+)
+
+# requests handled by the server, by route template (not the raw path, to keep the number of series bounded)
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests handled", labels=("method", "route", "status"))
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response, streamed response bodies are not included",
+    labels=("method", "route", "status"),
+)
+
+# only queries which are allowed to use the cache are counted, the hit ratio is hits / (hits + misses)
+QUERY_CACHE_REQUESTS = counter("query_cache_requests_total", "Redis query cache lookups", labels=("result",))
+SNOWFLAKE_QUERY_SECONDS = histogram(
+    "snowflake_query_duration_seconds",
+    "Time to run a query on Snowflake and fetch its results",
+    labels=("status",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+# `memory` (in-process LRU) and `database` hits, or a `miss` which needs an embedding request
+EMBEDDING_CACHE_REQUESTS = counter("embedding_cache_requests_total", "Embedding cache lookups", labels=("result",))
+
+RATE_LIMITER_WAITING = gauge(
+    "rate_limiter_waiting_requests", "Requests waiting on the rate limiter, for the lock or for the token window"
+)
+RATE_LIMITER_WAIT_SECONDS = histogram(
+    "rate_limiter_wait_seconds", "Time a request waited on the rate limiter before it could be sent"
+)
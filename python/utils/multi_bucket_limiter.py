@@ -8,7 +8,10 @@ from contextlib import contextmanager
 from threading import Lock
 from typing import Dict
 
+from python.utils import progress
 from python.utils.logging import log
+from python.utils.metrics import RATE_LIMITER_WAIT_SECONDS, RATE_LIMITER_WAITING
+from python.utils.timings import timed
 
 
 class MultiBucketLimiter:
@@ -56,30 +59,45 @@ class MultiBucketLimiter:
         # Uses a Lock (mutex) to enfoce a synchronus api
         #
         # returns the number of seconds until we can make the next request
-        with self.lock:
-            if consume_resources:
-                self.consume_resources(request_resources)
-
-            self.clear_leaked()
-
-            # How many seconds until resources_count goes below max_resources_per_minute
-            seconds_until_next_request = 0.0
-            for resource in self.resources:
-                remaining_time = (
-                    max(0.0, (float(self.resources_count[resource]) - self.max_resources_per_minute[resource]))
-                    / self.max_resources_per_minute[resource]
-                ) * 60.0
-
-                # Take the max on the remaining seconds until the next request
-                seconds_until_next_request = max(seconds_until_next_request, remaining_time)
-
-            # Sleep until the next token is available
-            if seconds_until_next_request > 0:
-                log.warn("waiting for token window", seconds=seconds_until_next_request)
-                time.sleep(seconds_until_next_request)
-
-            # Yield to the block, giving it a chance to consume the resouces
-            # while locked in the mutex (by calling consume_resources)
-            yield
+        # waiting for the lock (held by another request until its block completes) counts as queued
+        RATE_LIMITER_WAITING.inc()
+        wait_start = time.perf_counter()
+        waiting = True
+
+        try:
+            with self.lock:
+                if consume_resources:
+                    self.consume_resources(request_resources)
+
+                self.clear_leaked()
+
+                # How many seconds until resources_count goes below max_resources_per_minute
+                seconds_until_next_request = 0.0
+                for resource in self.resources:
+                    remaining_time = (
+                        max(0.0, (float(self.resources_count[resource]) - self.max_resources_per_minute[resource]))
+                        / self.max_resources_per_minute[resource]
+                    ) * 60.0
+
+                    # Take the max on the remaining seconds until the next request
+                    seconds_until_next_request = max(seconds_until_next_request, remaining_time)
+
+                # Sleep until the next token is available
+                if seconds_until_next_request > 0:
+                    log.warn("waiting for token window", seconds=seconds_until_next_request)
+                    progress.add_time("rate_limit_wait", seconds_until_next_request)
+                    with timed("rate_limit_wait"):
+                        time.sleep(seconds_until_next_request)
+
+                waiting = False
+                RATE_LIMITER_WAITING.dec()
+                RATE_LIMITER_WAIT_SECONDS.observe(time.perf_counter() - wait_start)
+
+                # Yield to the block, giving it a chance to consume the resouces
+                # while locked in the mutex (by calling consume_resources)
+                yield
+        finally:
+            if waiting:
+                RATE_LIMITER_WAITING.dec()
 
         return seconds_until_next_request
@@ -18,8 +18,10 @@ import openai.error
 from decouple import config
 from openai.error import OpenAIError
 
+from python.utils import progress
 from python.utils.batteries import log_execution_time
 from python.utils.logging import log
+from python.utils.timings import timed
 from python.utils.tokens import count_tokens
 
 from .multi_bucket_limiter import MultiBucketLimiter
@@ -155,7 +157,8 @@ class OpenAIThrottled:
 
         with self._safe_api_request(_base_consumption_request() | {"codex_tokens": token_count}):
             # TODO should make this more generic and avoid tying to completion directly
-            result = completion_call(**kwargs)
+            with timed("openai_completion"):
+                result = completion_call(**kwargs)
 
         result = t.cast(OpenAICompletionResponse, result)
 
@@ -171,21 +174,34 @@ class OpenAIThrottled:
         return result
 
     def embed(self, **kwargs):
-        token_count = count_tokens(kwargs["input"])
+        # `input` can be a single string or a list of strings to embed in one request, in which case an array with
+        # one row per input is returned
+        inputs = kwargs["input"]
+        is_batch = isinstance(inputs, list)
+
+        # the whole batch is charged against the limiter as a single request
+        token_count = sum(count_tokens(content) for content in inputs) if is_batch else count_tokens(inputs)
         embedding_call = _backoff_decorator(openai.Embedding.create)
 
         with self._safe_api_request(_base_consumption_request() | {"embed_tokens": token_count}):
-            result = embedding_call(**kwargs)
+            with timed("openai_embedding"):
+                result = embedding_call(**kwargs)
 
         result = t.cast(OpenAIEmbeddingResponse, result)
 
         total_tokens = result["usage"]["total_tokens"]
         self.limiter.consume_resources(_base_consumption_request() | {"embed_tokens": total_tokens})
+        progress.increment("embedding_tokens", total_tokens)
 
-        embedding_list = result["data"]
-        assert len(embedding_list) == 1, "expected exactly one embedding"
+        # the api docs don't promise the order of the response, `index` points back to the input
+        embedding_list = sorted(result["data"], key=lambda embedding_data: embedding_data["index"])
 
         # TODO this sort of logic should be handled up the stack
+        if is_batch:
+            assert len(embedding_list) == len(inputs), "expected an embedding for each input"
+            return np.array([embedding_data["embedding"] for embedding_data in embedding_list], dtype=np.float32)
+
+        assert len(embedding_list) == 1, "expected exactly one embedding"
         emb = np.array(embedding_list[0]["embedding"], dtype=np.float32)
 
         return emb
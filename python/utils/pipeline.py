@@ -0,0 +1,99 @@
+# A producer/consumer pipeline: every stage has its own long-lived worker threads and a bounded input queue, the
+# result of a stage is handed to the next one. Stages run at their own concurrency, so a slow stage only holds up the
+# stages before it once its queue is full (backpressure) instead of the whole pipeline sharing one pool.
+import queue
+import threading
+import typing as t
+
+# tells a worker to exit, one is queued per worker
+_DONE = object()
+
+
+class Stage(t.NamedTuple):
+    name: str
+    # returns the item for the next stage, or None to drop it
+    handler: t.Callable[[t.Any], t.Any]
+    concurrency: int = 1
+    queue_size: int = 8
+
+
+class Pipeline:
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self.queues: list[queue.Queue] = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+
+        # the first failure, the pipeline drains without doing any more work once a stage fails
+        self.error: BaseException | None = None
+        self.error_lock = threading.Lock()
+        self.finished = False
+
+        self.workers = [
+            [
+                threading.Thread(target=self._work, args=(position,), name=f"{stage.name}-{idx}", daemon=True)
+                for idx in range(stage.concurrency)
+            ]
+            for position, stage in enumerate(stages)
+        ]
+
+        for stage_workers in self.workers:
+            for worker in stage_workers:
+                worker.start()
+
+    def submit(self, item: t.Any) -> None:
+        """
+        Hand an item to the first stage, blocks while its queue is full. Raises the error of a failed stage.
+        """
+
+        if self.finished:
+            raise RuntimeError("pipeline already finished")
+
+        self._raise_error()
+        self.queues[0].put(item)
+
+    def finish(self) -> None:
+        """
+        Wait for every submitted item to make it through all of the stages and stop the workers. Raises the error of
+        a failed stage.
+        """
+
+        if not self.finished:
+            self.finished = True
+
+            # stages are shut down in order, so every item an upstream stage produces is picked up downstream
+            for stage_queue, stage_workers in zip(self.queues, self.workers):
+                for _ in stage_workers:
+                    stage_queue.put(_DONE)
+
+                for worker in stage_workers:
+                    worker.join()
+
+        self._raise_error()
+
+    def _work(self, position: int) -> None:
+        stage = self.stages[position]
+        stage_queue = self.queues[position]
+        next_queue = self.queues[position + 1] if position + 1 < len(self.queues) else None
+
+        while True:
+            item = stage_queue.get()
+
+            if item is _DONE:
+                return
+
+            if self.error is not None:
+                continue
+
+            try:
+                result = stage.handler(item)
+            except BaseException as e:  # pylint: disable=broad-except
+                with self.error_lock:
+                    if self.error is None:
+                        self.error = e
+                continue
+
+            if result is not None and next_queue is not None:
+                next_queue.put(result)
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,175 @@
+# Counters and timers for long running jobs, like a data source import. Code anywhere in the stack (query runner,
+# embedding requests, rate limiter) reports into the job being tracked through the module level `increment`/`timer`,
+# which do nothing when no job is tracked (e.g. in the web server).
+#
+# Timers add up the time spent across all threads, so a stage with four busy workers accumulates four seconds per
+# second of wall time.
+
+import json
+import os
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Progress:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.counters: dict[str, float] = defaultdict(int)
+        self.timers: dict[str, float] = defaultdict(float)
+        self.totals: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.timers[name] += seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def set_total(self, name: str, total: int) -> None:
+        """
+        How many `name`s the job is going to process, for the completion and ETA of that counter
+        """
+
+        with self.lock:
+            self.totals[name] = total
+
+    def elapsed_seconds(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def eta_seconds(self, name: str) -> float | None:
+        """
+        Remaining time, extrapolated from the rate `name` has been completed at so far
+        """
+
+        with self.lock:
+            done = self.counters.get(name, 0)
+            total = self.totals.get(name)
+
+        if not done or total is None:
+            return None
+
+        return self.elapsed_seconds() / done * max(total - done, 0)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: round(seconds, 3) for name, seconds in self.timers.items()}
+            totals = dict(self.totals)
+
+        elapsed_seconds = self.elapsed_seconds()
+
+        return {
+            "elapsed_seconds": round(elapsed_seconds, 3),
+            "counters": counters,
+            "totals": totals,
+            "rates_per_second": {name: round(count / elapsed_seconds, 3) for name, count in counters.items()},
+            "timers_seconds": timers,
+            "eta_seconds": {name: self.eta_seconds(name) for name in totals},
+        }
+
+    def summary_line(self, name: str) -> str:
+        """
+        A one line, human readable report of the progress of `name`
+        """
+
+        with self.lock:
+            done = self.counters.get(name, 0)
+            total = self.totals.get(name)
+            counters = {key: value for key, value in self.counters.items() if key != name}
+
+        eta = self.eta_seconds(name)
+
+        parts = [f"{name} {done}/{total if total is not None else '?'}"]
+        parts += [f"{key} {value:g}" for key, value in sorted(counters.items())]
+        parts.append(f"elapsed {format_duration(self.elapsed_seconds())}")
+        parts.append(f"eta {format_duration(eta) if eta is not None else '?'}")
+
+        return ", ".join(parts)
+
+    def write_summary(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+# the job being tracked in this process, if any
+_TRACKED: Progress | None = None
+
+
+@contextmanager
+def track(progress: Progress):
+    """
+    Report everything counted or timed in this process (from any thread) to `progress` until the block exits
+    """
+
+    global _TRACKED  # pylint: disable=global-statement
+
+    previous, _TRACKED = _TRACKED, progress
+    try:
+        yield progress
+    finally:
+        _TRACKED = previous
+
+
+def increment(name: str, amount: float = 1) -> None:
+    if (progress := _TRACKED) is not None:
+        progress.increment(name, amount)
+
+
+def add_time(name: str, seconds: float) -> None:
+    if (progress := _TRACKED) is not None:
+        progress.add_time(name, seconds)
+
+
+@contextmanager
+def timer(name: str):
+    if (progress := _TRACKED) is None:
+        yield
+        return
+
+    with progress.timer(name):
+        yield
+
+
+@contextmanager
+def report_periodically(progress: Progress, emit: t.Callable[[Progress], None], interval_seconds: float):
+    """
+    Call `emit` with the progress every `interval_seconds` from a background thread, and once more when the block exits
+    """
+
+    stopped = threading.Event()
+
+    def report():
+        while not stopped.wait(interval_seconds):
+            emit(progress)
+
+    reporter = threading.Thread(target=report, name="progress-reporter", daemon=True)
+    reporter.start()
+
+    try:
+        yield progress
+    finally:
+        stopped.set()
+        reporter.join()
+        emit(progress)
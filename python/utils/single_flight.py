@@ -0,0 +1,37 @@
+# Coalesces concurrent calls for the same key: the first caller runs the function, everyone who asks for the same key
+# while it is running waits for that call and gets its result (or its exception) instead of running it again.
+import typing as t
+from concurrent.futures import Future
+from threading import Lock
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+
+class SingleFlight(t.Generic[K, V]):
+    def __init__(self):
+        self.in_flight: dict[K, Future[V]] = {}
+        self.lock = Lock()
+
+    def do(self, key: K, function: t.Callable[[], V]) -> V:
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_leader = future is None
+
+            if future is None:
+                future = self.in_flight[key] = Future()
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = function()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # later callers start a new call, the result is not cached here
+            with self.lock:
+                del self.in_flight[key]
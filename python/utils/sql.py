@@ -6,3 +6,8 @@ def normalize_fqn_quoting(fqn: str) -> str:
     names = fqn.split(".")
     names[-1] = f'"{names[-1]}"'
     return ".".join(names)
+
+
+def quote_identifier(name: str) -> str:
+    # quoted identifiers are case sensitive and can contain anything, embedded quotes are doubled
+    return '"' + name.replace('"', '""') + '"'
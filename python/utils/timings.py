@@ -0,0 +1,69 @@
+# Request scoped timings: how long each stage of answering a question took (embedding, ranking, prompt generation,
+# completion, ...). The timings live in a context variable, so the code being timed doesn't need to pass anything
+# around, and `timed` does nothing outside of `collect`.
+#
+# Stages nest: a stage timed inside another one is recorded as `outer/inner` (e.g. `ranking/embedding`). A stage
+# which runs more than once in a request (e.g. token counting) accumulates.
+#
+# NOTE context variables are not copied into thread pools, work handed off to another thread is only included in the
+#      stage which is waiting on it
+
+import typing as t
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+# seconds by stage path, for the request being handled
+_TIMINGS: ContextVar[dict[str, float] | None] = ContextVar("timings", default=None)
+# path of the stage currently running
+_STAGE: ContextVar[str | None] = ContextVar("stage", default=None)
+
+
+@contextmanager
+def collect() -> t.Iterator[dict[str, float]]:
+    """
+    Record the timings of every stage which runs in the block, the yielded dict is filled in as they complete
+    """
+
+    timings: dict[str, float] = {}
+
+    timings_token = _TIMINGS.set(timings)
+    stage_token = _STAGE.set(None)
+
+    try:
+        yield timings
+    finally:
+        _STAGE.reset(stage_token)
+        _TIMINGS.reset(timings_token)
+
+
+@contextmanager
+def timed(stage: str) -> t.Iterator[None]:
+    """
+    Time a stage of the current request, can also be used as a decorator
+    """
+
+    timings = _TIMINGS.get()
+
+    if timings is None:
+        yield
+        return
+
+    parent = _STAGE.get()
+    path = f"{parent}/{stage}" if parent else stage
+
+    stage_token = _STAGE.set(path)
+    start = perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        _STAGE.reset(stage_token)
+
+        timings[path] = timings.get(path, 0.0) + elapsed
+
+
+def rounded(timings: dict[str, float]) -> dict[str, float]:
+    # milliseconds are plenty for a response
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
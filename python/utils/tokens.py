@@ -1,6 +1,7 @@
 import tiktoken
 
 from python.utils.openai import openai_engine
+from python.utils.timings import timed
 
 engine = openai_engine()
 
@@ -8,5 +9,6 @@ engine = openai_engine()
 token_encoder = tiktoken.encoding_for_model(engine)
 
 
+@timed("token_counting")
 def count_tokens(text: str) -> int:
     return len(token_encoder.encode(text))